@@ -0,0 +1,172 @@
+"""Benchmark mdocfile.read and mdocfile.write on a synthetic 10k-section mdoc.
+
+Compares against the previous, exception-driven parser and checks that both
+return the same dictionary. Also times cached reads and the lazy parsing used
+by preprocess.
+
+Run with: python benchmarks/bench_mdocfile.py [--sections N] [--repeat N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from tomotools.utils import mdocfile
+
+
+def _legacy_convert_value_field(field: str):
+    if " " in field:
+        fields_split = [_legacy_convert_value_field(f) for f in field.split()]
+        if all(isinstance(v, int) or isinstance(v, float) for v in fields_split):
+            return fields_split
+        else:
+            return field
+    else:
+        try:
+            return int(field)
+        except ValueError:
+            pass
+        try:
+            return float(field)
+        except ValueError:
+            pass
+        return field
+
+
+def _legacy_read(file: Path):
+    mdoc = {"path": file, "titles": [], "sections": [], "framesets": []}
+    current_section = mdoc
+    with open(file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[T ="):
+                mdoc["titles"].append(line[4:-1])
+            elif line.startswith("[ZValue ="):
+                current_section = {}
+                mdoc["sections"].append(current_section)
+            elif line.startswith("[FrameSet ="):
+                current_section = {}
+                mdoc["framesets"].append(current_section)
+            elif len(line) == 0:
+                continue
+            else:
+                key, value = line.split(" = ", maxsplit=1)
+                current_section[key] = _legacy_convert_value_field(value)
+    return mdoc
+
+
+def synthetic_mdoc(n_sections: int) -> dict:
+    """Create an mdoc dict resembling a SerialEM tilt series mdoc."""
+    sections = []
+    for i in range(n_sections):
+        tilt = -60 + (i % 41) * 3
+        sections.append(
+            {
+                "TiltAngle": float(tilt),
+                "StagePosition": [123.456, -78.9],
+                "StageZ": -12.34,
+                "Magnification": 42000,
+                "Intensity": 0.123456,
+                "ExposureDose": 3.5,
+                "DoseRate": 8.123,
+                "PixelSpacing": 2.14,
+                "SpotSize": 7,
+                "Defocus": -3.21,
+                "ImageShift": [0.012, -0.034],
+                "RotationAngle": -84.7,
+                "ExposureTime": 1.2,
+                "Binning": 1,
+                "CameraIndex": 1,
+                "DividedBy2": 0,
+                "OperatingMode": 1,
+                "UsingCDS": 0,
+                "MagIndex": 31,
+                "LowDoseConSet": -5,
+                "CountsPerElectron": 32,
+                "TargetDefocus": -4,
+                "DateTime": "08-Feb-2024  13:11:07",
+                "NavigatorLabel": f"{i // 41 + 1}",
+                "FilterSlitAndLoss": [20, 0],
+                "ChannelName": "Camera Setup",
+                "MultishotHoleAndPosition": [0, 0],
+                "CameraLength": 0,
+                "SubFramePath": (
+                    f"X:\\data\\frames\\TS_{i // 41:03d}_{i:05d}_{tilt}.0.tif"
+                ),
+                "NumSubFrames": 10,
+                "FrameDosesAndNumber": [0.35, 10],
+                "MinMaxMean": [-123, 4567, 89.1234],
+            }
+        )
+    return {
+        "PixelSpacing": 2.14,
+        "ImageFile": "TS_001.mrc",
+        "ImageSize": [5760, 4092],
+        "DataMode": 1,
+        "titles": [
+            "SerialEM: Digitized on EMBL Krios                 08-Feb-24  13:01:44",
+            "Tilt axis angle = -84.7, binning = 1  spot = 7  camera = 1",
+        ],
+        "sections": sections,
+        "framesets": [],
+    }
+
+
+def _read_uncached(file: Path):
+    mdocfile.clear_cache()
+    return mdocfile.read(file)
+
+
+def _lazy_skip_check(file: Path):
+    """What preprocess parses to decide whether to skip an mdoc."""
+    lazy = mdocfile.LazyMdoc(file)
+    return lazy.get("Montage", 0) == 1 or lazy.n_sections < 3 or lazy.tilt_angles()
+
+
+def _best_of(repeat: int, function, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    mdoc = synthetic_mdoc(args.sections)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file = Path(tmp_dir) / "synthetic.mrc.mdoc"
+
+        write_time = _best_of(args.repeat, mdocfile.write, mdoc, file)
+        # Files modified within the last seconds aren't cached, age it
+        past = time.time_ns() - 60_000_000_000
+        os.utime(file, ns=(past, past))
+        size_mb = file.stat().st_size / 1e6
+
+        if mdocfile.read(file) != _legacy_read(file):
+            raise SystemExit("mdocfile.read and the previous parser differ!")
+
+        legacy_time = _best_of(args.repeat, _legacy_read, file)
+        read_time = _best_of(args.repeat, _read_uncached, file)
+        mdocfile.read(file)
+        cached_time = _best_of(args.repeat, mdocfile.read, file)
+        lazy_time = _best_of(args.repeat, _lazy_skip_check, file)
+
+    print(f"{args.sections} sections, {size_mb:.1f} MB, best of {args.repeat}")
+    print(f"write:           {write_time * 1000:8.1f} ms")
+    print(f"read (previous): {legacy_time * 1000:8.1f} ms")
+    print(f"read:            {read_time * 1000:8.1f} ms")
+    print(f"speedup:         {legacy_time / read_time:8.2f}x")
+    print(f"read (cached):   {cached_time * 1000:8.1f} ms")
+    print(f"lazy skip check: {lazy_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,11 @@ import click
 from tomotools.commands.denoising_deconvolution import (
     deconv,
 )
-from tomotools.commands.helpers import restore_frames, update
+from tomotools.commands.helpers import restore_frames, restore_views, update
 from tomotools.commands.movies import create_movie
 from tomotools.commands.preprocessing_reconstruction import (
     blend_montages,
+    check_tilts,
     fix_header_angle,
     preprocess,
     reconstruct,
@@ -40,6 +41,7 @@ def tomotools():
 tomotools.add_command(blend_montages)
 tomotools.add_command(preprocess)
 tomotools.add_command(reconstruct)
+tomotools.add_command(check_tilts)
 tomotools.add_command(deconv)
 tomotools.add_command(imod2warp)
 tomotools.add_command(imod2tomotwin)
@@ -49,4 +51,5 @@ tomotools.add_command(semnavigator)
 tomotools.add_command(create_movie)
 tomotools.add_command(fix_header_angle)
 tomotools.add_command(restore_frames)
+tomotools.add_command(restore_views)
 tomotools.add_command(update)
@@ -0,0 +1,6 @@
+"""Run tomotools with python -m tomotools, e.g. in cluster jobs."""
+
+from tomotools import tomotools
+
+if __name__ == "__main__":
+    tomotools(prog_name="tomotools")
@@ -5,7 +5,14 @@ import click
 import mrcfile
 import numpy as np
 
-from tomotools.utils import mathutil, tiltseries, tomogram
+from tomotools.utils import (
+    checkpoint,
+    claims,
+    manifest,
+    mathutil,
+    tiltseries,
+    tomogram,
+)
 
 
 @click.command()
@@ -58,77 +65,130 @@ def deconv(
     Original Script at https://github.com/dtegunov/tom_deconv/.
     """
 
+    sessions = manifest.load_sessions(input_files)
     input_tomo = tomogram.convert_input_to_Tomogram(list(input_files))
 
     ts_list = tiltseries.convert_input_to_TiltSeries(
         tomo.path.parent for tomo in input_tomo
     )
 
-    for ts_in in ts_list:
-        # Test, whether .defocus file is found
-        if not path.isfile(ts_in.path.with_suffix(".defocus")):
-            tiltseries.run_ctfplotter(ts_in, True)
-
     for tomo, ts_in in zip(input_tomo, ts_list):
-        angpix = tomo.angpix
+        # Other nodes may deconvolve the same tomograms
+        with claims.claimed(tomo.path) as claim:
+            if claim is None:
+                print(f"{tomo.path.name} is claimed elsewhere. Skipping.")
+                continue
+            try:
+                _deconv_tomogram(
+                    tomo,
+                    ts_in,
+                    claim,
+                    snrfalloff=snrfalloff,
+                    deconvstrength=deconvstrength,
+                    hpnyquist=hpnyquist,
+                    phaseshift=phaseshift,
+                    phaseflipped=phaseflipped,
+                )
+            except claims.ClaimLost as error:
+                print(f"{error} Skipping.")
+
+    manifest.save_sessions(sessions)
+
+
+def _deconv_tomogram(
+    tomo: tomogram.Tomogram,
+    ts_in: tiltseries.TiltSeries,
+    claim: claims.Claim,
+    snrfalloff: float,
+    deconvstrength: float,
+    hpnyquist: float,
+    phaseshift: int,
+    phaseflipped: bool,
+):
+    """Deconvolve tomo, unless that was done before with the same options.
 
-        with mrcfile.open(tomo.path) as mrc:
-            volume_in = mrc.data
+    Raises claims.ClaimLost instead of writing the output if another process
+    took over claim meanwhile.
+    """
+    params = dict(
+        snrfalloff=snrfalloff,
+        deconvstrength=deconvstrength,
+        hpnyquist=hpnyquist,
+        phaseshift=phaseshift,
+        phaseflipped=phaseflipped,
+    )
+    output = tomo.path.parent / f"{tomo.path.stem}_deconv.mrc"
+    checkpoints = checkpoint.open_checkpoint(tomo.path.parent)
+    checkpoints.refresh()
+    if checkpoints.done(f"{tomo.path.name}/deconv", [tomo.path], params) is not None:
+        print(f"{tomo.path.name} was already deconvolved. Skipping.")
+        return
+    tomo_stamp = checkpoint.stamp([tomo.path])
+
+    # Test, whether .defocus file is found
+    if not path.isfile(ts_in.path.with_suffix(".defocus")):
+        tiltseries.run_ctfplotter(ts_in, True)
+
+    angpix = tomo.angpix
 
-        defocus = tiltseries.parse_ctfplotter(ts_in.path.with_suffix(".defocus"))
+    with mrcfile.open(tomo.path) as mrc:
+        volume_in = mrc.data
 
-        middle_defocus = (
-            float(defocus.iloc[round(len(defocus.index) / 2)].df_1_nm.strip()) / 1000
-        )
+    defocus = tiltseries.parse_ctfplotter(ts_in.path.with_suffix(".defocus"))
+
+    middle_defocus = (
+        float(defocus.iloc[round(len(defocus.index) / 2)].df_1_nm.strip()) / 1000
+    )
+
+    wiener = mathutil.wiener(
+        angpix,
+        float(middle_defocus),
+        float(snrfalloff),
+        float(deconvstrength),
+        float(hpnyquist),
+        phaseflipped,
+        int(phaseshift),
+    )
 
-        wiener = mathutil.wiener(
-            angpix,
-            float(middle_defocus),
-            float(snrfalloff),
-            float(deconvstrength),
-            float(hpnyquist),
-            phaseflipped,
-            int(phaseshift),
-        )
+    # In mcrfile convention, the array is ordered zyx!
+    sx = int(-1 * np.floor(volume_in.shape[2] / 2))
+    fx = sx + volume_in.shape[2] - 1
 
-        # In mcrfile convention, the array is ordered zyx!
-        sx = int(-1 * np.floor(volume_in.shape[2] / 2))
-        fx = sx + volume_in.shape[2] - 1
+    sy = int(-1 * np.floor(volume_in.shape[1] / 2))
+    fy = sy + volume_in.shape[1] - 1
 
-        sy = int(-1 * np.floor(volume_in.shape[1] / 2))
-        fy = sy + volume_in.shape[1] - 1
+    sz = int(-1 * np.floor(volume_in.shape[0] / 2))
+    fz = sz + volume_in.shape[0] - 1
 
-        sz = int(-1 * np.floor(volume_in.shape[0] / 2))
-        fz = sz + volume_in.shape[0] - 1
+    gridz, gridy, gridx = np.mgrid[sz : fz + 1, sy : fy + 1, sx : fx + 1]
 
-        gridz, gridy, gridx = np.mgrid[sz : fz + 1, sy : fy + 1, sx : fx + 1]
+    gridx = np.divide(gridx, np.abs(sx))
+    gridy = np.divide(gridy, np.abs(sy))
+    gridz = np.divide(gridz, np.maximum(1, np.abs(sz)))
 
-        gridx = np.divide(gridx, np.abs(sx))
-        gridy = np.divide(gridy, np.abs(sy))
-        gridz = np.divide(gridz, np.maximum(1, np.abs(sz)))
+    # Create input array with Euclidean distance from the center as cell value
+    r = np.sqrt(np.square(gridx) + np.square(gridy) + np.square(gridz))
 
-        # Create input array with Euclidean distance from the center as cell value
-        r = np.sqrt(np.square(gridx) + np.square(gridy) + np.square(gridz))
+    del (gridx, gridy, gridz, sx, sy, sz, fx, fy, fz)
 
-        del (gridx, gridy, gridz, sx, sy, sz, fx, fy, fz)
+    r = np.minimum(1, r)
+    r = np.fft.ifftshift(r)
 
-        r = np.minimum(1, r)
-        r = np.fft.ifftshift(r)
+    x = np.linspace(0, 1, 2048)
 
-        x = np.linspace(0, 1, 2048)
+    ramp = np.interp(r, x, wiener)
 
-        ramp = np.interp(r, x, wiener)
+    del r
 
-        del r
+    vol_deconv = np.real(np.fft.ifftn(np.fft.fftn(volume_in) * ramp))
 
-        vol_deconv = np.real(np.fft.ifftn(np.fft.fftn(volume_in) * ramp))
+    # Cast to single precision / float32 (maximum allowed by mrc standard)
+    vol_deconv = vol_deconv.astype("float32")
 
-        # Cast to single precision / float32 (maximum allowed by mrc standard)
-        vol_deconv = vol_deconv.astype("float32")
+    claim.ensure_held()
+    with mrcfile.open(output, mode="w+") as mrc:
+        mrc.set_data(vol_deconv)
+        mrc.voxel_size = str(angpix)
+        mrc.update_header_stats()
 
-        with mrcfile.open(
-            tomo.path.parent / f"{tomo.path.stem}_deconv.mrc", mode="w+"
-        ) as mrc:
-            mrc.set_data(vol_deconv)
-            mrc.voxel_size = str(angpix)
-            mrc.update_header_stats()
+    checkpoints.record(f"{tomo.path.name}/deconv", tomo_stamp, params, [output])
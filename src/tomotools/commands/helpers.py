@@ -42,6 +42,7 @@ def restore_frames(orig_mdoc_dir, input_files):
     ts_list = tiltseries.convert_input_to_TiltSeries(input_files)
 
     orig_mdoc_dir = Path(orig_mdoc_dir)
+    frame_index = mdocfile.FrameIndex(orig_mdoc_dir)
 
     # Iterate over Tiltseries
     for ts in ts_list:
@@ -86,9 +87,8 @@ def restore_frames(orig_mdoc_dir, input_files):
         # Write fixed mdoc
         if all("SubFramePath" in section for section in mdoc["sections"]):
             for section in mdoc["sections"]:
-                section["SubFramePath"] = mdocfile.find_relative_path(
-                    Path(orig_mdoc_dir),
-                    Path(section.get("SubFramePath", "").replace("\\", path.sep)),
+                section["SubFramePath"] = frame_index.resolve(
+                    Path(section.get("SubFramePath", "").replace("\\", path.sep))
                 )
 
             # Backup old mdoc
@@ -101,3 +101,31 @@ def restore_frames(orig_mdoc_dir, input_files):
             print("Leaving as-is.")
 
         print("\n")
+
+
+@click.command()
+@click.option(
+    "--record-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Directory of the restore records. [default: excluded_views next to "
+    "each tilt series]",
+)
+@click.argument("input_files", nargs=-1, type=click.Path(exists=True))
+def restore_views(record_dir, input_files):
+    """Put views excluded with reconstruct --batch-file back into the tilt series.
+
+    Stack, EVN/ODD stacks and mdoc are restored from the excluded-views stack
+    and restore record, which are removed afterwards. Alignments and
+    reconstructions of the tilt series have to be redone.
+    """
+    for ts in tiltseries.convert_input_to_TiltSeries(input_files):
+        directory = (
+            ts.path.parent / "excluded_views" if record_dir is None else record_dir
+        )
+        record = Path(directory) / f"{ts.path.stem}_excluded.json"
+        if not record.is_file():
+            print(f"{ts.path.name}: no restore record at {record}. Skipping.")
+            continue
+        tiltseries.restore_views(ts, record)
+        print(f"{ts.path.name}: restored the excluded views.")
@@ -1,8 +1,9 @@
 from pathlib import Path
-import subprocess
 
 import click
 
+from tomotools.utils import jobs
+
 
 @click.command()
 @click.option("-f", "--framerate", type=int, default=24)
@@ -41,14 +42,14 @@ def create_movie(
         "yuv420p",
         output_file_tmp if palindromic else output_file,
     ]
-    subprocess.run(cmd)
+    jobs.run(cmd)
     if palindromic:
         with open(videofiles_tmp, "w") as f:
             f.write(f"file {output_file_tmp}\nfile {output_file_rev}\n")
-        subprocess.run(
+        jobs.run(
             ["ffmpeg", "-i", output_file_tmp, "-vf", "reverse", "-y", output_file_rev]
         )
-        subprocess.run(
+        jobs.run(
             [
                 "ffmpeg",
                 "-f",
@@ -1,15 +1,38 @@
 import os
 import shutil
 import subprocess
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import path
-from os.path import join
 from pathlib import Path
+from typing import NamedTuple
 
 import click
 import mrcfile
 
-from tomotools.utils import mdocfile
-from tomotools.utils.micrograph import Micrograph, sem2mc2
+from tomotools.utils import (
+    acquisition,
+    artifacts,
+    checkpoint,
+    claims,
+    discovery,
+    executors,
+    gpus,
+    jobs,
+    manifest,
+    mdocfile,
+    mrcheader,
+    scratch,
+    stages,
+    tilt_qc,
+)
+from tomotools.utils.micrograph import (
+    Micrograph,
+    convert_gainref,
+    find_gainref,
+    sem2mc2,
+)
 from tomotools.utils.movie import Movie
 from tomotools.utils.tiltseries import (
     TiltSeries,
@@ -18,6 +41,9 @@ from tomotools.utils.tiltseries import (
     bin_tiltseries,
     convert_input_to_TiltSeries,
     dose_filter,
+    exclude_views,
+    format_view_ranges,
+    parse_view_ranges,
 )
 from tomotools.utils.tomogram import Tomogram
 
@@ -50,7 +76,7 @@ def blend_montages(cpus: int, input_files: tuple[Path], output_dir: Path):
         os.symlink(input_file.absolute(), output_dir / input_file.name)
 
     os.chdir(output_dir)
-    subprocess.run(
+    jobs.run(
         ["justblend", "--cpus", str(cpus)]
         + [input_file.name for input_file in input_files]
     )
@@ -141,6 +167,42 @@ def blend_montages(cpus: int, input_files: tuple[Path], output_dir: Path):
     default=True,
     help="Create a tilt-series stack or keep the motion-corrected frames as they are.",
 )
+@click.option(
+    "--prefetch",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Maximum number of tilt series motion-corrected ahead of the one being "
+    "stacked, including the one in progress.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    default=False,
+    help="Watch the input directories and process tilt series while they are acquired.",
+)
+@click.option(
+    "--idle-timeout",
+    type=float,
+    default=300,
+    show_default=True,
+    help="With --watch, a tilt series is complete once its mdoc didn't change "
+    "for this many seconds.",
+)
+@click.option(
+    "--watch-timeout",
+    type=float,
+    default=None,
+    help="With --watch, stop once no tilt series was acquired for this many "
+    "seconds. Default: watch until interrupted.",
+)
+@click.option(
+    "--poll-interval",
+    type=float,
+    default=5,
+    show_default=True,
+    help="With --watch, check for new files every this many seconds.",
+)
 @click.argument("input_files", nargs=-1, type=click.Path(exists=True))
 @click.argument("output_dir", type=click.Path(writable=True))
 # TODO: Fix complexity error C901
@@ -157,6 +219,11 @@ def preprocess(
     exposuredose,
     axisangle,
     stack,
+    prefetch,
+    watch,
+    idle_timeout,
+    watch_timeout,
+    poll_interval,
     input_files,
     output_dir,
 ):
@@ -164,6 +231,12 @@ def preprocess(
 
     This function runs MotionCor2 on movie frames, stacks the motion-corrected frames
     and sorts them by tilt-angle.
+    Motion correction of the next tilt series runs while the current one is
+    stacked, up to --prefetch tilt series ahead.
+
+    With --watch, the input directories are watched during acquisition. Each
+    tilt is motion-corrected as soon as its frames and mdoc section exist, and
+    the stack is created once the tilt series is complete.
 
     The input files may be individual .mrc/.st tilt-series files,
     their mdocs, or directories containing them.
@@ -172,32 +245,75 @@ def preprocess(
 
     The last argument is the output dir. It will be created if it doesn't exist.
     """
-    # Convert all directories into a list of TiltSeries objects
-    input_files = convert_input_to_TiltSeries(input_files, mdoc_ok=True)
-
     output_dir = Path(output_dir)
     if not output_dir.is_dir():
         output_dir.mkdir(parents=True)
 
+    motioncor = dict(
+        rotationandflip=rotationandflip,
+        splitsum=splitsum,
+        binning=mcbin,
+        group=group,
+        override_gainref=gainref,
+        patch=patch,
+    )
+    assembly = dict(
+        mcbin=mcbin, stack=stack, exposuredose=exposuredose, axisangle=axisangle
+    )
+
+    if watch:
+        directories = {
+            Path(input_file) if Path(input_file).is_dir() else Path(input_file).parent
+            for input_file in input_files
+        }
+        _watch_acquisition(
+            sorted(directories),
+            output_dir,
+            frames,
+            gpu,
+            motioncor,
+            assembly,
+            idle_timeout=idle_timeout,
+            interval=poll_interval,
+            stop_after=watch_timeout,
+        )
+        return
+
+    # Steps finished by an earlier run with the same options are skipped
+    checkpoints = checkpoint.open_checkpoint(output_dir)
+    params = motioncor | assembly
+
+    # Convert all directories into a list of TiltSeries objects
+    input_files = convert_input_to_TiltSeries(input_files, mdoc_ok=True)
+
+    # Frame directories are listed once, as they're shared between tilt series
+    frame_indices: dict[Path, mdocfile.FrameIndex] = {}
+
+    # Tilt series with frames are motion corrected and stacked afterwards
+    series_with_frames: list[tuple[Path, dict, list[Movie]]] = []
+
     for input_file in input_files:
+        # Only parse as much as needed to decide whether to skip the file
         try:
-            mdoc = mdocfile.read(input_file.mdoc)
+            lazy_mdoc = mdocfile.LazyMdoc(input_file.mdoc)
         except FileNotFoundError:
             print(f"No MDOC file found for {input_file.path}. \n")
             continue
-        if mdoc.get("Montage", 0) == 1:
-            print(f"Skipping {input_file.mdoc.name} because it is a montage. \n")
+        if not _looks_like_tilt_series(
+            input_file.mdoc.name,
+            lazy_mdoc.get("Montage", 0),
+            lazy_mdoc.n_sections,
+            lazy_mdoc.tilt_angles(),
+        ):
             continue
-        # Identify batch / anchoring files, using two criteria:
-        # 1. Fewer than three sections
-        # 2. abs(tilt angle) < 1 for all sections -> feels a bit hacky, but works
-        elif len(mdoc["sections"]) < 3:
-            print(f"{input_file.mdoc.name} has fewer than three sections. Skipping.")
-            continue
-        elif all(abs(section["TiltAngle"]) < 1 for section in mdoc["sections"]):
-            print(f"All angles in {input_file.mdoc.name} are near 0. Skipping.")
+
+        stack_key = f"{_stack_path(output_dir, input_file.mdoc).stem}/stack"
+        if checkpoints.done(stack_key, [input_file.mdoc], params) is not None:
+            print(f"{input_file.mdoc.name} was already processed. Skipping.")
             continue
 
+        mdoc = lazy_mdoc.read()
+
         # File is a tilt-series.
         print(f"\nWorking on {input_file.mdoc.name}, which looks like a tilt series")
 
@@ -211,13 +327,16 @@ def preprocess(
 
         # Are any SubFrames present?
         if any("SubFramePath" in section for section in mdoc["sections"]):
-            for section in mdoc["sections"]:
-                subframes_root_path = (
-                    path.dirname(input_file.mdoc) if frames is None else frames
+            subframes_root_path = Path(
+                path.dirname(input_file.mdoc) if frames is None else frames
+            )
+            if subframes_root_path not in frame_indices:
+                frame_indices[subframes_root_path] = mdocfile.FrameIndex(
+                    subframes_root_path
                 )
-                section["SubFramePath"] = mdocfile.find_relative_path(
-                    Path(subframes_root_path),
-                    Path(section.get("SubFramePath", "").replace("\\", path.sep)),
+            for section in mdoc["sections"]:
+                section["SubFramePath"] = frame_indices[subframes_root_path].resolve(
+                    Path(section.get("SubFramePath", "").replace("\\", path.sep))
                 )
 
             try:
@@ -227,132 +346,1200 @@ def preprocess(
                 ]
             except (FileNotFoundError, AttributeError):
                 # Attribute error occurs if SubFramePath is set to None
-                # This happens if mdocfile.find_relative_path fails
+                # This happens if the frame can't be found
                 print(
                     f"Movie frames not found for {input_file.mdoc.name}, use --frames."
                 )
                 continue
 
         else:
-            if reorder:
-                print(f"Running newstack -reorder on {input_file.mdoc.name}. \n")
-                subprocess.run(
-                    [
-                        "newstack",
-                        "-reorder",
-                        str(1),
-                        "-mdoc",
-                        "-in",
-                        input_file.path,
-                        "-ou",
-                        str(output_dir.joinpath(input_file.path.name)),
-                        "-quiet",
-                    ]
-                )
-                if exposuredose is not None:
-                    os.unlink(output_dir / f"{input_file.path.name}.mdoc")
-                    mdocfile.write(mdoc, output_dir / f"{input_file.path.name}.mdoc")
-
-            else:
-                print(f"Just copying {input_file.path} to {output_dir}. \n")
-                subprocess.run(["cp", input_file.path, output_dir])
-                if exposuredose is not None:
-                    mdocfile.write(mdoc, output_dir / f"{input_file.path.name}.mdoc")
+            # Another node may be working on the same tilt series
+            stack_path = _stack_path(output_dir, input_file.mdoc)
+            with claims.claimed(stack_path) as claim:
+                if claim is None:
+                    print(f"{input_file.mdoc.name} is claimed elsewhere. Skipping.")
+                    continue
+                if reorder:
+                    print(f"Running newstack -reorder on {input_file.mdoc.name}. \n")
+                    jobs.run(
+                        [
+                            "newstack",
+                            "-reorder",
+                            str(1),
+                            "-mdoc",
+                            "-in",
+                            input_file.path,
+                            "-ou",
+                            str(output_dir.joinpath(input_file.path.name)),
+                            "-quiet",
+                        ]
+                    )
+                    if exposuredose is not None:
+                        os.unlink(output_dir / f"{input_file.path.name}.mdoc")
+                        mdocfile.write(
+                            mdoc, output_dir / f"{input_file.path.name}.mdoc"
+                        )
+
                 else:
-                    subprocess.run(["cp", f"{input_file.path.name}.mdoc", output_dir])
+                    print(f"Just copying {input_file.path} to {output_dir}. \n")
+                    jobs.run(["cp", input_file.path, output_dir])
+                    if exposuredose is not None:
+                        mdocfile.write(
+                            mdoc, output_dir / f"{input_file.path.name}.mdoc"
+                        )
+                    else:
+                        jobs.run(["cp", input_file.mdoc, output_dir])
             continue
 
         print(f"Frames were found for {input_file.mdoc.name}, will run MotionCor.")
+        series_with_frames.append((input_file.mdoc, mdoc, movies))
+
+    # Other nodes may process the same session, each tilt series is claimed
+    # before its motion correction and released once it is stacked
+    series_claims: dict[Path, claims.Claim] = {}
+
+    def correct_series(
+        series: tuple[Path, dict, list[Movie]],
+    ) -> list[Micrograph] | None:
+        mdoc_file, mdoc, movies = series
+        stack_path = _stack_path(output_dir, mdoc_file)
+        claim = claims.Claim(claims.claim_file(stack_path))
+        if not claim.acquire():
+            holder = claims.describe(claim.holder())
+            print(f"{mdoc_file.name} is claimed by {holder}. Skipping.")
+            return None
+        series_claims[mdoc_file] = claim
+        checkpoints.refresh()
+        stack_key = f"{stack_path.stem}/stack"
+        if checkpoints.done(stack_key, [mdoc_file], params) is not None:
+            print(f"{mdoc_file.name} was processed elsewhere. Skipping.")
+            claim.release()
+            return None
+
+        frames_corrected_dir = _frames_corrected_dir(output_dir, mdoc_file)
+        motioncor_key = f"{frames_corrected_dir.name}/motioncor"
+        movie_paths = [movie.path for movie in movies]
+        if checkpoints.done(motioncor_key, movie_paths, motioncor) is not None:
+            print(f"Using the motion-corrected frames of {mdoc_file.name} from before.")
+            return _corrected_micrographs(
+                movies, frames_corrected_dir, motioncor["splitsum"]
+            )
 
-        # Get rotation and flip of Gain reference from mdoc file property
-        mcrot, mcflip = None, None
-        if rotationandflip is not None:
-            mcrot, mcflip = sem2mc2(rotationandflip)
-        elif "RotationAndFlip" in mdoc["sections"][0]:
-            mdoc_rotflip = mdoc["sections"][0]["RotationAndFlip"]
-            mcrot, mcflip = sem2mc2(mdoc_rotflip)
-
-        # Grab frame size to estimate appropriate patch numbers
-        # Will only be used if --patch is specified
-        patch_x, patch_y = [
-            round(mdoc["ImageSize"][0] / 800),
-            round(mdoc["ImageSize"][1] / 800),
-        ]
-
-        frames_corrected_dir = output_dir.joinpath("frames_corrected")
         if frames_corrected_dir.is_dir():
             print("Temporary motioncor2 directory already exists, will overwrite it")
             shutil.rmtree(frames_corrected_dir)
-
-        micrographs = Micrograph.from_movies(
-            movies,
-            frames_corrected_dir,
-            splitsum=splitsum,
-            binning=mcbin,
-            mcrot=mcrot,
-            mcflip=mcflip,
-            group=group,
-            override_gainref=gainref,
-            gpu=gpu,
-            patch=patch,
-            patch_x=patch_x,
-            patch_y=patch_y,
-        )
-
-        # Update pixel size and dimensions in mdoc, if mcbin != 1
-        if mcbin != 1:
-            # check the size of the MC2 output
-            with mrcfile.open(micrographs[0].path, "r") as mrc:
-                real_y, real_x = mrc.data.shape
-
-            # Calculate expected binned size
-            expected_x = int(mdoc["ImageSize"][0] / mcbin)
-            expected_y = int(mdoc["ImageSize"][1] / mcbin)
-
-            if expected_x % 2 != 0:
-                expected_x = expected_x - 1
-            if expected_y % 2 != 0:
-                expected_y = expected_y - 1
-
-            # If the expected size and the real size match, update mdoc
-            if expected_x == real_x and expected_y == real_y:
-                mdoc["ImageSize"] = [expected_x, expected_y]
-                mdoc["PixelSpacing"] = mdoc["PixelSpacing"] * mcbin
-
-                for section in mdoc["sections"]:
-                    section["PixelSpacing"] = section["PixelSpacing"] * mcbin
-
-        if stack:
-            # If the mdoc is .mrc.mdoc (SerialEM-style), use .mrc
-            if input_file.mdoc.stem.endswith(".mrc"):
-                output_file = output_dir / input_file.mdoc.stem
-
-            # Else, add the .mrc (Tomo5-style) to the output file
-            else:
-                output_file = output_dir / f"{input_file.mdoc.stem}.mrc"
-
-            tilt_series = TiltSeries.from_micrographs(
+        movies_stamp = checkpoint.stamp(movie_paths)
+        print(f"Running MotionCor on {mdoc_file.name}.")
+        micrographs = _motion_correct(
+            mdoc, movies, frames_corrected_dir, gpu, **motioncor
+        )
+        checkpoints.record(
+            motioncor_key,
+            movies_stamp,
+            motioncor,
+            [
+                file
+                for mic in micrographs
+                for file in (mic.path, mic.evn_path, mic.odd_path)
+            ],
+        )
+        return micrographs
+
+    def assemble_series(
+        series: tuple[Path, dict, list[Movie]], micrographs: list[Micrograph] | None
+    ):
+        mdoc_file, mdoc, _ = series
+        if micrographs is None:
+            return
+        claim = series_claims.pop(mdoc_file)
+        try:
+            _assemble(
+                mdoc_file,
+                mdoc,
                 micrographs,
-                output_file,
-                mdoc=mdoc,
-                reorder=True,
-                overwrite_dose=exposuredose,
+                output_dir,
+                params,
+                claim=claim,
+                **assembly,
+            )
+        except claims.ClaimLost as error:
+            print(f"{error} Skipping.")
+        claim.release()
+
+    # Motion correction of the next tilt series overlaps with stacking
+    try:
+        jobs.pipelined(series_with_frames, correct_series, assemble_series, prefetch)
+    finally:
+        for claim in series_claims.values():
+            claim.release()
+
+
+def _watch_acquisition(
+    directories: list[Path],
+    output_dir: Path,
+    frames: Path | None,
+    gpu: str | None,
+    motioncor: dict,
+    assembly: dict,
+    idle_timeout: float,
+    interval: float,
+    stop_after: float | None,
+):
+    """Motion-correct tilts as they are acquired, stack each complete series."""
+    gpu_pool = gpus.GpuPool(gpus.gpu_ids(gpu))
+    # Each GPU corrects one tilt at a time, with an even share of the CPUs
+    threads = max(1, jobs.cpu_budget() // gpu_pool.slots)
+    frame_indices: dict[Path, mdocfile.FrameIndex] = {}
+    # mdoc file -> section index -> corrected micrograph
+    corrections: dict[Path, dict[int, Future]] = {}
+    # mdoc file -> gain reference and its mrc, converted once per tilt series
+    gains: dict[Path, tuple[Path | None, Path | None]] = {}
+    gains_lock = threading.Lock()
+
+    def series_gain(mdoc_file: Path, movie: Movie) -> tuple[Path | None, Path | None]:
+        with gains_lock:
+            if mdoc_file not in gains:
+                gain_ref = motioncor["override_gainref"]
+                gain_ref = find_gainref([movie]) if gain_ref is None else Path(gain_ref)
+                gain_mrc = None
+                if gain_ref is not None:
+                    gain_dir = _frames_corrected_dir(output_dir, mdoc_file)
+                    gain_dir.mkdir(parents=True, exist_ok=True)
+                    gain_mrc = convert_gainref(gain_ref, gain_dir)
+                gains[mdoc_file] = (gain_ref, gain_mrc)
+            return gains[mdoc_file]
+
+    def correct_on_gpu(
+        mdoc_file: Path, mdoc: dict, movie: Movie, tilt_dir: Path
+    ) -> Micrograph:
+        gain_ref, gain_mrc = series_gain(mdoc_file, movie)
+        options = motioncor | dict(
+            override_gainref=gain_ref, gain_mrc=gain_mrc, threads=threads
+        )
+        with gpu_pool.acquire() as gpu_id:
+            print(f"Running MotionCor on {movie.path.name}.")
+            micrographs = _motion_correct(
+                mdoc, [movie], tilt_dir, str(gpu_id), **options
+            )
+        return micrographs[0]
+
+    def correct_tilt(mdoc_file: Path, mdoc: dict, index: int, section: dict) -> bool:
+        if mdoc.get("Montage", 0) == 1 or "SubFramePath" not in section:
+            # Nothing to correct, the tilt series is judged once complete
+            return True
+        frames_root = Path(mdoc_file.parent if frames is None else frames)
+        if frames_root not in frame_indices:
+            frame_indices[frames_root] = mdocfile.FrameIndex(frames_root)
+        frame = frame_indices[frames_root].resolve(
+            Path(str(section["SubFramePath"]).replace("\\", path.sep))
+        )
+        # The frames may still be written, so wait until they stay unchanged
+        if frame is None or discovery.is_racy(frame.stat().st_mtime_ns):
+            return False
+
+        tilt_dir = _frames_corrected_dir(output_dir, mdoc_file) / f"{index:03d}"
+        if tilt_dir.is_dir():
+            shutil.rmtree(tilt_dir)
+        corrections.setdefault(mdoc_file, {})[index] = pool.submit(
+            correct_on_gpu,
+            mdoc_file,
+            mdoc,
+            Movie(frame.absolute(), section["TiltAngle"]),
+            tilt_dir,
+        )
+        return True
+
+    def assemble(mdoc_file: Path, mdoc: dict):
+        # Failures, e.g. of MotionCor, are reported by acquisition.follow,
+        # which skips the tilt series and continues with the others
+        tilts = corrections.pop(mdoc_file, {})
+        gains.pop(mdoc_file, None)
+        frames_corrected_dir = _frames_corrected_dir(output_dir, mdoc_file)
+        micrographs = [tilts[index].result() for index in sorted(tilts)]
+        if not _looks_like_tilt_series(
+            mdoc_file.name,
+            mdoc.get("Montage", 0),
+            len(mdoc["sections"]),
+            [section["TiltAngle"] for section in mdoc["sections"]],
+        ):
+            shutil.rmtree(frames_corrected_dir, ignore_errors=True)
+        elif len(micrographs) != len(mdoc["sections"]):
+            print(f"Not all sections of {mdoc_file.name} have frames. Skipping.")
+            shutil.rmtree(frames_corrected_dir, ignore_errors=True)
+        else:
+            _assemble(
+                mdoc_file,
+                mdoc,
+                micrographs,
+                output_dir,
+                motioncor | assembly,
+                **assembly,
             )
-            shutil.rmtree(frames_corrected_dir)
 
-            if axisangle is not None:
-                tilt_series._update_axis_angle(axisangle)
+    with ThreadPoolExecutor(max_workers=gpu_pool.slots) as pool:
+        acquisition.follow(
+            directories,
+            on_section=correct_tilt,
+            on_complete=assemble,
+            idle_timeout=idle_timeout,
+            interval=interval,
+            stop_after=stop_after,
+            # Tilt series that were stacked before are done
+            skip=lambda mdoc_file: (
+                assembly["stack"] and _stack_path(output_dir, mdoc_file).exists()
+            ),
+        )
 
-            print(f"Successfully created {tilt_series.path}. \n")
 
+def _looks_like_tilt_series(
+    name: str, montage: int, n_sections: int, tilt_angles: list[float]
+) -> bool:
+    """Return whether an mdoc belongs to a tilt series, else print why not."""
+    if montage == 1:
+        print(f"Skipping {name} because it is a montage. \n")
+        return False
+    # Identify batch / anchoring files, using two criteria:
+    # 1. Fewer than three sections
+    # 2. abs(tilt angle) < 1 for all sections -> feels a bit hacky, but works
+    elif n_sections < 3:
+        print(f"{name} has fewer than three sections. Skipping.")
+        return False
+    elif all(abs(angle) < 1 for angle in tilt_angles):
+        print(f"All angles in {name} are near 0. Skipping.")
+        return False
+    return True
+
+
+def _frames_corrected_dir(output_dir: Path, mdoc_file: Path) -> Path:
+    """Return the directory for the motion-corrected frames of a tilt series.
+
+    Each tilt series has its own, as the next one is motion corrected while
+    the current one is stacked.
+    """
+    return output_dir / f"frames_corrected_{_stack_path(output_dir, mdoc_file).stem}"
+
+
+def _stack_path(output_dir: Path, mdoc_file: Path) -> Path:
+    """Return the path of the tilt series stack created from an mdoc."""
+    # If the mdoc is .mrc.mdoc (SerialEM-style), use .mrc
+    if mdoc_file.stem.endswith(".mrc"):
+        return output_dir / mdoc_file.stem
+    # Else, add the .mrc (Tomo5-style) to the output file
+    return output_dir / f"{mdoc_file.stem}.mrc"
+
+
+def _corrected_micrographs(
+    movies: list[Movie], frames_corrected_dir: Path, splitsum: bool
+) -> list[Micrograph]:
+    """Return the micrographs that MotionCor wrote for movies before."""
+    micrographs = [
+        Micrograph(
+            frames_corrected_dir / movie.path.with_suffix(".mrc").name,
+            movie.tilt_angle,
+        )
+        for movie in movies
+    ]
+    if splitsum:
+        micrographs = [mic.with_split_dir(frames_corrected_dir) for mic in micrographs]
+    return micrographs
+
+
+def _motion_correct(
+    mdoc: dict,
+    movies: list[Movie],
+    frames_corrected_dir: Path,
+    gpu: str | None,
+    rotationandflip: int | None,
+    **options,
+) -> list[Micrograph]:
+    """Run MotionCor on the movies of a tilt series, see Micrograph.from_movies."""
+    # Get rotation and flip of Gain reference from mdoc file property
+    mcrot, mcflip = None, None
+    if rotationandflip is not None:
+        mcrot, mcflip = sem2mc2(rotationandflip)
+    elif "RotationAndFlip" in mdoc["sections"][0]:
+        mdoc_rotflip = mdoc["sections"][0]["RotationAndFlip"]
+        mcrot, mcflip = sem2mc2(mdoc_rotflip)
+
+    # Grab frame size to estimate appropriate patch numbers
+    # Will only be used if --patch is specified
+    patch_x, patch_y = [
+        round(mdoc["ImageSize"][0] / 800),
+        round(mdoc["ImageSize"][1] / 800),
+    ]
+
+    return Micrograph.from_movies(
+        movies,
+        frames_corrected_dir,
+        mcrot=mcrot,
+        mcflip=mcflip,
+        gpu=gpu,
+        patch_x=patch_x,
+        patch_y=patch_y,
+        **options,
+    )
+
+
+def _assemble(
+    mdoc_file: Path,
+    mdoc: dict,
+    micrographs: list[Micrograph],
+    output_dir: Path,
+    params: dict,
+    mcbin: int,
+    stack: bool,
+    exposuredose: float | None,
+    axisangle: float | None,
+    claim: claims.Claim | None = None,
+):
+    """Stack the motion-corrected micrographs of a tilt series, or keep them.
+
+    The step is recorded in the checkpoint of output_dir under params, so
+    that it is skipped when preprocess is run again. Raises claims.ClaimLost
+    before writing outputs if another process took over claim.
+    """
+    frames_corrected_dir = _frames_corrected_dir(output_dir, mdoc_file)
+    checkpoints = checkpoint.open_checkpoint(output_dir)
+    stack_key = f"{_stack_path(output_dir, mdoc_file).stem}/stack"
+    mdoc_stamp = checkpoint.stamp([mdoc_file])
+
+    # Outputs of an earlier run with other inputs or options are replaced
+    for file in checkpoints.forget(stack_key):
+        if file != mdoc_file.absolute():
+            file.unlink(missing_ok=True)
+
+    # Update pixel size and dimensions in mdoc, if mcbin != 1
+    if mcbin != 1:
+        # check the size of the MC2 output
+        header = mrcheader.read_header(micrographs[0].path)
+        real_y, real_x = header.ny, header.nx
+
+        # Calculate expected binned size
+        expected_x = int(mdoc["ImageSize"][0] / mcbin)
+        expected_y = int(mdoc["ImageSize"][1] / mcbin)
+
+        if expected_x % 2 != 0:
+            expected_x = expected_x - 1
+        if expected_y % 2 != 0:
+            expected_y = expected_y - 1
+
+        # If the expected size and the real size match, update mdoc
+        if expected_x == real_x and expected_y == real_y:
+            mdoc["ImageSize"] = [expected_x, expected_y]
+            mdoc["PixelSpacing"] = mdoc["PixelSpacing"] * mcbin
+
+            for section in mdoc["sections"]:
+                section["PixelSpacing"] = section["PixelSpacing"] * mcbin
+
+    if claim is not None:
+        claim.ensure_held()
+    if stack:
+        tilt_series = TiltSeries.from_micrographs(
+            micrographs,
+            _stack_path(output_dir, mdoc_file),
+            mdoc=mdoc,
+            reorder=True,
+            overwrite_dose=exposuredose,
+        )
+        shutil.rmtree(frames_corrected_dir)
+
+        if axisangle is not None:
+            tilt_series._update_axis_angle(axisangle)
+
+        outputs = [
+            tilt_series.path,
+            tilt_series.mdoc,
+            tilt_series.evn_path,
+            tilt_series.odd_path,
+        ]
+        print(f"Successfully created {tilt_series.path}. \n")
+
+    else:
+        for micrograph in micrographs:
+            with mrcfile.mmap(micrograph.path, mode="r+") as mrc:
+                mrc.voxel_size = mdoc["PixelSpacing"]
+            micrograph.path.rename(output_dir.joinpath(micrograph.path.name))
+
+        shutil.rmtree(frames_corrected_dir)
+        outputs = [output_dir / micrograph.path.name for micrograph in micrographs]
+        print(f"Successfully created micrograph images in {output_dir}. \n")
+
+    if claim is not None:
+        claim.ensure_held()
+    checkpoints.record(stack_key, mdoc_stamp, params, outputs)
+
+
+def _series_files(tiltseries: TiltSeries, with_mdoc: bool = True) -> list[Path]:
+    """Return the files of a tilt series, the EVN/ODD stacks if it has them."""
+    files = [tiltseries.path]
+    if with_mdoc:
+        files.append(tiltseries.mdoc)
+    if tiltseries.is_split:
+        files += [tiltseries.evn_path, tiltseries.odd_path]
+    return files
+
+
+def _staging_files(tiltseries: TiltSeries) -> list[Path]:
+    """Return the files of a tilt series and its sidecars, e.g. .tlt and .aln."""
+    files = _series_files(tiltseries)
+    sidecars = tiltseries.path.parent.glob(f"{tiltseries.path.stem}.*")
+    return files + sorted(file for file in sidecars if file not in files)
+
+
+def _tiltseries_from_files(files: list[Path]) -> TiltSeries:
+    """Inverse of _series_files(with_mdoc=False)."""
+    if len(files) == 3:
+        return TiltSeries(files[0]).with_split_files(files[1], files[2])
+    return TiltSeries(files[0])
+
+
+def _cached_series(
+    cache: artifacts.ArtifactCache | None,
+    stage: str,
+    tiltseries: TiltSeries,
+    params: dict,
+    stacks: list[Path],
+    run: Callable[[], TiltSeries],
+) -> TiltSeries:
+    """Return run(), or link the stacks it writes in from the artifact cache.
+
+    stacks are the full stack and EVN/ODD stacks written by run, the stage
+    is keyed by the files of tiltseries and params.
+    """
+    if cache is None:
+        return run()
+    key = cache.key(stage, _series_files(tiltseries), params)
+    if cache.fetch(key, stacks):
+        print(f"{tiltseries.path}: Using cached {stage} output.")
+        return _tiltseries_from_files(stacks).with_mdoc(tiltseries.mdoc)
+    result = run()
+    # Stages may have nothing to do, e.g. dose filtering without doses
+    if result.path == stacks[0]:
+        cache.store(key, stacks)
+    return result
+
+
+def _align_cached(
+    cache: artifacts.ArtifactCache | None, ts: TiltSeries, **params
+) -> TiltSeries:
+    """Align with AreTomo, see align_with_areTomo, reusing a cached alignment.
+
+    Besides the aligned stacks, the .aln and .tlt files are cached.
+    """
+    if cache is None:
+        return align_with_areTomo(ts, **params)
+
+    outputs = [ts.path.with_name(f"{ts.path.stem}_ali.mrc")]
+    if params["do_evn_odd"] and ts.is_split:
+        outputs += [
+            ts.path.with_name(f"{ts.path.stem}_ali_EVN.mrc"),
+            ts.path.with_name(f"{ts.path.stem}_ali_ODD.mrc"),
+        ]
+    stacks = list(outputs)
+    # AreTomo updates these in place, e.g. with --previous
+    alignment = [ts.path.with_suffix(".aln"), ts.path.with_suffix(".tlt")]
+    outputs += alignment
+
+    # --previous applies the existing .aln file
+    inputs = _series_files(ts)
+    if params["previous"]:
+        inputs.append(ts.path.with_suffix(".aln"))
+    # The GPU doesn't change the result
+    key = cache.key("aretomo", inputs, {k: v for k, v in params.items() if k != "gpu"})
+    if cache.fetch(key, outputs, copied=alignment):
+        print(f"{ts.path}: Using cached AreTomo alignment.")
+        return _tiltseries_from_files(stacks).with_mdoc(ts.mdoc)
+
+    ts_ali = align_with_areTomo(ts, **params)
+    cache.store(key, outputs, copied=alignment)
+    return ts_ali
+
+
+def _dose_filter_cached(
+    cache: artifacts.ArtifactCache | None, tiltseries_ali: TiltSeries, do_evn_odd: bool
+) -> TiltSeries:
+    """Dose filter, see dose_filter, reusing cached filtered stacks."""
+    filtered_stacks = [
+        tiltseries_ali.path.with_name(f"{tiltseries_ali.path.stem}_filtered{half}")
+        for half in (
+            [".mrc", "_EVN.mrc", "_ODD.mrc"]
+            if do_evn_odd and tiltseries_ali.is_split
+            else [".mrc"]
+        )
+    ]
+    return _cached_series(
+        cache,
+        "dose filtering",
+        tiltseries_ali,
+        {"do_evn_odd": do_evn_odd},
+        filtered_stacks,
+        lambda: dose_filter(tiltseries_ali, do_evn_odd),
+    )
+
+
+def _find_positioning(
+    tiltseries: TiltSeries,
+    tiltseries_filtered: TiltSeries,
+    cache: artifacts.ArtifactCache | None,
+    bin: int,
+    thickness: int,
+    extra_thickness: int,
+) -> tuple[float, float, int]:
+    """Estimate x axis tilt, z shift and thickness from a bin 8 reconstruction.
+
+    If findsection or tomopitch fail, the defaults 0, 0 and thickness are kept.
+    """
+    print(f"Trying to run automatic positioning on {tiltseries.path.name}.")
+    pix_xy = tiltseries.angpix
+    x_axis_tilt: float = 0
+    z_shift: float = 0
+
+    # Perform reconstruction at bin 8 to find pitch / thickness
+    pitch_stack = tiltseries_filtered.path
+    if bin < 8:
+        pitch_stack = pitch_stack.with_name(
+            f"{pitch_stack.stem}_bin_{int(8 / bin)}.mrc"
+        )
+    pitch_rec = pitch_stack.with_name(f"{pitch_stack.stem}_full_rec.mrc")
+    pitch_key = None
+    if cache is not None:
+        pitch_key = cache.key(
+            "positioning",
+            _series_files(tiltseries_filtered),
+            {"bin": bin, "thickness": round(10000 / pix_xy)},
+        )
+
+    if pitch_key is not None and cache.fetch(pitch_key, [pitch_rec]):
+        print(f"{tiltseries.path}: Using cached positioning reconstruction.")
+        tomo_pitch = Tomogram(pitch_rec)
+    else:
+        if bin < 8:
+            binned_ts = bin_tiltseries(tiltseries_filtered, int(8 / bin))
         else:
-            for micrograph in micrographs:
-                with mrcfile.mmap(micrograph.path, mode="r+") as mrc:
-                    mrc.voxel_size = mdoc["PixelSpacing"]
-                micrograph.path.rename(output_dir.joinpath(micrograph.path.name))
+            binned_ts = tiltseries_filtered
+
+        tomo_pitch = Tomogram.from_tiltseries(
+            binned_ts,
+            binned=max(bin, 8),
+            do_EVN_ODD=False,
+            trim=False,
+            thickness=round(10000 / pix_xy),
+        )
+        if pitch_key is not None:
+            cache.store(pitch_key, [tomo_pitch.path])
+
+    # Try to automatically find edges of tomogram
+    pitch_mod = tomo_pitch.path.with_name(f"{tiltseries.path.stem}_pitch.mod")
+
+    # The parameters for findsection are taken from the etomo source code
+    fs = jobs.run(
+        [
+            "findsection",
+            "-tomo",
+            tomo_pitch.path,
+            "-pitch",
+            pitch_mod,
+            "-scales",
+            "2",
+            "-size",
+            "16,1,16",
+            "-samples",
+            "5",
+            "-block",
+            "48",
+        ],
+        stdout=subprocess.DEVNULL,
+        check=False,
+    )
 
-            shutil.rmtree(frames_corrected_dir)
-            print(f"Successfully created micrograph images in {output_dir}. \n")
+    # If it fails, just use default values
+    if fs.returncode != 0:
+        print(f"{tiltseries.path}: findsection failed, using default values.")
+    else:
+        # Else, get tomopitch
+        tomopitch = jobs.run(
+            [
+                "tomopitch",
+                "-mod",
+                pitch_mod,
+                "-extra",
+                str(extra_thickness),
+                "-scale",
+                str(8),
+            ],
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.splitlines()
+
+        # Check for failed process again.
+        if any(line.startswith("ERROR") for line in tomopitch):
+            print(f"{tiltseries.path}: tomopitch failed, using default values.")
+        else:
+            x_axis_tilt = float(tomopitch[-3].split()[-1])
+            z_shift_line, thickness_line = tomopitch[-1].split(";")
+            z_shift = float(z_shift_line.split()[-1])
+            thickness = int(thickness_line.split()[-1]) + extra_thickness
+            print(
+                f"{tiltseries.path}: Succesfully estimated tomopitch:"
+                f"thickness {thickness}, z_shift {z_shift},"
+                f"x_axis_tilt {x_axis_tilt}"
+            )
+    pitch_mod.unlink(missing_ok=True)
+    tomo_pitch.path.unlink(missing_ok=True)
+
+    return x_axis_tilt, z_shift, thickness
+
+
+def _reconstruct_as_jobs(
+    executor: executors.Executor,
+    series: list[TiltSeries],
+    options: list,
+    poll_interval: float,
+):
+    """Submit a reconstruct job per tilt series and wait for all of them."""
+    submitted = []
+    for tiltseries in series:
+        log = tiltseries.path.with_name(f"{tiltseries.path.stem}_reconstruct.log")
+        job = executor.submit(
+            executors.tomotools_command("reconstruct", *options, tiltseries.path),
+            name=tiltseries.path.stem,
+            log=log,
+        )
+        print(f"Submitted {tiltseries.path.name} as job {job.id}.")
+        submitted.append(job)
+
+    failed = executors.wait_all(executor, submitted, poll_interval)
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(submitted)} reconstruct jobs failed: "
+            + ", ".join(job.name for job in failed)
+        )
+
+
+class _ReconstructParams(NamedTuple):
+    """Options of reconstruct that the stages of each tilt series depend on."""
+
+    local: bool
+    previous: bool
+    imod: bool
+    ali_d: int
+    bin: int
+    do_evn_odd: bool
+    thickness: int | None
+    extra_thickness: int
+    sirt: int
+    do_positioning: bool
+    bytes: bool
+
+    @property
+    def alignment(self) -> dict:
+        """Parameters of the alignment, it is redone if they change."""
+        return dict(
+            imod=self.imod,
+            previous=self.previous,
+            local=self.local,
+            ali_d=self.ali_d,
+            bin=self.bin,
+            do_evn_odd=self.do_evn_odd,
+        )
+
+    @property
+    def reconstruction(self) -> dict:
+        """Parameters of the reconstruction, it is redone if they change."""
+        return self.alignment | dict(
+            thickness=self.thickness,
+            extra_thickness=self.extra_thickness,
+            sirt=self.sirt,
+            do_positioning=self.do_positioning,
+            bytes=self.bytes,
+        )
+
+    def job_options(self) -> list:
+        """Return the options to pass these on to reconstruct jobs."""
+        options = [
+            "--local" if self.local else "--global",
+            "--extra-thickness",
+            self.extra_thickness,
+            "--ali-d",
+            self.ali_d,
+            "--bin",
+            self.bin,
+            "--sirt",
+            self.sirt,
+            "--imod" if self.imod else "--aretomo",
+            "--do-positioning" if self.do_positioning else "--skip-positioning",
+            "--bytes" if self.bytes else "--nobytes",
+        ]
+        if self.thickness is not None:
+            options += ["--thickness", self.thickness]
+        if self.previous:
+            options.append("--previous")
+        if self.do_evn_odd:
+            options.append("--do-evn-odd")
+        return options
+
+
+def _read_batch_file(batch_file: Path) -> dict[str, str]:
+    """Return the views to exclude per tilt series name, from a batch file."""
+    ts_info = {}
+    with open(batch_file) as file:
+        for line in file:
+            if line != "\n":
+                lsplit = line.rsplit(maxsplit=1)
+                if len(lsplit) != 2:
+                    print(f'Skipping invalid line in the batch file: "{line}"')
+                    continue
+                ts_info[lsplit[0]] = lsplit[1].rstrip()
+    return ts_info
+
+
+def _exclude_batch_views(tiltseries: TiltSeries, excludetilts: str):
+    """Exclude views from a tilt series, unless that was done before."""
+    print(f"Will exclude tilts {excludetilts}.")
+    checkpoints = checkpoint.open_checkpoint(tiltseries.path.parent)
+    exclude_key = f"{tiltseries.path.name}/exclude"
+    if checkpoints.done(exclude_key, [], {"views": excludetilts}) is not None:
+        print(f"Tilts were already excluded from {tiltseries.path}.")
+        return
+
+    # Stack, EVN/ODD stacks and mdoc are rewritten together,
+    # the excluded views are moved into an excluded-views stack
+    excludedir = tiltseries.path.parent / "excluded_views"
+    exclude_views(tiltseries, parse_view_ranges(excludetilts), record_dir=excludedir)
+    print(f"Excluded specified tilts from {tiltseries.path}.")
+    if tiltseries.is_split:
+        print("Excluded specified tilts from EVN and ODD stacks.")
+
+    with open(excludedir / "README", mode="w+") as file:
+        file.write(
+            "Excluded views with their restore records. Put them back "
+            "with: tomotools restore-views TS.mrc"
+        )
+    # The rewritten files are what marks the exclusion as done
+    checkpoints.record(
+        exclude_key, {}, {"views": excludetilts}, _series_files(tiltseries)
+    )
+
+
+def _prepare_series(
+    tiltseries: TiltSeries,
+    params: _ReconstructParams,
+    move: bool,
+    ts_info: dict[str, str],
+) -> TiltSeries | None:
+    """Move a tilt series and exclude its views, if asked to.
+
+    Return None if it isn't to be reconstructed here: with --imod, or if it
+    was reconstructed before.
+    """
+    print(f"\nNow working on {tiltseries.path.name}.")
+
+    if move:
+        tsdir = tiltseries.path.with_suffix("")
+        tsdir.mkdir()
+        print(f"Moving files to subdir {tsdir}.")
+        tiltseries.path = tiltseries.path.rename(tsdir / tiltseries.path.name)
+        tiltseries.mdoc = tiltseries.mdoc.rename(tsdir / tiltseries.mdoc.name)
+        if tiltseries.is_split:
+            tiltseries.evn_path = tiltseries.evn_path.rename(
+                tsdir / tiltseries.evn_path.name
+            )
+            tiltseries.odd_path = tiltseries.odd_path.rename(
+                tsdir / tiltseries.odd_path.name
+            )
+
+    # If imod alignment is wanted and no previous tag is passed, stop here
+    # imod batch alignment can handle the rest!
+    if params.imod and not params.previous:
+        print(f"Moved {tiltseries.path.name} into subfolder. Continue in etomo. \n")
+        return None
+
+    if tiltseries.path.name in ts_info:
+        _exclude_batch_views(tiltseries, ts_info[tiltseries.path.name])
+
+    checkpoints = checkpoint.open_checkpoint(tiltseries.path.parent)
+    if (
+        checkpoints.done(
+            f"{tiltseries.path.name}/reconstruct",
+            _series_files(tiltseries),
+            params.reconstruction,
+        )
+        is not None
+    ):
+        print(f"{tiltseries.path.name} is already reconstructed. Skipping.")
+        return None
+    return tiltseries
+
+
+def _prepare_all(
+    input_ts: list[TiltSeries],
+    params: _ReconstructParams,
+    move: bool,
+    ts_info: dict[str, str],
+) -> list[TiltSeries]:
+    """Prepare the tilt series, see _prepare_series, return those to reconstruct.
+
+    Other nodes may work on the same directory, each tilt series is prepared
+    by one of them.
+    """
+    prepared_ts = []
+    for tiltseries in input_ts:
+        with claims.claimed(tiltseries.path) as claim:
+            if claim is None:
+                print(f"{tiltseries.path.name} is claimed elsewhere. Skipping.")
+                continue
+            if not tiltseries.path.is_file():
+                # Moved away by another node in the meantime
+                continue
+            checkpoint.open_checkpoint(tiltseries.path.parent).refresh()
+            prepared = _prepare_series(tiltseries, params, move, ts_info)
+        if prepared is not None:
+            prepared_ts.append(prepared)
+    return prepared_ts
+
+
+class _SeriesStages:
+    """The stages of reconstruct for one tilt series, see add_to.
+
+    The tilt series is claimed by its first stage, stage-in, which runs on a
+    pool of its own, so copying it to scratch space doesn't hold a GPU. Only
+    as many tilt series as ahead allows are claimed and staged in ahead of
+    their alignment, so each node only claims what it works on soon. With
+    scratch space, the other stages work on the copy.
+    """
+
+    def __init__(
+        self,
+        tiltseries: TiltSeries,
+        params: _ReconstructParams,
+        cache: artifacts.ArtifactCache | None,
+        scratch_space: scratch.Scratch | None,
+        ahead: threading.Semaphore,
+    ):
+        self.tiltseries = tiltseries
+        self.name = tiltseries.path.name
+        self.params = params
+        self.cache = cache
+        self.scratch_space = scratch_space
+        self.checkpoints = checkpoint.open_checkpoint(tiltseries.path.parent)
+        self.claim = claims.Claim(claims.claim_file(tiltseries.path))
+        # Taken before any stage ran, as stages may change their inputs
+        self.input_stamp = checkpoint.stamp(_series_files(tiltseries))
+        self.work = tiltseries
+        self.workspace: Path | None = None
+        self.staged: checkpoint.Stamp = {}
+        self.ahead = ahead
+        self._ahead_held = False
+        self._failed = threading.Event()
+        # Alignments that are still there from an earlier run are kept
+        self.existing_alignment = self.checkpoints.done(
+            f"{self.name}/align", _series_files(tiltseries), params.alignment
+        )
+
+    def add_to(
+        self,
+        graph: stages.StageGraph,
+        gpu_pool: gpus.GpuPool,
+        cpu_pool: stages.Pool,
+        io_pool: stages.Pool,
+    ):
+        """Add staging, alignment, dose filtering, positioning and reconstruction."""
+        name = self.name
+        self._failed = graph.failed
+        staged = graph.add(f"{name}/stage-in", self.stage_in, pool=io_pool)
+        if self.existing_alignment is not None:
+            print(f"Using the existing alignment of {name}.")
+            aligned = graph.add(
+                f"{name}/align",
+                self.use_existing_alignment,
+                after=[staged],
+                pool=cpu_pool,
+            )
+        # If previous is passed, respect --imod flag.
+        elif self.params.previous and self.params.imod:
+            aligned = graph.add(
+                f"{name}/align", self.align_with_imod, after=[staged], pool=cpu_pool
+            )
+        # Otherwise, use AreTomo, aligning one tilt series per GPU at a time.
+        else:
+            aretomo = graph.add(
+                f"{name}/aretomo",
+                self.align_with_aretomo,
+                after=[staged],
+                pool=gpu_pool,
+            )
+            aligned = graph.add(
+                f"{name}/align", self.bin_aligned, after=[aretomo], pool=cpu_pool
+            )
+
+        filtered = graph.add(
+            f"{name}/dose filtering",
+            self.filter_aligned,
+            after=[aligned],
+            pool=cpu_pool,
+        )
+        positioned = graph.add(
+            f"{name}/positioning",
+            self.find_positioning,
+            after=[filtered],
+            pool=cpu_pool,
+        )
+        graph.add(
+            f"{name}/reconstruct",
+            self.reconstruct_filtered,
+            after=[aligned, filtered, positioned],
+            pool=cpu_pool,
+        )
+
+    def release(self):
+        """Give up the claim, e.g. if the tilt series failed."""
+        self._next_up()
+        self.claim.release()
+
+    def stage_in(self, _slot: int):
+        """Wait until the tilt series is due, then claim it and stage it in."""
+        while not self.ahead.acquire(timeout=1):
+            if self._failed.is_set():
+                # Its alignment won't start anymore
+                raise stages.Skipped(self.name)
+        self._ahead_held = True
+        try:
+            self._start()
+        except BaseException:
+            self._next_up()
+            raise
+
+    def _next_up(self):
+        """Let the next tilt series stage in, once this one is being aligned."""
+        if self._ahead_held:
+            self._ahead_held = False
+            self.ahead.release()
+
+    def _start(self):
+        """Claim the tilt series and stage it in, or raise Skipped."""
+        if not self.claim.acquire():
+            holder = claims.describe(self.claim.holder())
+            print(f"{self.name} is claimed by {holder}. Skipping.")
+            raise stages.Skipped(self.name)
+        self.checkpoints.refresh()
+        if (
+            self.checkpoints.done(
+                f"{self.name}/reconstruct",
+                _series_files(self.tiltseries),
+                self.params.reconstruction,
+            )
+            is not None
+        ):
+            print(f"{self.name} was reconstructed elsewhere. Skipping.")
+            self.claim.release()
+            raise stages.Skipped(self.name)
+        if self.scratch_space is not None:
+            self._stage_in(self.existing_alignment or [])
+
+    def _stage_in(self, extra_files: list[Path]):
+        tiltseries = self.tiltseries
+        self.workspace = self.scratch_space.stage_in(
+            self.name, _staging_files(tiltseries) + extra_files
+        )
+        if self.workspace is None:
+            return
+        print(f"Staged {self.name} in {self.workspace}.")
+        self.work = TiltSeries(self.workspace / tiltseries.path.name)
+        if tiltseries.is_split:
+            self.work.with_split_files(
+                self.workspace / tiltseries.evn_path.name,
+                self.workspace / tiltseries.odd_path.name,
+            )
+        self.staged = checkpoint.stamp(self.workspace.iterdir())
+
+    def _in_workspace(self, file: Path) -> Path:
+        return file if self.workspace is None else self.workspace / file.name
+
+    def _in_place(self, file: Path | None) -> Path | None:
+        if file is None or self.workspace is None:
+            return file
+        return self.tiltseries.path.parent / file.relative_to(self.workspace)
+
+    def _ensure_held(self):
+        """Skip the rest of the tilt series if another node took it over."""
+        try:
+            self.claim.ensure_held()
+        except claims.ClaimLost as error:
+            print(f"{error} Skipping.")
+            raise stages.Skipped(self.name) from error
+
+    def _record_alignment(self, tiltseries_ali: TiltSeries) -> TiltSeries:
+        self._ensure_held()
+        self.checkpoints.record(
+            f"{self.name}/align",
+            self.input_stamp,
+            self.params.alignment,
+            _series_files(tiltseries_ali, with_mdoc=False),
+        )
+        return tiltseries_ali
+
+    def use_existing_alignment(self, _staged: None, _slot: int) -> TiltSeries:
+        self._next_up()
+        return _tiltseries_from_files(
+            [self._in_workspace(file) for file in self.existing_alignment]
+        ).with_mdoc(self.work.mdoc)
+
+    def align_with_imod(self, _staged: None, _slot: int) -> TiltSeries:
+        self._next_up()
+        return self._record_alignment(
+            align_with_imod(
+                self.work,
+                self.params.previous,
+                self.params.do_evn_odd,
+                binning=self.params.bin,
+            )
+        )
+
+    def align_with_aretomo(self, _staged: None, gpu_id: int) -> TiltSeries:
+        self._next_up()
+        return _align_cached(
+            self.cache,
+            self.work,
+            gpu=str(gpu_id),
+            local=self.params.local,
+            previous=self.params.previous,
+            do_evn_odd=self.params.do_evn_odd,
+            volz=self.params.ali_d,
+        )
+
+    def bin_aligned(self, tiltseries_at: TiltSeries, _slot: int) -> TiltSeries:
+        # AreTomo binning looks terrible, so do binning in separate step
+        bin, do_evn_odd = self.params.bin, self.params.do_evn_odd
+        tiltseries_ali = _cached_series(
+            self.cache,
+            "binning",
+            tiltseries_at,
+            {"bin": bin, "do_evn_odd": do_evn_odd},
+            _series_files(tiltseries_at, with_mdoc=False),
+            lambda: bin_tiltseries(
+                tiltseries_at, bin=bin, do_evn_odd=do_evn_odd, overwrite=True
+            ),
+        )
+        return self._record_alignment(tiltseries_ali)
+
+    def filter_aligned(self, tiltseries_ali: TiltSeries, _slot: int) -> TiltSeries:
+        print(f"\nReconstructing {self.name}.")
+        return _dose_filter_cached(self.cache, tiltseries_ali, self.params.do_evn_odd)
+
+    def find_positioning(
+        self, tiltseries_filtered: TiltSeries, _slot: int
+    ) -> tuple[float, float, int]:
+        # Define x_axis_tilt and thickness
+        thickness = self.params.thickness
+        if thickness is None:
+            thickness = (
+                round(6000 / self.tiltseries.angpix) + self.params.extra_thickness
+            )
+        if not self.params.do_positioning:
+            return 0, 0, thickness
+        return _find_positioning(
+            self.work,
+            tiltseries_filtered,
+            self.cache,
+            bin=self.params.bin,
+            thickness=thickness,
+            extra_thickness=self.params.extra_thickness,
+        )
+
+    def reconstruct_filtered(
+        self,
+        tiltseries_ali: TiltSeries,
+        tiltseries_filtered: TiltSeries,
+        positioning: tuple[float, float, int],
+        _slot: int,
+    ):
+        x_axis_tilt, z_shift, thickness = positioning
+        tomogram = Tomogram.from_tiltseries(
+            tiltseries_filtered,
+            binned=self.params.bin,
+            thickness=thickness,
+            x_axis_tilt=x_axis_tilt,
+            z_shift=z_shift,
+            sirt=self.params.sirt,
+            do_EVN_ODD=self.params.do_evn_odd,
+            convert_to_byte=self.params.bytes,
+        )
+
+        tiltseries_ali.delete_files(delete_mdoc=False)
+
+        tiltseries_filtered.delete_files(delete_mdoc=False)
+        self._ensure_held()
+
+        def finish():
+            if self.claim.lost.is_set():
+                print(f"Lost the claim on {self.name}, not recording it.")
+                return
+            self.checkpoints.record(
+                f"{self.name}/reconstruct",
+                self.input_stamp,
+                self.params.reconstruction,
+                [
+                    self._in_place(tomogram.path),
+                    self._in_place(tomogram.evn_path),
+                    self._in_place(tomogram.odd_path),
+                ],
+            )
+            self.claim.release()
+            print(f"{self.tiltseries.path}: Done.\n")
+
+        if self.workspace is None:
+            finish()
+        else:
+            # The next tilt series doesn't wait for the copy
+            self.scratch_space.copy_back(
+                self.workspace, self.tiltseries.path.parent, self.staged, then=finish
+            )
+
+
+def _reconstruct_in_stages(
+    series: list[TiltSeries],
+    params: _ReconstructParams,
+    gpu: str | None,
+    jobs_per_gpu: int,
+    cpu_jobs: int | None,
+    scratch_dir: Path | None,
+):
+    """Align and reconstruct the tilt series, see _SeriesStages.
+
+    AreTomo runs on the GPUs, the other stages on the CPUs, so while one tilt
+    series is aligned, others are filtered and reconstructed. Tilt series are
+    staged in one at a time, at most one per GPU slot ahead of alignment.
+    """
+    gpu_pool = gpus.GpuPool(gpus.gpu_ids(gpu), jobs_per_gpu)
+    # The tools of each stage run as jobs, bounded by the workers of the runner
+    if cpu_jobs is None:
+        cpu_jobs = jobs.default_runner().workers
+    cpu_pool = stages.Pool(cpu_jobs)
+    # Staging is bound by I/O, copies would only compete for it
+    io_pool = stages.Pool(1)
+    ahead = threading.BoundedSemaphore(gpu_pool.slots)
+    # Intermediate stacks are reused across runs with other parameters
+    cache = artifacts.default_cache()
+    scratch_space = None if scratch_dir is None else scratch.Scratch(scratch_dir)
+
+    graph = stages.StageGraph()
+    series_stages = [
+        _SeriesStages(tiltseries, params, cache, scratch_space, ahead)
+        for tiltseries in series
+    ]
+    for stages_of_series in series_stages:
+        stages_of_series.add_to(graph, gpu_pool, cpu_pool, io_pool)
+    try:
+        graph.run()
+    finally:
+        # Products still on their way back are waited for, the workspaces of
+        # failed tilt series are removed
+        if scratch_space is not None:
+            scratch_space.close()
+        # Claims of failed tilt series are given up, other nodes may retry
+        for stages_of_series in series_stages:
+            stages_of_series.release()
 
 
 @click.command()
@@ -408,6 +1595,13 @@ def preprocess(
     default=None,
     help="Specify which GPUs to use for AreTomo. [default: all]",
 )
+@click.option(
+    "--jobs-per-gpu",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of AreTomo alignments to run on each GPU at the same time.",
+)
 @click.option(
     "--do-positioning/--skip-positioning",
     is_flag=True,
@@ -434,12 +1628,40 @@ def preprocess(
     type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
     help="Pass a tab-separated file with tilt series names and views to exclude.",
 )
+@click.option(
+    "--executor",
+    type=str,
+    default=None,
+    help="Run each tilt series as a job: local, local:N (N jobs at a time) or "
+    "script (via TOMOTOOLS_SUBMIT_SCRIPT and TOMOTOOLS_POLL_SCRIPT).",
+)
+@click.option(
+    "--poll-interval",
+    type=float,
+    default=10,
+    show_default=True,
+    help="Seconds between checks on the jobs of --executor.",
+)
+@click.option(
+    "--cpu-jobs",
+    type=int,
+    default=None,
+    help="Number of tilt series in CPU stages at the same time. "
+    "[default: TOMOTOOLS_JOBS or all CPUs]",
+)
+@click.option(
+    "--scratch",
+    "scratch_dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Local directory, e.g. on NVMe or tmpfs, to align and reconstruct in. "
+    "Products are copied back next to the inputs.",
+)
 @click.argument(
     "input_files",
     nargs=-1,
     type=click.Path(file_okay=True, dir_okay=True, path_type=Path),
 )
-# TODO: Fix complexity error C901
 def reconstruct(
     move: bool,
     thickness: int | None,
@@ -452,9 +1674,14 @@ def reconstruct(
     do_positioning: bool,
     previous: bool,
     gpu: str | None,
+    jobs_per_gpu: int,
     do_evn_odd: bool,
     bytes: bool,
     batch_file: Path | None,
+    executor: str | None,
+    poll_interval: float,
+    cpu_jobs: int | None,
+    scratch_dir: Path | None,
     input_files: tuple[Path],
 ):
     """Align and reconstruct the given tiltseries.
@@ -464,6 +1691,17 @@ def reconstruct(
     EVN/ODD stacks will always be moved and tilts excluded, but alignment and
     reconstruction will only be performed if the --do-evn-odd flag is passed.
 
+    With --executor, tilt series are moved and tilts excluded here, then each
+    tilt series is aligned and reconstructed in a job of its own, e.g. on the
+    nodes of a cluster.
+
+    Several reconstruct runs, e.g. on separate nodes, can work on the same
+    directory, each tilt series is claimed and reconstructed by one of them.
+
+    With --scratch, each tilt series is copied to the scratch directory and
+    all intermediate stacks stay there. Tomograms and alignment files are
+    copied back in the background, while the next tilt series is processed.
+
     \b
     Batch file for tilt exclusion should look like this (tab-separated):
     TS_01.mrc 1,39-41
@@ -480,210 +1718,44 @@ def reconstruct(
         )
 
     # Read in batch tilt exclude file
-    ts_info = {}
-    if batch_file is not None:
-        with open(batch_file) as file:
-            for line in file:
-                if line != "\n":
-                    lsplit = line.rsplit(maxsplit=1)
-                    if len(lsplit) != 2:
-                        print(f'Skipping invalid line in the batch file: "{line}"')
-                        continue
-                    temp = {lsplit[0]: lsplit[1].rstrip()}
-                    ts_info.update(temp)
+    ts_info = {} if batch_file is None else _read_batch_file(batch_file)
+
+    # Steps are skipped on reruns if their inputs and these parameters are unchanged
+    params = _ReconstructParams(
+        local=local,
+        previous=previous,
+        imod=imod,
+        ali_d=ali_d,
+        bin=bin,
+        do_evn_odd=do_evn_odd,
+        thickness=thickness,
+        extra_thickness=extra_thickness,
+        sirt=sirt,
+        do_positioning=do_positioning,
+        bytes=bytes,
+    )
 
     # Iterate over the tiltseries objects and align and reconstruct
+    sessions = manifest.load_sessions(input_files)
     input_ts = convert_input_to_TiltSeries(list(input_files))
-
-    for tiltseries in input_ts:
-        print(f"\nNow working on {tiltseries.path.name}.")
-
-        if move:
-            tsdir = tiltseries.path.with_suffix("")
-            tsdir.mkdir()
-            print(f"Moving files to subdir {tsdir}.")
-            tiltseries.path = tiltseries.path.rename(tsdir / tiltseries.path.name)
-            tiltseries.mdoc = tiltseries.mdoc.rename(tsdir / tiltseries.mdoc.name)
-            if tiltseries.is_split:
-                tiltseries.evn_path = tiltseries.evn_path.rename(
-                    tsdir / tiltseries.evn_path.name
-                )
-                tiltseries.odd_path = tiltseries.odd_path.rename(
-                    tsdir / tiltseries.odd_path.name
-                )
-
-        # If imod alignment is wanted and no previous tag is passed, stop here
-        # imod batch alignment can handle the rest!
-        if imod and not previous:
-            print(f"Moved {tiltseries.path.name} into subfolder. Continue in etomo. \n")
-            continue
-
-        if batch_file is not None:
-            # Check for Tilts to exclude
-            excludetilts = None
-            if tiltseries.path.name in ts_info:
-                excludetilts = ts_info[str(tiltseries.path.name)]
-                print(f"Will exclude tilts {excludetilts}.")
-
-            if excludetilts is not None:
-                exclude_cmd = ["excludeviews", "-views", excludetilts, "-delete"]
-                subprocess.run(
-                    exclude_cmd + [str(tiltseries.path)], stdout=subprocess.DEVNULL
-                )
-                print(f"Excluded specified tilts from {tiltseries.path}.")
-
-                if tiltseries.is_split:
-                    subprocess.run(
-                        exclude_cmd + [str(tiltseries.evn_path)],
-                        stdout=subprocess.DEVNULL,
-                    )
-                    subprocess.run(
-                        exclude_cmd + [str(tiltseries.odd_path)],
-                        stdout=subprocess.DEVNULL,
-                    )
-                    print("Excluded specified tilts from EVN and ODD stacks.")
-
-                # Move the excluded views to a separate subdirectory
-                excludedir = join(tiltseries.path.parent, "excluded_views")
-                if not path.isdir(excludedir):
-                    os.mkdir(excludedir)
-
-                for file in tiltseries.path.parent.glob("*_cutviews0.*"):
-                    os.rename(file, join(excludedir, file.name))
-
-                with open(join(excludedir, "README"), mode="w+") as file:
-                    file.write("Restore by running excludeviews -restore")
-
-        # Align Stack
-        # If previous is passed, respect --imod flag.
-        # Otherwise, use AreTomo.
-
-        if previous and imod:
-            tiltseries_ali = align_with_imod(
-                tiltseries, previous, do_evn_odd, binning=bin
-            )
-        else:
-            # AreTomo binning looks terrible, so do binning in separate step
-            tiltseries_at = align_with_areTomo(
-                ts=tiltseries,
-                local=local,
-                previous=previous,
-                do_evn_odd=do_evn_odd,
-                gpu=gpu,
-                volz=ali_d,
-            )
-
-            tiltseries_ali = bin_tiltseries(
-                tiltseries_at,
-                bin=bin,
-                do_evn_odd=do_evn_odd,
-                overwrite=True,
-            )
-
-        # Do dose filtration.
-        tiltseries_dosefiltered = dose_filter(tiltseries_ali, do_evn_odd)
-
-        # Get AngPix
-        pix_xy = tiltseries.angpix
-
-        # Define x_axis_tilt and thickness
-        x_axis_tilt: float = 0
-        z_shift: float = 0
-        if thickness is None:
-            thickness = round(6000 / pix_xy) + extra_thickness
-
-        if do_positioning:
-            print(f"Trying to run automatic positioning on {tiltseries.path.name}.")
-
-            # Perform reconstruction at bin 8 to find pitch / thickness
-            if bin < 8:
-                binned_ts = bin_tiltseries(tiltseries_dosefiltered, int(8 / bin))
-            else:
-                binned_ts = tiltseries_dosefiltered
-
-            tomo_pitch = Tomogram.from_tiltseries(
-                binned_ts,
-                binned=max(bin, 8),
-                do_EVN_ODD=False,
-                trim=False,
-                thickness=round(10000 / pix_xy),
-            )
-
-            # Try to automatically find edges of tomogram
-            pitch_mod = tomo_pitch.path.with_name(f"{tiltseries.path.stem}_pitch.mod")
-
-            # The parameters for findsection are taken from the etomo source code
-            fs = subprocess.run(
-                [
-                    "findsection",
-                    "-tomo",
-                    tomo_pitch.path,
-                    "-pitch",
-                    pitch_mod,
-                    "-scales",
-                    "2",
-                    "-size",
-                    "16,1,16",
-                    "-samples",
-                    "5",
-                    "-block",
-                    "48",
-                ],
-                stdout=subprocess.DEVNULL,
-            )
-
-            # If it fails, just use default values
-            if fs.returncode != 0:
-                print(f"{tiltseries.path}: findsection failed, using default values.")
-            else:
-                # Else, get tomopitch
-                tomopitch = subprocess.run(
-                    [
-                        "tomopitch",
-                        "-mod",
-                        pitch_mod,
-                        "-extra",
-                        str(extra_thickness),
-                        "-scale",
-                        str(8),
-                    ],
-                    capture_output=True,
-                    text=True,
-                ).stdout.splitlines()
-
-                # Check for failed process again.
-                if any(line.startswith("ERROR") for line in tomopitch):
-                    print(f"{tiltseries.path}: tomopitch failed, using default values.")
-                else:
-                    x_axis_tilt = float(tomopitch[-3].split()[-1])
-                    z_shift_line, thickness_line = tomopitch[-1].split(";")
-                    z_shift = float(z_shift_line.split()[-1])
-                    thickness = int(thickness_line.split()[-1]) + extra_thickness
-                    print(
-                        f"{tiltseries.path}: Succesfully estimated tomopitch:"
-                        f"thickness {thickness}, z_shift {z_shift},"
-                        f"x_axis_tilt {x_axis_tilt}"
-                    )
-            pitch_mod.unlink(missing_ok=True)
-            tomo_pitch.path.unlink(missing_ok=True)
-
-        # Perform final reconstruction
-
-        Tomogram.from_tiltseries(
-            tiltseries_dosefiltered,
-            binned=bin,
-            thickness=thickness,
-            x_axis_tilt=x_axis_tilt,
-            z_shift=z_shift,
-            sirt=sirt,
-            do_EVN_ODD=do_evn_odd,
-            convert_to_byte=bytes,
+    prepared_ts = _prepare_all(input_ts, params, move, ts_info)
+
+    if executor is not None:
+        job_options = params.job_options() + ["--jobs-per-gpu", jobs_per_gpu]
+        if gpu is not None:
+            job_options += ["--gpu", gpu]
+        if cpu_jobs is not None:
+            job_options += ["--cpu-jobs", cpu_jobs]
+        if scratch_dir is not None:
+            job_options += ["--scratch", scratch_dir]
+        _reconstruct_as_jobs(
+            executors.from_spec(executor), prepared_ts, job_options, poll_interval
         )
-
-        tiltseries_ali.delete_files(delete_mdoc=False)
-
-        tiltseries_dosefiltered.delete_files(delete_mdoc=False)
-        print("\n")
+    else:
+        _reconstruct_in_stages(
+            prepared_ts, params, gpu, jobs_per_gpu, cpu_jobs, scratch_dir
+        )
+    manifest.save_sessions(sessions)
 
 
 @click.command()
@@ -708,3 +1780,74 @@ def fix_header_angle(
         tiltseries._update_axis_angle(override_angle)
 
         print(f"\nSet angle in {tiltseries.path.name} to {override_angle}.")
+
+
+@click.command()
+@click.option(
+    "--dark-fraction",
+    default=0.2,
+    show_default=True,
+    help="Tilts with a mean below this fraction of the median mean are dark.",
+)
+@click.option(
+    "--blank-fraction",
+    default=0.05,
+    show_default=True,
+    help="Tilts with a contrast below this fraction of the median contrast are blank.",
+)
+@click.option(
+    "--outlier-z",
+    default=5.0,
+    show_default=True,
+    help="Robust z-score above which a tilt is an outlier.",
+)
+@click.option(
+    "--batch-file",
+    type=click.Path(file_okay=True, dir_okay=False, writable=True, path_type=Path),
+    help="Write flagged tilts as batch file for tomotools reconstruct --batch-file.",
+)
+@click.argument(
+    "input_files",
+    nargs=-1,
+    type=click.Path(exists=True, file_okay=True, dir_okay=True, path_type=Path),
+)
+def check_tilts(
+    dark_fraction: float,
+    blank_fraction: float,
+    outlier_z: float,
+    batch_file: Path | None,
+    input_files: tuple[Path],
+):
+    """Find dark, blank and outlier tilts before alignment.
+
+    Computes per-tilt statistics (mean, std, percentiles and a power-spectrum
+    based ice-thickness proxy) and writes them as _qc.csv and _qc.json next to
+    each tilt series.
+
+    Optionally, writes the flagged tilts to a batch file for reconstruct.
+    """
+    input_ts = convert_input_to_TiltSeries(list(input_files))
+
+    batch_lines = []
+    for tiltseries in input_ts:
+        stats = tilt_qc.flag_tilts(
+            tilt_qc.tilt_statistics(tiltseries),
+            dark_fraction=dark_fraction,
+            blank_fraction=blank_fraction,
+            outlier_z=outlier_z,
+        )
+        tilt_qc.write_qc_report(tiltseries, stats)
+
+        flagged = stats.loc[stats["exclude"], "view"].tolist()
+        if len(flagged) == 0:
+            print(f"{tiltseries.path.name}: no tilts flagged.")
+            continue
+
+        views = format_view_ranges(flagged)
+        print(f"{tiltseries.path.name}: flagged tilts {views}.")
+        batch_lines.append(f"{tiltseries.path.name}\t{views}\n")
+
+    if batch_file is not None:
+        with open(batch_file, "w") as file:
+            file.writelines(batch_lines)
+        print(f"Wrote tilts to exclude to {batch_file}.")
@@ -5,7 +5,7 @@ from pathlib import Path
 
 import click
 
-from tomotools.utils import comfile, sta_util, tiltseries, tomogram
+from tomotools.utils import comfile, manifest, sta_util, tiltseries, tomogram
 from tomotools.utils.tiltseries import (
     TiltSeries,
     convert_input_to_TiltSeries,
@@ -110,6 +110,7 @@ def imod2warp(
     (project_dir / "frames").mkdir(exist_ok=True)
 
     # Parse input files
+    sessions = manifest.load_sessions(input_files)
     ts_list: list[TiltSeries] = []
     for input_file in input_files:
         ts_list.extend(TiltSeries.from_path(input_file))
@@ -140,6 +141,8 @@ def imod2warp(
                 imod=not aretomo,
             )
 
+    manifest.save_sessions(sessions)
+
 
 @click.command()
 @click.option(
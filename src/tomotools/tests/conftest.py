@@ -0,0 +1,116 @@
+"""Fixtures shared by the tests: stand-ins for external tools and tilt series."""
+
+import os
+import sys
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+import tomotools
+from tomotools.utils import gpus, jobs, mdocfile
+
+# Stand-ins for the tools of reconstruct, which copy their input to the output
+FAKE_TOOLS = {
+    "AreTomo": """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case "$1" in -InMrc) in="$2" ;; -OutMrc) out="$2" ;; esac
+    shift
+done
+cp "$in" "$out"
+printf -- "-3\\n0\\n3\\n" > "${in%.mrc}.tlt"
+touch "${in%.mrc}.aln"
+""",
+    "extracttilts": """#!/bin/sh
+printf -- "-3\\n0\\n3\\n" > "$2"
+""",
+    "newstack": """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case "$1" in -in) in="$2" ;; -ou) out="$2" ;; esac
+    shift
+done
+cp "$in" "$out"
+""",
+    "tilt": """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case "$1" in -InputProjections) in="$2" ;; -OutputFile) out="$2" ;; esac
+    shift
+done
+cp "$in" "$out"
+""",
+    # The last two arguments are input and output
+    "mtffilter": """#!/bin/sh
+eval "in=\\${$(($# - 1))}" "out=\\${$#}"
+cp "$in" "$out"
+""",
+    "trimvol": """#!/bin/sh
+eval "in=\\${$(($# - 1))}" "out=\\${$#}"
+cp "$in" "$out"
+""",
+}
+
+
+@pytest.fixture(autouse=True)
+def job_logs(tmp_path: Path, monkeypatch) -> Path:
+    """Keep the logs of the jobs of every test in its tmp_path, return them."""
+    monkeypatch.setenv("TOMOTOOLS_LOG_DIR", str(tmp_path / "job_logs"))
+    monkeypatch.setattr(jobs, "_default_runner", None)
+    return tmp_path / "job_logs"
+
+
+def _script(file: Path, text: str) -> Path:
+    file.write_text(text)
+    file.chmod(0o755)
+    return file
+
+
+@pytest.fixture
+def make_script():
+    """Return a function writing an executable stand-in script, returning it."""
+    return _script
+
+
+@pytest.fixture
+def reconstruct_tools(tmp_path: Path, monkeypatch):
+    """Put stand-ins for AreTomo and IMOD in PATH, make tomotools importable."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, text in FAKE_TOOLS.items():
+        _script(bin_dir / name, text)
+    # No nvidia-smi either
+    _script(bin_dir / "nvidia-smi", "#!/bin/sh\nexit 1\n")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("ARETOMO_EXECUTABLE", str(bin_dir / "AreTomo"))
+    src_dir = Path(tomotools.__file__).parent.parent
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join([str(src_dir), *sys.path[1:]]))
+    gpus.clear_cache()
+    yield
+    gpus.clear_cache()
+
+
+@pytest.fixture
+def make_tiltseries():
+    """Return a function writing a small tilt series with its mdoc and tilts."""
+    return _tiltseries
+
+
+def _tiltseries(directory: Path, name: str) -> Path:
+    ts_path = directory / f"{name}.mrc"
+    with mrcfile.new(ts_path, np.zeros((3, 4, 4), dtype=np.float32)) as mrc:
+        mrc.voxel_size = 2.0
+    mdocfile.write(
+        {
+            "ImageSize": [4, 4],
+            "PixelSpacing": 2.0,
+            "titles": [],
+            "sections": [
+                {"TiltAngle": angle, "ExposureDose": 3} for angle in (-3, 0, 3)
+            ],
+            "framesets": [],
+        },
+        f"{ts_path}.mdoc",
+    )
+    for suffix in (".rawtlt", ".tlt"):
+        ts_path.with_suffix(suffix).write_text("-3\n0\n3\n")
+    return ts_path
@@ -0,0 +1,116 @@
+"""Tests for the content-addressed artifact cache in utils.artifacts."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import artifacts
+from tomotools.utils.artifacts import ArtifactCache
+
+
+@pytest.fixture
+def cache(tmp_path: Path):
+    """An artifact cache of 1 kB, with no hashes remembered from other tests."""
+    artifacts.clear_cache()
+    yield ArtifactCache(tmp_path / "cache", max_bytes=1000)
+    artifacts.clear_cache()
+
+
+def _write(file: Path, content: bytes) -> Path:
+    file.write_bytes(content)
+    return file
+
+
+def test_key_depends_on_content_and_params(cache: ArtifactCache, tmp_path: Path):
+    """Keys change with the content of inputs, not their name or stamp."""
+    first = _write(tmp_path / "TS_01.mrc", b"stack")
+    key = cache.key("binning", [first, None], {"bin": 4})
+
+    assert cache.key("binning", [first], {"bin": 4}) == key
+    assert cache.key("binning", [first], {"bin": 2}) != key
+    assert cache.key("dose filtering", [first], {"bin": 4}) != key
+
+    copy = _write(tmp_path / "copy.mrc", b"stack")
+    assert cache.key("binning", [copy], {"bin": 4}) == key
+
+    _write(first, b"other stack")
+    os.utime(first, ns=(0, 10**18))
+    assert cache.key("binning", [first], {"bin": 4}) != key
+
+
+def test_store_and_fetch_links(cache: ArtifactCache, tmp_path: Path):
+    """Cached files are hard linked into place, replacing existing files."""
+    ali = _write(tmp_path / "TS_01_ali.mrc", b"aligned")
+    cache.store("key", [ali])
+
+    target = tmp_path / "work" / "TS_01_ali.mrc"
+    target.parent.mkdir()
+    _write(target, b"stale")
+    assert cache.fetch("key", [target])
+    assert target.read_bytes() == b"aligned"
+    assert target.stat().st_ino == ali.stat().st_ino
+
+    assert not cache.fetch("other key", [target])
+    assert not cache.fetch("key", [target, tmp_path / "TS_01_ali_EVN.mrc"])
+
+
+def test_rerun_after_miss(cache: ArtifactCache, tmp_path: Path):
+    """Tools rerun after a miss write new files, cached ones stay unchanged."""
+    ali = _write(tmp_path / "TS_01_ali.mrc", b"aligned")
+    aln = _write(tmp_path / "TS_01.aln", b"alignment")
+    cache.store("key", [ali, aln], copied=[aln])
+    assert aln.stat().st_nlink == 1
+
+    assert not cache.fetch("other key", [ali, aln], copied=[aln])
+    # Linked targets are gone, copies are kept, e.g. as input of the tool
+    assert not ali.exists()
+    assert aln.read_bytes() == b"alignment"
+    _write(ali, b"aligned with other parameters")
+    with open(aln, "r+b") as f:
+        f.write(b"ALIGNMENT")
+
+    target = tmp_path / "work" / "TS_01_ali.mrc"
+    target.parent.mkdir()
+    assert cache.fetch("key", [target, tmp_path / "work" / "TS_01.aln"])
+    assert target.read_bytes() == b"aligned"
+    assert (tmp_path / "work" / "TS_01.aln").read_bytes() == b"alignment"
+
+
+def test_outputs_are_hashed_by_key(cache: ArtifactCache, tmp_path: Path):
+    """Stored and fetched files aren't read again to key the next stage."""
+    ali = _write(tmp_path / "TS_01_ali.mrc", b"aligned")
+    cache.store("key", [ali])
+    assert cache.file_hash(ali) == "key-0"
+
+    artifacts.clear_cache()
+    # Also remembered in the cache directory, for later runs
+    assert cache.file_hash(ali) == "key-0"
+
+
+def test_evicts_least_recently_used(cache: ArtifactCache, tmp_path: Path):
+    """Once the size limit is exceeded, the entries used longest ago go first."""
+    for name in ("first", "second"):
+        cache.store(name, [_write(tmp_path / name, b"x" * 400)])
+        entry = cache.root / "entries" / name
+        os.utime(entry, ns=(0, {"first": 1, "second": 2}[name] * 10**9))
+
+    target = tmp_path / "target"
+    assert cache.fetch("first", [target])
+    cache.store("third", [_write(tmp_path / "third", b"x" * 400)])
+
+    assert cache.fetch("first", [target])
+    assert cache.fetch("third", [target])
+    assert not cache.fetch("second", [target])
+
+
+def test_default_cache(tmp_path: Path, monkeypatch):
+    """The cache is only used if TOMOTOOLS_ARTIFACT_CACHE is set."""
+    monkeypatch.delenv("TOMOTOOLS_ARTIFACT_CACHE", raising=False)
+    assert artifacts.default_cache() is None
+
+    monkeypatch.setenv("TOMOTOOLS_ARTIFACT_CACHE", str(tmp_path))
+    monkeypatch.setenv("TOMOTOOLS_ARTIFACT_CACHE_GB", "0.5")
+    cache = artifacts.default_cache()
+    assert cache.root == tmp_path
+    assert cache.max_bytes == 1024**3 // 2
@@ -0,0 +1,111 @@
+"""Tests for the resumable checkpoints in utils.checkpoint."""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import checkpoint
+from tomotools.utils.checkpoint import Checkpoint
+
+PARAMS = {"bin": 4, "gpu": None, "frames": Path("/data/frames")}
+
+
+@pytest.fixture
+def step(tmp_path: Path) -> tuple[Checkpoint, Path, Path]:
+    """Record a step with one input and one output, return checkpoint and files."""
+    source = tmp_path / "TS_01.mrc"
+    source.write_bytes(b"raw")
+    output = tmp_path / "TS_01_ali.mrc"
+    inputs = checkpoint.stamp([source])
+    output.write_bytes(b"aligned")
+
+    checkpoints = Checkpoint(tmp_path / checkpoint.CHECKPOINT_NAME)
+    checkpoints.record("TS_01/align", inputs, PARAMS, [output, None])
+    return checkpoints, source, output
+
+
+def test_done_after_record(step):
+    """A recorded step is done, also for a new process reading the file."""
+    checkpoints, source, output = step
+    assert checkpoints.done("TS_01/align", [source], PARAMS) == [output.absolute()]
+    assert checkpoints.done("TS_01/reconstruct", [source], PARAMS) is None
+
+    reread = Checkpoint(checkpoints.file)
+    assert reread.done("TS_01/align", [source], dict(PARAMS)) == [output.absolute()]
+
+
+def test_changed_params(step):
+    """Other parameters mean the step has to run again."""
+    checkpoints, source, _ = step
+    assert checkpoints.done("TS_01/align", [source], PARAMS | {"bin": 2}) is None
+
+
+def test_changed_input(step):
+    """A rewritten input means the step has to run again."""
+    checkpoints, source, _ = step
+    source.write_bytes(b"other raw")
+    assert checkpoints.done("TS_01/align", [source], PARAMS) is None
+
+
+def test_changed_or_missing_output(step):
+    """Outputs that were changed or deleted since mean the step isn't done."""
+    checkpoints, source, output = step
+    stat = output.stat()
+    os.utime(output, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert checkpoints.done("TS_01/align", [source], PARAMS) is None
+
+    output.unlink()
+    assert checkpoints.done("TS_01/align", [source], PARAMS) is None
+
+
+def test_forget(step):
+    """Forgetting a step returns its outputs for cleanup."""
+    checkpoints, source, output = step
+    assert checkpoints.forget("TS_01/align") == [output.absolute()]
+    assert checkpoints.done("TS_01/align", [source], PARAMS) is None
+    assert checkpoints.forget("TS_01/align") == []
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "{not json",
+        "[]",
+        "null",
+        '{"version": 1}',
+        '{"version": 1, "steps": []}',
+        '{"version": 1, "steps": {"TS_01/align": null}}',
+        '{"version": 1, "steps": {"TS_01/align": {"inputs": {}}}}',
+    ],
+)
+def test_unreadable_file(tmp_path: Path, content: str):
+    """A damaged checkpoint file starts over instead of failing."""
+    file = tmp_path / checkpoint.CHECKPOINT_NAME
+    file.write_text(content)
+    checkpoints = Checkpoint(file)
+    assert checkpoints.done("TS_01/align", [], {}) is None
+    checkpoints.record("TS_02/align", {}, {}, [])
+    assert Checkpoint(file).done("TS_02/align", [], {}) == []
+
+
+def test_open_checkpoint_is_shared(tmp_path: Path):
+    """All users of a directory get the same instance."""
+    assert checkpoint.open_checkpoint(tmp_path) is checkpoint.open_checkpoint(
+        tmp_path / "."
+    )
+
+
+def test_processes_share_the_file(tmp_path: Path):
+    """Steps recorded by another process in the meantime are kept."""
+    file = tmp_path / checkpoint.CHECKPOINT_NAME
+    output = tmp_path / "TS_01_rec.mrc"
+    output.write_bytes(b"tomogram")
+    first, second = Checkpoint(file), Checkpoint(file)
+
+    first.record("TS_01/reconstruct", {}, {}, [output])
+    second.record("TS_02/reconstruct", {}, {}, [output])
+
+    reread = Checkpoint(file)
+    assert reread.done("TS_01/reconstruct", [], {}) == [output.absolute()]
+    assert reread.done("TS_02/reconstruct", [], {}) == [output.absolute()]
@@ -0,0 +1,165 @@
+"""Tests for claiming work between processes and nodes in utils.claims."""
+
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tomotools.commands.preprocessing_reconstruction import preprocess
+from tomotools.utils import claims, mdocfile
+from tomotools.utils.checkpoint import Checkpoint
+
+
+def _foreign_claim(file: Path, host: str, pid: int, age: float = 0):
+    """Write a claim as another process would have, heartbeat age seconds ago."""
+    file.write_text(json.dumps({"host": host, "pid": pid, "token": "foreign"}))
+    beat = time.time() - age
+    os.utime(file, (beat, beat))
+
+
+def test_claim_is_exclusive(tmp_path: Path):
+    """Only one claim on the same work is held at a time."""
+    file = claims.claim_file(tmp_path / "TS_01.mrc")
+    first, second = claims.Claim(file), claims.Claim(file)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert second.holder()["token"] == first.info["token"]
+
+    first.release()
+    assert not file.exists()
+    assert second.acquire()
+    second.release()
+    # No temporary files are left behind
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_claim_of_dead_process_is_broken(tmp_path: Path):
+    """Claims of processes on this host that are gone are taken over."""
+    file = claims.claim_file(tmp_path / "TS_01.mrc")
+    process = subprocess.Popen(["true"])
+    process.wait()
+    _foreign_claim(file, socket.gethostname(), process.pid)
+
+    claim = claims.Claim(file)
+    assert claim.acquire()
+    claim.release()
+
+
+def test_claim_without_heartbeat_is_broken(tmp_path: Path):
+    """Claims of other hosts are taken over once their heartbeat stopped."""
+    file = claims.claim_file(tmp_path / "TS_01.mrc")
+    _foreign_claim(file, "other-node", 1, age=10)
+    assert not claims.Claim(file, stale_after=60).acquire()
+
+    _foreign_claim(file, "other-node", 1, age=120)
+    claim = claims.Claim(file, stale_after=60)
+    assert claim.acquire()
+    assert claim.holder()["token"] == claim.info["token"]
+    claim.release()
+
+
+def test_heartbeat_refreshes_claim(tmp_path: Path):
+    """A held claim doesn't go stale while its owner is working."""
+    file = claims.claim_file(tmp_path / "TS_01.mrc")
+    claim = claims.Claim(file, heartbeat=0.05)
+    assert claim.acquire()
+    past = time.time() - 1000
+    os.utime(file, (past, past))
+
+    time.sleep(0.3)
+    assert time.time() - file.stat().st_mtime < 100
+    claim.release()
+
+
+def test_broken_claim_is_lost(tmp_path: Path):
+    """Owners notice when another process broke their claim."""
+    file = claims.claim_file(tmp_path / "TS_01.mrc")
+    claim = claims.Claim(file, heartbeat=0.05)
+    assert claim.acquire()
+    claim.ensure_held()
+
+    _foreign_claim(file, "other-node", 1)
+    assert claim.lost.wait(2)
+    with pytest.raises(claims.ClaimLost, match="other-node"):
+        claim.ensure_held()
+    claim.release()
+    # The claim of the other process is left alone
+    assert claim.holder()["token"] == "foreign"
+
+
+def test_malformed_claim_timeout(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    """A malformed TOMOTOOLS_CLAIM_TIMEOUT falls back to the default."""
+    monkeypatch.setenv("TOMOTOOLS_CLAIM_TIMEOUT", "5min")
+    assert claims.Claim(tmp_path / "claim").stale_after == claims.STALE_AFTER
+    monkeypatch.setenv("TOMOTOOLS_CLAIM_TIMEOUT", "60")
+    assert claims.Claim(tmp_path / "claim").stale_after == 60
+
+
+def test_claimed_yields_none_if_held_elsewhere(tmp_path: Path):
+    """The context manager skips work claimed by someone else."""
+    work = tmp_path / "TS_01.mrc"
+    with claims.claimed(work) as claim:
+        assert claim is not None
+        with claims.claimed(work) as other:
+            assert other is None
+    assert not claims.claim_file(work).exists()
+
+
+def test_checkpoint_writers_are_serialized(tmp_path: Path):
+    """Steps recorded concurrently by separate writers are all kept."""
+    file = tmp_path / "checkpoint.json"
+
+    def record(writer: int):
+        checkpoints = Checkpoint(file)
+        for step in range(10):
+            checkpoints.record(f"TS_{writer}/{step}", {}, {}, [])
+
+    threads = [threading.Thread(target=record, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reread = Checkpoint(file)
+    for writer in range(4):
+        for step in range(10):
+            assert reread.done(f"TS_{writer}/{step}", [], {}) == []
+
+
+def test_preprocess_skips_claimed_series(tmp_path: Path):
+    """Tilt series claimed by another node are left to it."""
+    data, output = tmp_path / "data", tmp_path / "output"
+    data.mkdir()
+    for name in ("TS_01", "TS_02"):
+        with mrcfile.new(data / f"{name}.mrc", np.zeros((3, 4, 4), np.float32)):
+            pass
+        mdocfile.write(
+            {
+                "titles": [],
+                "sections": [
+                    {"TiltAngle": angle, "ExposureDose": 3} for angle in (-3, 0, 3)
+                ],
+                "framesets": [],
+            },
+            data / f"{name}.mrc.mdoc",
+        )
+    output.mkdir()
+    other_node = claims.Claim(claims.claim_file(output / "TS_02.mrc"))
+    assert other_node.acquire()
+
+    result = CliRunner().invoke(preprocess, ["--noreorder", str(data), str(output)])
+    other_node.release()
+
+    assert result.exit_code == 0, result.output
+    assert "TS_02.mrc.mdoc is claimed elsewhere" in result.output
+    assert (output / "TS_01.mrc").is_file()
+    assert not (output / "TS_02.mrc").exists()
@@ -0,0 +1,102 @@
+"""Tests for discovery of tilt series and reconstructions in directories."""
+
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import discovery
+from tomotools.utils.tiltseries import TiltSeries, convert_input_to_TiltSeries
+from tomotools.utils.tomogram import convert_input_to_Tomogram
+
+
+@pytest.fixture
+def session(tmp_path: Path):
+    """Create empty files as left behind by preprocessing and reconstruction."""
+    for name in [
+        "TS_01.mrc",
+        "TS_01.mrc.mdoc",
+        "TS_01_EVN.mrc",
+        "TS_01_ODD.mrc",
+        "TS_01_ctfplotter.txt",
+        "TS_01.tlt",
+        "TS_01_rec_bin_4.mrc",
+        "TS_02.mrc",
+        "TS_02.mrc.mdoc",
+        "TS_02_even.mrc",
+        "TS_02_odd.mrc",
+        "TS_02.defocus",
+        "TS_02_cutviews0.mrc.mdoc",
+        "TS_02_rec.mrc",
+        "TS_02_even_rec.mrc",
+        "TS_02_odd_rec.mrc",
+        "TS_02_full_rec.mrc",
+        ".TS_03.mrc.mdoc",
+    ]:
+        (tmp_path / name).touch()
+    discovery.clear_cache()
+    return tmp_path
+
+
+def test_index(session):
+    """Files are classified by name."""
+    index = discovery.index(session)
+
+    assert [mdoc.name for mdoc in index.tiltseries_mdocs()] == [
+        "TS_01.mrc.mdoc",
+        "TS_02.mrc.mdoc",
+    ]
+    assert index.split_files("TS_02") == (
+        session / "TS_02_even.mrc",
+        session / "TS_02_odd.mrc",
+    )
+    assert index.defocus_file("TS_01") == session / "TS_01_ctfplotter.txt"
+    assert index.defocus_file("TS_02") == session / "TS_02.defocus"
+    assert index.of_kind("tlt") == [session / "TS_01.tlt"]
+    assert [rec.name for rec in index.reconstructions()] == [
+        "TS_01_rec_bin_4.mrc",
+        "TS_02_rec.mrc",
+    ]
+
+
+def test_rec_in_stack_names(tmp_path):
+    """Only _rec and _rec_bin_N suffixes mark reconstructions."""
+    names = ["lamella_record.mrc", "TS_rec2.mrc", "TS_rec.mrc", "TS_rec_bin_4.mrc"]
+    index = discovery.DirectoryIndex(tmp_path, names)
+
+    assert [file.name for file in index.of_kind("stack")] == [
+        "TS_rec2.mrc",
+        "lamella_record.mrc",
+    ]
+    assert [file.name for file in index.of_kind("reconstruction")] == [
+        "TS_rec.mrc",
+        "TS_rec_bin_4.mrc",
+    ]
+
+
+def test_index_rescans_changed_directory(session):
+    """New files show up in the index."""
+    assert discovery.index(session).defocus_file("TS_03") is None
+
+    (session / "TS_03.defocus").touch()
+
+    assert discovery.index(session).defocus_file("TS_03") == session / "TS_03.defocus"
+
+
+def test_convert_input_to_TiltSeries(session):
+    """Tilt series are found by mdoc, with their halves."""
+    tiltseries = convert_input_to_TiltSeries([session])
+
+    assert sorted(ts.path.name for ts in tiltseries) == ["TS_01.mrc", "TS_02.mrc"]
+    assert all(ts.is_split for ts in tiltseries)
+    assert TiltSeries(session / "TS_01.mrc").defocus_file() == (
+        session / "TS_01_ctfplotter.txt"
+    )
+
+
+def test_convert_input_to_Tomogram(session):
+    """Reconstructions are found with their imod-style halves."""
+    tomograms = {tomo.path.name: tomo for tomo in convert_input_to_Tomogram([session])}
+
+    assert sorted(tomograms) == ["TS_01_rec_bin_4.mrc", "TS_02_rec.mrc"]
+    assert tomograms["TS_02_rec.mrc"].evn_path == session / "TS_02_even_rec.mrc"
+    assert not tomograms["TS_01_rec_bin_4.mrc"].is_split
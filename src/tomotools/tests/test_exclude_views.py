@@ -0,0 +1,161 @@
+"""Tests for native view exclusion of tilt series."""
+
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tomotools.commands.helpers import restore_views as restore_views_command
+from tomotools.utils import mdocfile
+from tomotools.utils.tiltseries import (
+    TiltSeries,
+    exclude_views,
+    parse_view_ranges,
+    restore_views,
+)
+
+
+def _write_stack(file: Path, offset: float = 0):
+    data = np.stack([np.full((4, 6), z + offset, dtype=np.float32) for z in range(5)])
+    with mrcfile.new(file, data) as mrc:
+        mrc.voxel_size = 2.5
+        mrc.header.exttyp = b"SERI"
+        # nint = 4 bytes per view
+        mrc.header.extra2 = (b"\0" * 16 + np.int16(4).tobytes()).ljust(84, b"\0")
+        mrc.set_extended_header(
+            np.frombuffer(b"".join(bytes([z] * 4) for z in range(5)), dtype="V1")
+        )
+        mrc.add_label("Tilt axis angle = 85.3")
+
+
+@pytest.fixture
+def split_ts(tmp_path: Path):
+    """Create a tilt series with EVN/ODD stacks and mdoc."""
+    ts_path = tmp_path / "TS_01.mrc"
+    _write_stack(ts_path)
+    _write_stack(tmp_path / "TS_01_EVN.mrc", offset=10)
+    _write_stack(tmp_path / "TS_01_ODD.mrc", offset=20)
+    mdoc = {
+        "PixelSpacing": 2.5,
+        "titles": ["test"],
+        "sections": [{"TiltAngle": -6 + 3 * z} for z in range(5)],
+        "framesets": [],
+    }
+    mdocfile.write(mdoc, f"{ts_path}.mdoc")
+    ts = TiltSeries(ts_path)
+    assert ts.is_split
+    return ts
+
+
+def test_parse_view_ranges():
+    """View lists are 1-indexed ranges, returned zero-indexed and sorted."""
+    assert parse_view_ranges("1,39-41") == [0, 38, 39, 40]
+    assert parse_view_ranges(" 5, 2-3,") == [1, 2, 4]
+    with pytest.raises(ValueError):
+        parse_view_ranges("0")
+
+
+def test_exclude_views(split_ts: TiltSeries):
+    """Views are removed from stack, halves, extended header and mdoc."""
+    exclude_views(split_ts, parse_view_ranges("1,4"))
+
+    for stack, offset in [
+        (split_ts.path, 0),
+        (split_ts.evn_path, 10),
+        (split_ts.odd_path, 20),
+    ]:
+        with mrcfile.open(stack) as mrc:
+            assert mrc.data.shape == (3, 4, 6)
+            assert list(mrc.data[:, 0, 0]) == [1 + offset, 2 + offset, 4 + offset]
+            assert mrc.extended_header.tobytes()[:12] == bytes(
+                [1] * 4 + [2] * 4 + [4] * 4
+            )
+            assert mrc.voxel_size.x == pytest.approx(2.5)
+            assert "Tilt axis angle" in str(mrc.header.label)
+
+    sections = mdocfile.read(split_ts.mdoc)["sections"]
+    assert [section["TiltAngle"] for section in sections] == [-3, 0, 6]
+    assert split_ts.dimZYX == (3, 4, 6)
+
+    # The removed views are moved into one stack, not kept a second time
+    excluded_dir = split_ts.path.parent / "excluded_views"
+    assert sorted(file.name for file in excluded_dir.iterdir()) == [
+        "TS_01_excluded.json",
+        "TS_01_excluded.mrc",
+    ]
+    with mrcfile.open(excluded_dir / "TS_01_excluded.mrc") as mrc:
+        assert list(mrc.data[:, 0, 0]) == [0, 3, 10, 13, 20, 23]
+
+
+def test_restore_views(split_ts: TiltSeries):
+    """restore_views undoes exclude_views using the restore record."""
+    with mrcfile.open(split_ts.evn_path) as mrc:
+        original = mrc.data.copy()
+        original_ext = mrc.extended_header.tobytes()
+
+    exclude_views(split_ts, [0, 3])
+    record = split_ts.path.parent / "excluded_views" / "TS_01_excluded.json"
+    restore_views(split_ts, record)
+
+    with mrcfile.open(split_ts.evn_path) as mrc:
+        assert np.array_equal(mrc.data, original)
+        assert mrc.extended_header.tobytes() == original_ext
+
+    sections = mdocfile.read(split_ts.mdoc)["sections"]
+    assert [section["TiltAngle"] for section in sections] == [-6, -3, 0, 3, 6]
+    assert list(record.parent.iterdir()) == []
+
+
+def test_restore_views_command(split_ts: TiltSeries):
+    """restore-views puts the views back from the command line."""
+    exclude_views(split_ts, [2])
+
+    result = CliRunner().invoke(restore_views_command, [str(split_ts.path)])
+
+    assert result.exit_code == 0, result.output
+    assert split_ts.dimZYX == (5, 4, 6)
+    with mrcfile.open(split_ts.odd_path) as mrc:
+        assert list(mrc.data[:, 0, 0]) == [20, 21, 22, 23, 24]
+
+
+def test_exclude_views_out_of_range(split_ts: TiltSeries):
+    """Excluding views beyond the stack raises and leaves the files unchanged."""
+    with pytest.raises(IndexError):
+        exclude_views(split_ts, [5])
+
+    assert split_ts.dimZYX == (5, 4, 6)
+
+
+def test_exclude_views_twice(split_ts: TiltSeries):
+    """A second exclusion is refused, so the first one can still be restored."""
+    exclude_views(split_ts, [0])
+    record = split_ts.path.parent / "excluded_views" / "TS_01_excluded.json"
+    first_record = record.read_text()
+
+    with pytest.raises(FileExistsError):
+        exclude_views(split_ts, [1])
+
+    assert record.read_text() == first_record
+    assert split_ts.dimZYX == (4, 4, 6)
+    restore_views(split_ts, record)
+    assert split_ts.dimZYX == (5, 4, 6)
+
+
+def test_exclude_views_failure_cleans_up(split_ts: TiltSeries):
+    """If a stack can't be cut, no temporary or excluded stacks are left."""
+    with mrcfile.new(
+        split_ts.odd_path, np.zeros((4, 4, 6), np.float32), overwrite=True
+    ):
+        pass
+    files = sorted(split_ts.path.parent.iterdir())
+
+    with pytest.raises(ValueError):
+        exclude_views(split_ts, [1])
+
+    assert sorted(split_ts.path.parent.iterdir()) == files + [
+        split_ts.path.parent / "excluded_views"
+    ]
+    assert list((split_ts.path.parent / "excluded_views").iterdir()) == []
+    assert split_ts.dimZYX == (5, 4, 6)
@@ -0,0 +1,123 @@
+"""Tests for running jobs through executors, and reconstruct jobs per tilt series."""
+
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from tomotools.commands.preprocessing_reconstruction import reconstruct
+from tomotools.utils import executors
+
+FAKE_SUBMIT = """#!/bin/sh
+# Runs the job script in the background, like a scheduler would on a node
+(sh "$1" > "$3" 2>&1; echo $? > "$1.rc") &
+echo "Submitted batch job $1"
+"""
+
+FAKE_POLL = """#!/bin/sh
+if [ ! -f "$1.rc" ]; then echo RUNNING
+elif [ "$(cat "$1.rc")" = 0 ]; then echo COMPLETED
+else echo FAILED
+fi
+"""
+
+
+def test_local_executor_queues_jobs(tmp_path: Path):
+    """Jobs beyond the slots wait in the queue, and all end up done."""
+    executor = executors.LocalExecutor(slots=1)
+    jobs = [
+        executor.submit(
+            ["sh", "-c", f"sleep 0.3; echo job {i}"],
+            name=f"job_{i}",
+            log=tmp_path / f"job_{i}.log",
+        )
+        for i in range(2)
+    ]
+
+    assert [executor.poll(job) for job in jobs] == [
+        executors.RUNNING,
+        executors.QUEUED,
+    ]
+    assert executors.wait_all(executor, jobs, interval=0.05) == []
+    assert [job.log.read_text() for job in jobs] == ["job 0\n", "job 1\n"]
+
+
+def test_failed_jobs_are_returned(tmp_path: Path):
+    """A job that exits with an error counts as failed."""
+    executor = executors.LocalExecutor(slots=2)
+    good = executor.submit(["true"], name="good", log=tmp_path / "good.log")
+    bad = executor.submit(["false"], name="bad", log=tmp_path / "bad.log")
+
+    assert executors.wait_all(executor, [good, bad], interval=0.05) == [bad]
+
+
+def test_script_executor(make_script, tmp_path: Path):
+    """Jobs are submitted and polled through the scripts."""
+    executor = executors.ScriptExecutor(
+        str(make_script(tmp_path / "submit", FAKE_SUBMIT)),
+        str(make_script(tmp_path / "poll", FAKE_POLL)),
+    )
+    job = executor.submit(["echo", "hello"], name="hello", log=tmp_path / "hello.log")
+
+    assert job.id == str(tmp_path / "hello.sh")
+    assert executors.wait_all(executor, [job], interval=0.05) == []
+    assert job.log.read_text() == "hello\n"
+
+
+@pytest.mark.parametrize("command, failed", [("true", False), ("false", True)])
+def test_forgotten_jobs_are_judged_by_exit_status(
+    make_script, tmp_path: Path, command: str, failed: bool
+):
+    """Jobs the scheduler doesn't know anymore finish with their exit status."""
+    executor = executors.ScriptExecutor(
+        str(make_script(tmp_path / "submit", FAKE_SUBMIT)),
+        # Like squeue, which forgets jobs once they are finished
+        str(
+            make_script(
+                tmp_path / "poll", '#!/bin/sh\n[ -f "$1.rc" ] || echo RUNNING\n'
+            )
+        ),
+    )
+    job = executor.submit([command], name=command, log=tmp_path / "job.log")
+
+    assert executors.wait_all(executor, [job], interval=0.05) == ([job] * failed)
+
+
+def test_lost_jobs_fail(make_script, tmp_path: Path):
+    """Jobs of unknown state are given up after max_unknown polls."""
+    executor = executors.ScriptExecutor(
+        str(make_script(tmp_path / "submit", "#!/bin/sh\necho lost-1\n")),
+        str(make_script(tmp_path / "poll", "#!/bin/sh\nexit 1\n")),
+    )
+    job = executor.submit(["true"], name="lost", log=tmp_path / "lost.log")
+
+    assert executors.wait_all(executor, [job], interval=0.01, max_unknown=3) == [job]
+
+
+def test_from_spec(monkeypatch):
+    """Executors are chosen by name."""
+    assert executors.from_spec("local:3").slots == 3
+    monkeypatch.delenv("TOMOTOOLS_SUBMIT_SCRIPT", raising=False)
+    with pytest.raises(ValueError):
+        executors.from_spec("script")
+    with pytest.raises(ValueError):
+        executors.from_spec("slurm")
+
+
+def test_reconstruct_as_local_jobs(reconstruct_tools, make_tiltseries, tmp_path: Path):
+    """Each tilt series is reconstructed by a job of its own."""
+    data = tmp_path / "data"
+    data.mkdir()
+    for name in ("TS_01", "TS_02"):
+        make_tiltseries(data, name)
+
+    result = CliRunner().invoke(
+        reconstruct,
+        ["--move", "--executor", "local:2", "--poll-interval", "0.1", str(data)],
+    )
+
+    assert result.exit_code == 0, result.output
+    for name in ("TS_01", "TS_02"):
+        log = (data / name / f"{name}_reconstruct.log").read_text()
+        assert "Finished reconstruction" in log
+        assert (data / name / f"{name}_ali_filtered_rec_bin_1.mrc").is_file()
@@ -0,0 +1,55 @@
+"""Tests for resolving SubFramePath values with a FrameIndex."""
+
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import mdocfile
+
+SUBFRAME_PATHS = [
+    "X:/session/frames/TS_01_000_0.0.tif",
+    "X:/session/frames/TS_01_001_3.0.tif",
+    "X:/session/TS_01_002_-3.0.tif",
+    "TS_01_003_6.0.tif",
+    "X:/session/frames/missing.tif",
+    "X:/other/nested/TS_01_004_-6.0.tif",
+    "X:/nested/TS_01_004_-6.0.tif",
+    "",
+]
+
+
+@pytest.fixture
+def frames_dir(tmp_path: Path):
+    """Create frames in the directory itself and in nested subdirectories."""
+    for name in [
+        "TS_01_000_0.0.tif",
+        "frames/TS_01_001_3.0.tif",
+        "TS_01_001_3.0.tif",
+        "TS_01_002_-3.0.tif",
+        "TS_01_003_6.0.tif",
+        "nested/TS_01_004_-6.0.tif",
+    ]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).touch()
+    return tmp_path
+
+
+@pytest.mark.parametrize("recursive", [False, True])
+@pytest.mark.parametrize("subframe_path", SUBFRAME_PATHS)
+def test_resolve_like_find_relative_path(frames_dir, recursive, subframe_path):
+    """The index finds the same file as probing the directory would."""
+    index = mdocfile.FrameIndex(frames_dir, recursive=recursive)
+
+    assert index.resolve(Path(subframe_path)) == mdocfile.find_relative_path(
+        frames_dir, Path(subframe_path)
+    )
+
+
+def test_resolve_without_stat(frames_dir, monkeypatch):
+    """Frames in an indexed directory are resolved without touching the disk."""
+    index = mdocfile.FrameIndex(frames_dir, recursive=True)
+
+    monkeypatch.setattr(Path, "is_file", lambda self: pytest.fail("Probed."))
+    assert index.resolve(Path("X:/session/frames/TS_01_001_3.0.tif")) == (
+        frames_dir / "frames" / "TS_01_001_3.0.tif"
+    )
@@ -0,0 +1,213 @@
+"""Tests for the GPU inventory and running AreTomo and MotionCor per GPU."""
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+from tomotools.utils import gpus, jobs, util
+from tomotools.utils.micrograph import Micrograph
+from tomotools.utils.movie import Movie
+from tomotools.utils.tiltseries import TiltSeries, align_all_with_areTomo
+
+FAKE_NVIDIA_SMI = """#!/bin/sh
+echo called >> {calls}
+echo "0, NVIDIA A100-SXM4-40GB, 40960"
+echo "1, NVIDIA A100-SXM4-40GB, 40960"
+"""
+
+FAKE_ARETOMO = """#!/bin/sh
+echo "start $*" >> {log}
+sleep 0.3
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -InMrc) in_mrc="$2" ;;
+        -OutMrc) out_mrc="$2" ;;
+    esac
+    shift
+done
+cp "$in_mrc" "$out_mrc"
+echo "end $in_mrc" >> {log}
+"""
+
+
+FAKE_MOTIONCOR = """#!/bin/sh
+echo "start $*" >> {log}
+sleep 0.2
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -InTiff) in_tiff="$2" ;;
+        -OutMrc) out_mrc="$2" ;;
+    esac
+    shift
+done
+echo "corrected $in_tiff"
+case "$in_tiff" in
+    *bad*) exit 1 ;;
+esac
+cp {template} "$out_mrc"
+echo "end $in_tiff" >> {log}
+"""
+
+
+@pytest.fixture
+def fake_gpus(make_script, tmp_path: Path, monkeypatch):
+    """Put an nvidia-smi reporting two GPUs in PATH."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    calls = tmp_path / "nvidia-smi.calls"
+    make_script(bin_dir / "nvidia-smi", FAKE_NVIDIA_SMI.format(calls=calls))
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    gpus.clear_cache()
+    yield calls
+    gpus.clear_cache()
+
+
+def test_inventory_is_cached(fake_gpus: Path):
+    """nvidia-smi is only asked once."""
+    assert gpus.inventory() == [
+        gpus.Gpu(0, "NVIDIA A100-SXM4-40GB", 40960),
+        gpus.Gpu(1, "NVIDIA A100-SXM4-40GB", 40960),
+    ]
+    assert util.num_gpus() == 2
+    assert gpus.gpu_ids() == [0, 1]
+    assert gpus.gpu_ids("1") == [1]
+    assert fake_gpus.read_text().count("called") == 1
+
+
+def test_no_nvidia_smi(tmp_path: Path, monkeypatch):
+    """Without nvidia-smi, GPU tools get their default GPU 0."""
+    monkeypatch.setenv("PATH", str(tmp_path))
+    gpus.clear_cache()
+    try:
+        assert gpus.inventory() == []
+        assert gpus.gpu_ids() == [0]
+    finally:
+        gpus.clear_cache()
+
+
+def test_pool_jobs_per_gpu():
+    """A GPU is only handed out jobs_per_gpu times at once."""
+    pool = gpus.GpuPool([0, 1], jobs_per_gpu=2)
+    assert pool.slots == 4
+    with pool.acquire() as first, pool.acquire() as second:
+        assert {first, second} == {0, 1}
+    assert pool.map(lambda item, gpu: item, range(6)) == list(range(6))
+
+
+def test_align_all_one_job_per_gpu(
+    fake_gpus: Path, make_script, make_tiltseries, tmp_path: Path, monkeypatch
+):
+    """Each AreTomo job gets a GPU of its own, and all GPUs are kept busy."""
+    log = tmp_path / "aretomo.log"
+    aretomo = make_script(tmp_path / "AreTomo", FAKE_ARETOMO.format(log=log))
+    monkeypatch.setenv("ARETOMO_EXECUTABLE", str(aretomo))
+    series = [TiltSeries(make_tiltseries(tmp_path, f"TS_{i:02d}")) for i in range(4)]
+
+    aligned = align_all_with_areTomo(
+        series, gpu=None, local=False, previous=False, do_evn_odd=False
+    )
+
+    assert [ts.path.name for ts in aligned] == [f"TS_{i:02d}_ali.mrc" for i in range(4)]
+    assert _check_one_job_per_gpu(log, "-InMrc") == {"0", "1"}
+
+
+def test_align_evn_odd_on_the_same_gpu(
+    fake_gpus: Path, make_script, make_tiltseries, tmp_path: Path, monkeypatch
+):
+    """EVN and ODD stacks are aligned one after the other on the series' GPU."""
+    # Enough workers to run EVN and ODD at once, were they run concurrently
+    monkeypatch.setattr(jobs, "_default_runner", jobs.JobRunner(workers=8))
+    log = tmp_path / "aretomo.log"
+    aretomo = make_script(tmp_path / "AreTomo", FAKE_ARETOMO.format(log=log))
+    monkeypatch.setenv("ARETOMO_EXECUTABLE", str(aretomo))
+    series = []
+    for i in range(2):
+        ts_path = make_tiltseries(tmp_path, f"TS_{i:02d}")
+        halves = [ts_path.with_name(f"{ts_path.stem}_{half}.mrc") for half in "EO"]
+        for half in halves:
+            shutil.copy(ts_path, half)
+        series.append(TiltSeries(ts_path).with_split_files(*halves))
+
+    aligned = align_all_with_areTomo(
+        series, gpu=None, local=False, previous=False, do_evn_odd=True
+    )
+
+    assert all(ts.is_split for ts in aligned)
+    assert _check_one_job_per_gpu(log, "-InMrc") == {"0", "1"}
+
+
+def _check_one_job_per_gpu(log: Path, input_flag: str) -> set[str]:
+    """Check the start/end log of a stand-in, return the GPUs it ran on."""
+    running: dict[str, str] = {}
+    busy_gpus = set()
+    most_running = 0
+    for line in log.read_text().splitlines():
+        event, *args = line.split()
+        if event == "start":
+            # Exactly one GPU, the next argument is a flag again
+            gpu, *rest = args[args.index("-Gpu") + 1 :]
+            assert not rest or rest[0].startswith("-")
+            assert gpu not in running.values()
+            running[args[args.index(input_flag) + 1]] = gpu
+            busy_gpus.add(gpu)
+            most_running = max(most_running, len(running))
+        else:
+            del running[args[0]]
+    assert most_running == len(busy_gpus)
+    return busy_gpus
+
+
+@pytest.fixture
+def fake_motioncor(make_script, tmp_path: Path, monkeypatch):
+    """Put a stand-in MotionCor in place, return its start/end log."""
+    template = tmp_path / "template.mrc"
+    with mrcfile.new(template, np.zeros((4, 4), dtype=np.float32)):
+        pass
+    log = tmp_path / "motioncor.log"
+    motioncor = make_script(
+        tmp_path / "MotionCor2", FAKE_MOTIONCOR.format(log=log, template=template)
+    )
+    monkeypatch.setenv("MOTIONCOR_EXECUTABLE", str(motioncor))
+    return log
+
+
+def _movies(directory: Path, names: list[str]) -> list[Movie]:
+    directory.mkdir()
+    movies = []
+    for name in names:
+        (directory / name).touch()
+        movies.append(Movie(directory / name))
+    return movies
+
+
+def test_motioncor_one_movie_per_gpu(fake_gpus, fake_motioncor, tmp_path: Path):
+    """Movies are spread over all GPUs and every job has its own log."""
+    movies = _movies(tmp_path / "frames", [f"TS_01_{i:03d}.tif" for i in range(6)])
+    output_dir = tmp_path / "corrected"
+
+    micrographs = Micrograph.from_movies(movies, output_dir)
+
+    assert [mic.path.name for mic in micrographs] == [
+        f"TS_01_{i:03d}.mrc" for i in range(6)
+    ]
+    assert _check_one_job_per_gpu(fake_motioncor, "-InTiff") == {"0", "1"}
+    combined = (output_dir / "motioncor2.log").read_text().splitlines()
+    assert combined == [f"corrected {movie.path}" for movie in movies]
+    assert not (output_dir / "motioncor2_temp").exists()
+
+
+def test_motioncor_failure(fake_gpus, fake_motioncor, tmp_path: Path):
+    """A failed MotionCor run raises and its log is kept."""
+    movies = _movies(tmp_path / "frames", ["TS_01_000.tif", "TS_01_bad.tif"])
+    output_dir = tmp_path / "corrected"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        Micrograph.from_movies(movies, output_dir)
+
+    log = output_dir / "motioncor2_temp" / "logs" / "0001_TS_01_bad.log"
+    assert log.read_text().strip() == f"corrected {movies[1].path}"
@@ -0,0 +1,182 @@
+"""Tests for the job runner in utils.jobs."""
+
+import subprocess
+import threading
+import time
+
+import pytest
+
+from tomotools.utils import jobs
+from tomotools.utils.jobs import JobRunner
+
+
+def test_submit_returns_future_with_thread_budget():
+    """Jobs run in the background and get their thread budget via the env."""
+    with JobRunner(workers=2, cpus=4) as runner:
+        futures = [
+            runner.submit(
+                ["sh", "-c", "sleep 0.3; echo $OMP_NUM_THREADS $IMOD_PROCESSORS"],
+                threads=2,
+                capture_output=True,
+                text=True,
+            )
+            for _ in range(2)
+        ]
+        start = time.monotonic()
+        results = [future.result() for future in futures]
+
+    assert time.monotonic() - start < 0.55
+    assert [result.stdout.strip() for result in results] == ["2 2", "2 2"]
+
+
+def test_failed_job_raises():
+    """With check, the future raises; without, the return code is kept."""
+    with JobRunner(workers=1) as runner:
+        with pytest.raises(subprocess.CalledProcessError):
+            runner.run(["sh", "-c", "exit 3"])
+        assert runner.run(["sh", "-c", "exit 3"], check=False).returncode == 3
+
+    assert [record.returncode for record in runner.records] == [3, 3]
+
+
+def test_log_files(tmp_path):
+    """Output that isn't captured goes to one log file per job."""
+    with JobRunner(workers=1, log_dir=tmp_path / "logs") as runner:
+        runner.run(["sh", "-c", "echo out; echo err >&2"], name="echo test")
+        runner.run(["sh", "-c", "echo captured"], capture_output=True)
+
+    (record, captured) = runner.records
+    assert record.log == tmp_path / "logs" / "0001_echo_test.log"
+    lines = record.log.read_text().splitlines()
+    assert lines[0].startswith("$ sh -c")
+    assert sorted(lines[1:]) == ["err", "out"]
+    assert captured.log is None
+
+
+def test_log_files_next_to_outputs(tmp_path, monkeypatch, capsys):
+    """Without a log directory, logs go next to the output of each job."""
+    monkeypatch.delenv("TOMOTOOLS_LOG_DIR")
+    output = tmp_path / "output"
+    output.mkdir()
+    with JobRunner(workers=1) as runner:
+        runner.run(["sh", "-c", 'echo out > "$0"', output / "out.txt"])
+        runner.run(["sh", "-c", "exit 1"], cwd=tmp_path, check=False)
+        with pytest.raises(subprocess.CalledProcessError):
+            runner.run(["sh", "-c", "echo err >&2; exit 1"], cwd=tmp_path)
+
+    logs = [record.log for record in runner.records]
+    assert logs == [
+        output / "tomotools_logs" / runner.run_name / "0001_sh.log",
+        tmp_path / "tomotools_logs" / runner.run_name / "0002_sh.log",
+        tmp_path / "tomotools_logs" / runner.run_name / "0003_sh.log",
+    ]
+    assert logs[2].read_text().splitlines()[1:] == ["err"]
+    assert f"sh failed, see {logs[2]}" in capsys.readouterr().out
+
+
+def test_run_all_and_summary():
+    """run_all splits its budget and every job is timed."""
+    with JobRunner(workers=2, cpus=4) as runner:
+        results = runner.run_all(
+            [["sh", "-c", "sleep 0.2; echo $IMOD_PROCESSORS"]] * 2,
+            capture_output=True,
+            text=True,
+        )
+
+    assert [result.stdout.strip() for result in results] == ["2", "2"]
+    assert all(record.duration >= 0.2 for record in runner.records)
+    assert runner.summary().startswith("sh: 2 jobs,")
+
+
+def test_run_all_is_bounded_by_workers():
+    """run_all doesn't run more commands at once than the runner has workers."""
+    with JobRunner(workers=1, cpus=4) as runner:
+        start = time.monotonic()
+        results = runner.run_all(
+            [["sh", "-c", "sleep 0.2; echo $IMOD_PROCESSORS"]] * 2,
+            capture_output=True,
+            text=True,
+        )
+
+    assert time.monotonic() - start >= 0.4
+    assert [result.stdout.strip() for result in results] == ["4", "4"]
+
+
+@pytest.mark.parametrize("bounded, at_once", [(True, 1), (False, 2)])
+def test_run_in_threads(bounded: bool, at_once: int):
+    """Jobs run by concurrent callers wait for a worker, unless unbounded."""
+    with JobRunner(workers=1) as runner:
+        start = time.monotonic()
+        threads = [
+            threading.Thread(
+                target=runner.run, args=(["sleep", "0.3"],), kwargs={"bounded": bounded}
+            )
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert 0.6 / at_once <= time.monotonic() - start < 0.3 + 0.6 / at_once
+
+
+def test_pipelined_overlaps_steps():
+    """The next item is produced while the current one is consumed."""
+    events = []
+
+    def produce(item):
+        events.append(f"produce {item}")
+        time.sleep(0.1)
+        return item * 10
+
+    def consume(item, product):
+        time.sleep(0.2)
+        events.append(f"consumed {item}")
+        return product + 1
+
+    results = jobs.pipelined(range(3), produce, consume)
+
+    assert results == [1, 11, 21]
+    assert events.index("produce 1") < events.index("consumed 0")
+    assert events.index("produce 2") < events.index("consumed 1")
+
+
+def test_pipelined_stops_on_error():
+    """A failing step stops the production of further items."""
+    produced = []
+
+    def produce(item):
+        produced.append(item)
+        if item == 1:
+            raise ValueError("broken")
+        return item
+
+    with pytest.raises(ValueError, match="broken"):
+        jobs.pipelined(range(10), produce, lambda item, product: product)
+    assert produced == [0, 1]
+
+    with pytest.raises(ZeroDivisionError):
+        jobs.pipelined(range(10), produce, lambda item, product: 1 / 0, depth=1)
+    assert len(produced) < 6
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_pipelined_depth(depth: int):
+    """No more than depth items are produced ahead of the one consumed."""
+    produced, consumed, ahead = [], [], []
+
+    def produce(item):
+        produced.append(item)
+        # Let the consumer note the item it just took
+        time.sleep(0.005)
+        ahead.append(len(produced) - len(consumed))
+        return item
+
+    def consume(item, product):
+        consumed.append(item)
+        time.sleep(0.05)
+        return product
+
+    assert jobs.pipelined(range(6), produce, consume, depth) == list(range(6))
+    assert max(ahead) == depth
@@ -0,0 +1,83 @@
+"""Tests for session manifests."""
+
+import os
+import time
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+from tomotools.utils import discovery, manifest, mrcheader
+from tomotools.utils.tiltseries import convert_input_to_TiltSeries
+
+
+def _age(directory: Path):
+    """Pretend the directory was last modified a minute ago."""
+    past = time.time_ns() - 60_000_000_000
+    os.utime(directory, ns=(past, past))
+
+
+@pytest.fixture
+def session(tmp_path: Path):
+    """Create a session with one split tilt series and a saved manifest."""
+    for name in ["TS_01.mrc", "TS_01_EVN.mrc", "TS_01_ODD.mrc"]:
+        mrcfile.new(tmp_path / name, np.zeros((3, 4, 4), dtype=np.float32)).close()
+    (tmp_path / "TS_01.mrc.mdoc").touch()
+    discovery.clear_cache()
+    mrcheader.clear_cache()
+
+    assert convert_input_to_TiltSeries([tmp_path])[0].dimZYX == (3, 4, 4)
+    manifest.save(tmp_path)
+    _age(tmp_path)
+    manifest.save(tmp_path)
+
+    discovery.clear_cache()
+    mrcheader.clear_cache()
+    return tmp_path
+
+
+def test_load_unchanged(session, monkeypatch):
+    """An unchanged session is loaded without scanning or reading headers."""
+    assert manifest.load(session)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Session was scanned.")
+
+    monkeypatch.setattr(os, "scandir", fail)
+    monkeypatch.setattr(mrcheader, "_parse", fail)
+    ts = convert_input_to_TiltSeries([session])[0]
+    assert ts.is_split
+    assert ts.dimZYX == (3, 4, 4)
+
+
+def test_load_changed(session):
+    """A changed directory is scanned again, changed files are read again."""
+    (session / "TS_02.mrc.mdoc").touch()
+    mrcfile.new(
+        session / "TS_01.mrc", np.zeros((5, 4, 4), dtype=np.float32), overwrite=True
+    ).close()
+
+    assert not manifest.load(session)
+    assert len(discovery.index(session).tiltseries_mdocs()) == 2
+    assert mrcheader.read_header(session / "TS_01.mrc").nz == 5
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "{",
+        "[]",
+        '{"version": 1}',
+        '{"version": 1, "headers": [], "mtime": 0, "listed": 0, "names": []}',
+        '{"version": 1, "headers": {"TS_01.mrc": [[0, 0], {"nx": 4}]}, '
+        '"mtime": 0, "listed": 0, "names": []}',
+        '{"version": 1, "headers": {}, "mtime": "new", "listed": 0, "names": []}',
+    ],
+)
+def test_load_corrupt(session, content: str):
+    """A corrupt manifest is ignored."""
+    (session / manifest.MANIFEST_NAME).write_text(content)
+
+    assert not manifest.load(session)
+    assert len(discovery.index(session).tiltseries_mdocs()) == 1
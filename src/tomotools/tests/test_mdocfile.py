@@ -0,0 +1,310 @@
+"""Tests for reading and writing mdoc files."""
+
+import math
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import mdocfile
+
+
+@pytest.mark.parametrize(
+    "field, expected",
+    [
+        ("42", 42),
+        ("-3", -3),
+        ("2.14", 2.14),
+        (".5", 0.5),
+        ("-1.5e-3", -1.5e-3),
+        ("1_000", 1000),
+        ("1.5 -2 3", [1.5, -2, 3]),
+        ("123.4 nan", [123.4, math.nan]),
+        ("08-Feb-2024  13:11:07", "08-Feb-2024  13:11:07"),
+        ("X:\\frames\\TS_001_0.0.tif", "X:\\frames\\TS_001_0.0.tif"),
+        ("1_", "1_"),
+        ("Camera Setup", "Camera Setup"),
+        ("1e", "1e"),
+    ],
+)
+def test_convert_value_field(field, expected):
+    """Values are converted exactly like int() and float() would."""
+    value = mdocfile._convert_value_field(field)
+
+    assert type(value) is type(expected)
+    if isinstance(expected, list):
+        assert [type(v) for v in value] == [type(v) for v in expected]
+        assert value == pytest.approx(expected, nan_ok=True)
+    else:
+        assert value == expected
+
+
+def test_roundtrip(tmp_path: Path):
+    """A written mdoc is read back unchanged, sections don't share lists."""
+    mdoc = {
+        "PixelSpacing": 2.14,
+        "ImageSize": [5760, 4092],
+        "titles": ["SerialEM: Digitized", "Tilt axis angle = -84.7, binning = 1"],
+        "sections": [
+            {"TiltAngle": 0.0, "StagePosition": [1.5, -2.5], "Note": "a = b"},
+            {"TiltAngle": 3.0, "StagePosition": [1.5, -2.5], "Note": "a = b"},
+        ],
+        "framesets": [],
+    }
+    file = tmp_path / "TS_01.mrc.mdoc"
+
+    mdocfile.write(mdoc, file)
+    result = mdocfile.read(file)
+
+    assert result["path"] == file
+    assert result["PixelSpacing"] == mdoc["PixelSpacing"]
+    assert result["ImageSize"] == mdoc["ImageSize"]
+    assert len(result["titles"]) == 2
+    assert result["sections"] == mdoc["sections"]
+    assert (
+        result["sections"][0]["StagePosition"]
+        is not (result["sections"][1]["StagePosition"])
+    )
+    assert list(tmp_path.iterdir()) == [file]
+
+
+def test_write_replaces(tmp_path: Path):
+    """Writing replaces an existing file instead of writing into it."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    file.write_text("old")
+    link = tmp_path / "hardlink.mdoc"
+    link.hardlink_to(file)
+
+    mdocfile.write({"titles": [], "sections": [], "framesets": []}, file)
+
+    assert link.read_text() == "old"
+    assert file.read_text() == "\n"
+
+
+def test_write_respects_umask(tmp_path: Path):
+    """Written mdocs get the permissions open() would give them."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    umask = os.umask(0o027)
+    try:
+        mdocfile.write({"titles": [], "sections": [], "framesets": []}, file)
+    finally:
+        os.umask(umask)
+
+    assert file.stat().st_mode & 0o777 == 0o640
+
+
+MDOC = """PixelSpacing = 2.14
+ImageFile = TS_01.mrc
+Montage = 0
+
+[T = SerialEM: Digitized on EMBL Krios]
+
+[ZValue = 0]
+TiltAngle = 0.01
+SubFramePath = X:\\frames\\TS_01_000_0.0.tif
+
+[ZValue = 1]
+ExposureDose = 3
+TiltAngle = 3.02
+
+[ZValue = 2]
+TiltAngle = -2.98
+[FrameSet = 0]
+TiltAngle = 50
+"""
+
+
+def test_lazy_mdoc(tmp_path: Path):
+    """LazyMdoc gives the same values as read, but parses sections only on demand."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    file.write_text(MDOC)
+
+    lazy = mdocfile.LazyMdoc(file)
+
+    assert lazy["PixelSpacing"] == 2.14
+    assert lazy.get("Montage") == 0
+    assert lazy.n_sections == 3
+    assert lazy.tilt_angles() == [0.01, 3.02, -2.98]
+    assert lazy._mdoc is None
+    assert lazy.read() == mdocfile.read(file)
+    assert lazy.tilt_angles() == [0.01, 3.02, -2.98]
+
+
+def _sections():
+    """Sections in order of tilt angle, acquired dose-symmetrically from 0."""
+    return [
+        {"TiltAngle": -3.0, "ExposureDose": 2.0, "DateTime": "08-Feb-24  13:02:00"},
+        {"TiltAngle": 0.0, "ExposureDose": 1.0, "DateTime": "08-Feb-24  13:01:00"},
+        {
+            "TiltAngle": 3.0,
+            "ExposureDose": 3.0,
+            "DateTime": "08-Feb-24  13:03:00",
+            "ImageShift": [0.5, -0.5],
+            "NumSubFrames": 10,
+        },
+    ]
+
+
+def test_sections_table_roundtrip():
+    """Converting to a table and back keeps types and leaves out missing keys."""
+    sections = _sections()
+
+    table = mdocfile.sections_table({"sections": sections})
+    result = mdocfile.table_to_sections(table)
+
+    assert result == sections
+    assert type(result[2]["NumSubFrames"]) is int
+    assert result[2]["ImageShift"] is not sections[2]["ImageShift"]
+
+
+def test_sections_table_mixed_types():
+    """Ints in columns with floats stay ints, genuine NaN values are kept."""
+    sections = [
+        {"TiltAngle": -4, "Defocus": math.nan},
+        {"TiltAngle": 2.5, "Defocus": -3.1, "Note": "x"},
+    ]
+
+    result = mdocfile.table_to_sections(mdocfile.sections_table({"sections": sections}))
+
+    assert type(result[0]["TiltAngle"]) is int
+    assert mdocfile._format_key_value("TiltAngle", result[0]["TiltAngle"]) == (
+        "TiltAngle = -4\n"
+    )
+    assert math.isnan(result[0]["Defocus"])
+    assert "Note" not in result[0]
+    assert result[1] == sections[1]
+
+
+def test_insert_prior_dose():
+    """Prior dose is accumulated in order of acquisition."""
+    mdoc = mdocfile.insert_prior_dose({"sections": _sections()})
+
+    assert [s["TiltAngle"] for s in mdoc["sections"]] == [-3.0, 0.0, 3.0]
+    assert [s["PriorRecordDose"] for s in mdoc["sections"]] == [1.0, 0.0, 3.0]
+    assert mdocfile.get_start_tilt(mdoc) == 0.0
+
+
+def test_insert_prior_dose_keeps_types():
+    """Prior doses are summed like the doses are written, the first one is 0."""
+    sections = [
+        {"TiltAngle": angle, "ExposureDose": dose, "DateTime": f"12:00:0{i}"}
+        for i, (angle, dose) in enumerate([(0, 3.0), (3, 2.5), (-3, 3.0)])
+    ]
+    mdoc = mdocfile.insert_prior_dose({"sections": sections})
+
+    prior = [s["PriorRecordDose"] for s in mdoc["sections"]]
+    assert prior == [5.5, 0, 3]
+    assert [type(dose) for dose in prior] == [float, int, float]
+    assert mdocfile._format_key_value("PriorRecordDose", prior[1]) == (
+        "PriorRecordDose = 0\n"
+    )
+
+
+@pytest.fixture
+def aged_mdoc(tmp_path: Path):
+    """Write MDOC and pretend it was last modified a minute ago."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    file.write_text(MDOC)
+    past = time.time_ns() - 60_000_000_000
+    os.utime(file, ns=(past, past))
+    mdocfile.clear_cache()
+    return file
+
+
+def test_read_cached(aged_mdoc: Path, monkeypatch):
+    """Cached mdocs are copies, changed files are parsed again."""
+    first = mdocfile.read(aged_mdoc)
+    first["sections"][0]["TiltAngle"] = 99
+
+    monkeypatch.setattr(mdocfile, "_parse", lambda *args: pytest.fail("Parsed."))
+    assert mdocfile.read(aged_mdoc)["sections"][0]["TiltAngle"] == 0.01
+    monkeypatch.undo()
+
+    aged_mdoc.write_text(MDOC.replace("0.01", "0.02"))
+    assert mdocfile.read(aged_mdoc)["sections"][0]["TiltAngle"] == 0.02
+
+
+def test_read_stored(aged_mdoc: Path, tmp_path: Path, monkeypatch):
+    """With TOMOTOOLS_MDOC_CACHE set, parsed mdocs are reused across runs."""
+    monkeypatch.setenv("TOMOTOOLS_MDOC_CACHE", str(tmp_path / "cache"))
+    expected = mdocfile.read(aged_mdoc)
+    mdocfile.clear_cache()
+    assert [file.suffix for file in (tmp_path / "cache").iterdir()] == [".json"]
+
+    monkeypatch.setattr(mdocfile, "_parse", lambda *args: pytest.fail("Parsed."))
+    assert mdocfile.read(aged_mdoc) == expected
+
+
+@pytest.mark.parametrize("content", ["{", "[]", '{"key": 1}', "\x80\x04."])
+def test_read_damaged_store(aged_mdoc: Path, tmp_path: Path, monkeypatch, content):
+    """Damaged files in TOMOTOOLS_MDOC_CACHE are parsed again."""
+    monkeypatch.setenv("TOMOTOOLS_MDOC_CACHE", str(tmp_path / "cache"))
+    expected = mdocfile.read(aged_mdoc)
+    mdocfile.clear_cache()
+    for file in (tmp_path / "cache").iterdir():
+        file.write_text(content)
+
+    assert mdocfile.read(aged_mdoc) == expected
+
+
+def test_mdoc_tail(tmp_path: Path):
+    """Appended sections are returned once they are complete."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    head, first, second, third = MDOC.split("\n[ZValue")
+    tail = mdocfile.MdocTail(file)
+
+    assert tail.poll() == []
+    file.write_text(head + "\n[ZValue" + first[:20])
+    assert tail.poll() == []
+
+    with open(file, "a") as f:
+        f.write(first[20:] + "\n[ZValue" + second + "\n[ZValue")
+    events = tail.poll()
+    assert [(event.kind, event.index) for event in events] == [
+        ("section", 0),
+        ("section", 1),
+    ]
+    assert events[1].data["TiltAngle"] == 3.02
+    assert tail.mdoc["PixelSpacing"] == 2.14
+
+    with open(file, "a") as f:
+        f.write(third)
+    # The frameset completes the last section, but nothing completes the frameset
+    assert [event.kind for event in tail.poll()] == ["section"]
+    assert [event.kind for event in tail.finish()] == ["frameset"]
+    assert tail.mdoc == mdocfile.read(file)
+
+
+def test_mdoc_tail_file_order(tmp_path: Path):
+    """Interleaved sections and framesets are returned in file order."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    file.write_text(
+        "[ZValue = 0]\nTiltAngle = 0\n[FrameSet = 0]\nTiltAngle = 0\n"
+        "[ZValue = 1]\nTiltAngle = 3\n\n"
+    )
+
+    events = mdocfile.MdocTail(file).poll()
+
+    assert [(event.kind, event.index) for event in events] == [
+        ("section", 0),
+        ("frameset", 0),
+        ("section", 1),
+    ]
+
+
+def test_mdoc_tail_replaced(tmp_path: Path):
+    """A file replaced by a new one, even a longer one, is read from the start."""
+    file = tmp_path / "TS_01.mrc.mdoc"
+    file.write_text("[ZValue = 0]\nTiltAngle = 0\n\n")
+    tail = mdocfile.MdocTail(file)
+    assert [event.data["TiltAngle"] for event in tail.poll()] == [0]
+
+    replacement = tmp_path / "new.mdoc"
+    replacement.write_text(
+        "[ZValue = 0]\nTiltAngle = 10\n\n[ZValue = 1]\nTiltAngle = 13\n\n"
+    )
+    os.replace(replacement, file)
+
+    assert [event.data["TiltAngle"] for event in tail.poll()] == [10, 13]
+    assert len(tail.mdoc["sections"]) == 2
@@ -0,0 +1,58 @@
+"""Tests for lazily read per-movie mdocs."""
+
+from pathlib import Path
+
+import pytest
+
+from tomotools.utils import mdocfile
+from tomotools.utils.micrograph import Micrograph
+from tomotools.utils.movie import Movie
+
+
+@pytest.fixture
+def movies(tmp_path: Path):
+    """Create five movies, all but the last with an mdoc sidecar."""
+    movies = []
+    for i in range(5):
+        movie = tmp_path / f"TS_01_{i:03d}.tif"
+        movie.touch()
+        if i < 4:
+            Path(f"{movie}.mdoc").write_text(
+                f"[FrameSet = 0]\nTiltAngle = {3 * i}\nGainReference = gain.dm4\n"
+            )
+        movies.append(Movie(movie, 3.0 * i))
+    return movies
+
+
+def test_mdoc_read_lazily(movies, monkeypatch):
+    """The mdoc is only read on first access, changes to it are kept."""
+    calls = []
+    read = mdocfile.read_sidecars
+    monkeypatch.setattr(
+        mdocfile, "read_sidecars", lambda files: calls.append(files) or read(files)
+    )
+    movie = Movie(movies[1].path)
+    assert calls == []
+
+    movie.mdoc["framesets"][0]["Binning"] = 2
+
+    assert movie.mdoc["framesets"][0]["Binning"] == 2
+    assert len(calls) == 1
+
+
+def test_read_mdocs(movies):
+    """All mdocs are read at once, missing ones are None."""
+    Movie.read_mdocs(movies)
+
+    assert [movie.mdoc is None for movie in movies] == [False] * 4 + [True]
+    assert movies[3].mdoc["framesets"][0]["TiltAngle"] == 9
+
+
+def test_micrograph_read_mdocs(movies):
+    """Micrographs read their mdocs the same way."""
+    micrographs = [Micrograph(movie.path) for movie in movies]
+
+    Micrograph.read_mdocs(micrographs)
+
+    assert micrographs[0].mdoc["framesets"][0]["GainReference"] == "gain.dm4"
+    assert micrographs[4].mdoc is None
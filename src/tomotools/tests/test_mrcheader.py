@@ -0,0 +1,64 @@
+"""Tests for the cached mrc header reader."""
+
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+from tomotools.utils import mrcheader
+from tomotools.utils.tiltseries import TiltSeries
+
+
+@pytest.fixture
+def stack(tmp_path: Path):
+    """Create a small stack with a SerialEM-style tilt axis label."""
+    file = tmp_path / "stack.mrc"
+    with mrcfile.new(file, np.zeros((3, 8, 6), dtype=np.float32)) as mrc:
+        mrc.voxel_size = 2.5
+        mrc.header.label[1] = b"Tilt axis angle = -84.7, binning = 1"
+        mrc.header.nlabl = 2
+    mrcheader.clear_cache()
+    return file
+
+
+def test_read_header(stack):
+    """Values match those read by mrcfile."""
+    header = mrcheader.read_header(stack)
+
+    with mrcfile.open(stack) as mrc:
+        assert header.dimZYX == mrc.data.shape
+        assert header.mode == mrc.header.mode
+        assert header.angpix == pytest.approx(float(mrc.voxel_size.x))
+    assert header.axis_angle == pytest.approx(-84.7)
+
+
+def test_read_header_cached(stack):
+    """The header is read once, and again once the file changes."""
+    first = mrcheader.read_header(stack)
+    assert mrcheader.read_header(stack) is first
+
+    with mrcfile.new(stack, np.zeros((5, 8, 6), dtype=np.float32), overwrite=True):
+        pass
+
+    assert mrcheader.read_header(stack).nz == 5
+
+
+def test_tiltseries_axis_angle(stack):
+    """Updating the tilt axis angle invalidates the cached header."""
+    ts = TiltSeries(stack)
+    assert ts.axis_angle == pytest.approx(-84.7)
+
+    ts._update_axis_angle(85.3)
+
+    assert ts.axis_angle == pytest.approx(85.3)
+    assert ts.dimZYX == (3, 8, 6)
+
+
+def test_not_mrc(tmp_path: Path):
+    """Files that aren't mrc files raise ValueError."""
+    file = tmp_path / "text.mrc"
+    file.write_bytes(b"x" * 2048)
+
+    with pytest.raises(ValueError):
+        mrcheader.read_header(file)
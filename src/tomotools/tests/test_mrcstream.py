@@ -0,0 +1,78 @@
+"""Tests for chunked reading and writing of mrc files."""
+
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+from tomotools.utils import mrcstream
+from tomotools.utils.tomogram import Tomogram
+
+
+@pytest.fixture
+def volume(tmp_path: Path):
+    """Create a 10-slice volume where every slice is filled with its index."""
+    data = np.broadcast_to(
+        np.arange(10, dtype=np.float32)[:, None, None], (10, 8, 6)
+    ).copy()
+    file = tmp_path / "volume.mrc"
+    mrcfile.new(file, data).close()
+    return file, data
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 3])
+def test_iter_chunks(volume, prefetch):
+    """Chunks cover the whole file in order, the last chunk may be smaller."""
+    file, data = volume
+
+    chunks = list(mrcstream.iter_chunks(file, chunk_size=4, prefetch=prefetch))
+
+    assert [start for start, _ in chunks] == [0, 4, 8]
+    assert [chunk.shape[0] for _, chunk in chunks] == [4, 4, 2]
+    if prefetch > 0:
+        assert np.array_equal(np.concatenate([chunk for _, chunk in chunks]), data)
+
+
+def test_iter_chunks_early_stop(volume):
+    """Stopping the iteration early stops the read-ahead thread."""
+    file, _ = volume
+
+    for start, chunk in mrcstream.iter_chunks(file, chunk_size=1, prefetch=1):
+        if start == 2:
+            break
+
+    assert chunk[0, 0, 0] == 2
+
+
+def test_iter_slabs(volume):
+    """Tomogram.iter_slabs yields z-slabs."""
+    file, data = volume
+
+    slabs = [slab for _, slab in Tomogram(file).iter_slabs(slab_size=5)]
+
+    assert np.array_equal(slabs[1], data[5:])
+
+
+def test_chunk_writer(volume, tmp_path: Path):
+    """Chunks written with ChunkWriter are written in order, stats are updated."""
+    file, data = volume
+    out_file = tmp_path / "copy.mrc"
+
+    with mrcstream.ChunkWriter(out_file, data.shape) as writer:
+        for _, chunk in mrcstream.iter_chunks(file, chunk_size=3, prefetch=0):
+            writer.write(chunk * 2)
+        writer.mrc.voxel_size = 3.0
+
+    with mrcfile.open(out_file) as mrc:
+        assert np.array_equal(mrc.data, data * 2)
+        assert mrc.header.dmax == 18
+        assert mrc.voxel_size.x == pytest.approx(3.0)
+
+
+def test_chunk_writer_too_many_sections(tmp_path: Path):
+    """Writing more sections than the file has raises."""
+    with mrcstream.ChunkWriter(tmp_path / "small.mrc", (2, 4, 4)) as writer:
+        writer.write(np.zeros((2, 4, 4), dtype=np.float32))
+        with pytest.raises(IndexError):
+            writer.write(np.zeros((4, 4), dtype=np.float32))
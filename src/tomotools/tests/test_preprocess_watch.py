@@ -0,0 +1,249 @@
+"""Tests for preprocess --watch, with stand-ins for MotionCor and newstack."""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from tomotools.commands.preprocessing_reconstruction import preprocess
+from tomotools.utils import gpus
+
+FAKE_MOTIONCOR = """#!/bin/sh
+echo "$*" >> {log}
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -OutMrc) out_mrc="$2" ;;
+    esac
+    shift
+done
+cp {template} "$out_mrc"
+"""
+
+FAKE_NEWSTACK = f"""#!{sys.executable}
+import sys
+
+import mrcfile
+import numpy as np
+
+*inputs, output = [arg for arg in sys.argv[1:] if arg != "-quiet"]
+data = np.stack([mrcfile.read(file) for file in inputs])
+with mrcfile.new(output, data, overwrite=True):
+    pass
+"""
+
+HEADER = """PixelSpacing = 2.0
+ImageFile = TS_01.mrc
+ImageSize = 8 8
+DataMode = 1
+
+[T = SerialEM: test]
+
+"""
+
+SECTION = """[ZValue = {index}]
+TiltAngle = {angle}
+ExposureDose = 3
+PixelSpacing = 2.0
+SubFramePath = D:\\data\\TS_01_{index:03d}.tif
+DateTime = 19-Oct-26  12:00:{index:02d}
+
+"""
+
+
+@pytest.fixture
+def tools(make_script, tmp_path: Path, monkeypatch):
+    """Put stand-ins for MotionCor and newstack in place, return MotionCor's log."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    template = tmp_path / "template.mrc"
+    with mrcfile.new(template, np.ones((4, 4), dtype=np.float32)):
+        pass
+    log = tmp_path / "motioncor.log"
+    motioncor = make_script(
+        bin_dir / "MotionCor2", FAKE_MOTIONCOR.format(log=log, template=template)
+    )
+    make_script(bin_dir / "newstack", FAKE_NEWSTACK)
+    monkeypatch.setenv("MOTIONCOR_EXECUTABLE", str(motioncor))
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    gpus.clear_cache()
+    yield log
+    gpus.clear_cache()
+
+
+def _acquire(directory: Path, angles: list[int]):
+    """Write frames and mdoc sections like SerialEM, one tilt at a time."""
+    mdoc = directory / "TS_01.mrc.mdoc"
+    for index, angle in enumerate(angles):
+        time.sleep(0.3)
+        frame = directory / f"TS_01_{index:03d}.tif"
+        frame.touch()
+        # Written a while ago, so it isn't waited for
+        os.utime(frame, (time.time() - 10, time.time() - 10))
+        with open(mdoc, "a") as file:
+            file.write(SECTION.format(index=index, angle=angle))
+
+
+def test_watch_stacks_acquired_series(tools: Path, tmp_path: Path):
+    """Tilts are corrected during acquisition, the stack once it is complete."""
+    acquisition_dir = tmp_path / "acquisition"
+    acquisition_dir.mkdir()
+    output_dir = tmp_path / "output"
+    (acquisition_dir / "TS_01.mrc.mdoc").write_text(HEADER)
+    writer = threading.Thread(target=_acquire, args=(acquisition_dir, [0, 3, -3]))
+    writer.start()
+
+    result = CliRunner().invoke(
+        preprocess,
+        [
+            "--watch",
+            "--nosplitsum",
+            "--poll-interval",
+            "0.1",
+            "--idle-timeout",
+            "1",
+            "--watch-timeout",
+            "0.5",
+            str(acquisition_dir),
+            str(output_dir),
+        ],
+    )
+    writer.join()
+
+    assert result.exit_code == 0, result.output
+    with mrcfile.open(output_dir / "TS_01.mrc") as mrc:
+        assert mrc.data.shape == (3, 4, 4)
+        assert mrc.voxel_size.x == pytest.approx(4.0)
+    assert (output_dir / "TS_01.mrc.mdoc").is_file()
+    assert not (output_dir / "frames_corrected_TS_01").exists()
+
+    # One MotionCor job per tilt, each on a single GPU
+    calls = tools.read_text().splitlines()
+    assert len(calls) == 3
+    assert all(call.split().count("-Gpu") == 1 for call in calls)
+
+
+def test_watch_skips_stacked_series(tools: Path, tmp_path: Path):
+    """Tilt series stacked before aren't processed again."""
+    acquisition_dir = tmp_path / "acquisition"
+    acquisition_dir.mkdir()
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    (acquisition_dir / "TS_01.mrc.mdoc").write_text(
+        HEADER + "".join(SECTION.format(index=i, angle=3 * i) for i in range(3))
+    )
+    (output_dir / "TS_01.mrc").touch()
+
+    result = CliRunner().invoke(
+        preprocess,
+        [
+            "--watch",
+            "--poll-interval",
+            "0.1",
+            "--watch-timeout",
+            "0.3",
+            str(acquisition_dir),
+            str(output_dir),
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert not tools.exists()
+
+
+def test_watch_converts_gain_once(tools: Path, make_script, tmp_path: Path):
+    """The gain is converted once per tilt series, not once per tilt."""
+    acquisition_dir = tmp_path / "acquisition"
+    acquisition_dir.mkdir()
+    output_dir = tmp_path / "output"
+    gain = tmp_path / "gain.tif"
+    gain.touch()
+    conversions = tmp_path / "tif2mrc.log"
+    make_script(
+        tools.parent / "bin" / "tif2mrc",
+        f'#!/bin/sh\necho "$*" >> {conversions}\ntouch "$2"\n',
+    )
+    (acquisition_dir / "TS_01.mrc.mdoc").write_text(
+        HEADER + "".join(SECTION.format(index=i, angle=3 * i) for i in range(3))
+    )
+    for index in range(3):
+        frame = acquisition_dir / f"TS_01_{index:03d}.tif"
+        frame.touch()
+        os.utime(frame, (time.time() - 10, time.time() - 10))
+
+    result = CliRunner().invoke(
+        preprocess,
+        [
+            "--watch",
+            "--nosplitsum",
+            "--gainref",
+            str(gain),
+            "--poll-interval",
+            "0.1",
+            "--idle-timeout",
+            "0.3",
+            "--watch-timeout",
+            "0.3",
+            str(acquisition_dir),
+            str(output_dir),
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert len(conversions.read_text().splitlines()) == 1
+    calls = tools.read_text().splitlines()
+    assert len(calls) == 3
+    assert all("-Gain" in call for call in calls)
+
+
+def test_watch_skips_failed_series(
+    tools: Path, make_script, tmp_path: Path, monkeypatch
+):
+    """A tilt series that fails is reported, the others are still processed."""
+    motioncor = os.environ["MOTIONCOR_EXECUTABLE"]
+    failing = make_script(
+        tmp_path / "failing_motioncor",
+        f'#!/bin/sh\ncase "$*" in *TS_01_*) exit 1 ;; esac\nexec {motioncor} "$@"\n',
+    )
+    monkeypatch.setenv("MOTIONCOR_EXECUTABLE", str(failing))
+    acquisition_dir = tmp_path / "acquisition"
+    acquisition_dir.mkdir()
+    output_dir = tmp_path / "output"
+    for name in ("TS_01", "TS_02"):
+        (acquisition_dir / f"{name}.mrc.mdoc").write_text(
+            HEADER
+            + "".join(
+                SECTION.format(index=i, angle=3 * i).replace("TS_01", name)
+                for i in range(3)
+            )
+        )
+        for index in range(3):
+            frame = acquisition_dir / f"{name}_{index:03d}.tif"
+            frame.touch()
+            os.utime(frame, (time.time() - 10, time.time() - 10))
+
+    result = CliRunner().invoke(
+        preprocess,
+        [
+            "--watch",
+            "--nosplitsum",
+            "--poll-interval",
+            "0.1",
+            "--idle-timeout",
+            "0.3",
+            "--watch-timeout",
+            "0.3",
+            str(acquisition_dir),
+            str(output_dir),
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Processing TS_01.mrc.mdoc failed" in result.output
+    assert not (output_dir / "TS_01.mrc").exists()
+    assert (output_dir / "TS_02.mrc").is_file()
@@ -0,0 +1,69 @@
+"""Tests for staging tilt series on local scratch space in utils.scratch."""
+
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from tomotools.commands.preprocessing_reconstruction import reconstruct
+from tomotools.utils import checkpoint, scratch
+
+
+def test_only_products_are_copied_back(tmp_path: Path):
+    """Inputs that weren't changed in the workspace stay where they are."""
+    data = tmp_path / "data"
+    data.mkdir()
+    stack = data / "TS_01.mrc"
+    stack.write_bytes(b"stack")
+    tlt = data / "TS_01.tlt"
+    tlt.write_text("0\n")
+
+    space = scratch.Scratch(tmp_path / "scratch")
+    workspace = space.stage_in("TS_01.mrc", [stack, tlt])
+    assert sorted(file.name for file in workspace.iterdir()) == [
+        "TS_01.mrc",
+        "TS_01.tlt",
+    ]
+    staged = checkpoint.stamp(workspace.iterdir())
+
+    (workspace / "TS_01.tlt").write_text("-3\n0\n3\n")
+    (workspace / "TS_01_rec.mrc").write_bytes(b"tomogram")
+    stack.write_bytes(b"not to be overwritten")
+    finished = []
+    space.copy_back(workspace, data, staged, then=lambda: finished.append(True))
+    space.close()
+
+    assert finished == [True]
+    assert stack.read_bytes() == b"not to be overwritten"
+    assert tlt.read_text() == "-3\n0\n3\n"
+    assert (data / "TS_01_rec.mrc").read_bytes() == b"tomogram"
+    assert list((tmp_path / "scratch").iterdir()) == []
+
+
+def test_not_enough_space(tmp_path: Path):
+    """Tilt series that don't fit are processed in place."""
+    stack = tmp_path / "TS_01.mrc"
+    stack.write_bytes(b"stack")
+
+    space = scratch.Scratch(tmp_path / "scratch", space_factor=1e18)
+    assert space.stage_in("TS_01.mrc", [stack]) is None
+    assert list(space.root.iterdir()) == []
+    space.close()
+
+
+def test_reconstruct_in_scratch(reconstruct_tools, make_tiltseries, tmp_path: Path):
+    """Tomograms end up next to the inputs, intermediates don't."""
+    data = tmp_path / "data"
+    data.mkdir()
+    for name in ("TS_01", "TS_02"):
+        make_tiltseries(data, name)
+
+    result = CliRunner().invoke(
+        reconstruct, ["--scratch", str(tmp_path / "scratch"), str(data)]
+    )
+
+    assert result.exit_code == 0, result.output
+    for name in ("TS_01", "TS_02"):
+        assert (data / f"{name}_ali_filtered_rec_bin_1.mrc").is_file()
+        assert (data / f"{name}.aln").is_file()
+        assert not (data / f"{name}_ali.mrc").exists()
+    assert list((tmp_path / "scratch").iterdir()) == []
@@ -0,0 +1,108 @@
+"""Tests for the stage scheduler in utils.stages."""
+
+import threading
+import time
+
+import pytest
+
+from tomotools.utils import gpus, stages
+
+
+def test_stages_get_results_of_dependencies():
+    """Stages are called with the results of the stages they come after."""
+    graph = stages.StageGraph()
+    graph.add("a", lambda: 1)
+    graph.add("b", lambda a: a + 1, after=["a"])
+    graph.add(
+        "c", lambda a, b, slot: (a, b, slot), after=["a", "b"], pool=stages.Pool(1)
+    )
+
+    assert graph.run() == {"a": 1, "b": 2, "c": (1, 2, 0)}
+
+
+def test_pools_run_concurrently():
+    """A GPU stage of one series overlaps with a CPU stage of another."""
+    gpu_pool = gpus.GpuPool([0])
+    cpu_pool = stages.Pool(1)
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def work(name: str):
+        def stage(*args):
+            with lock:
+                running.add(name)
+                if len(running) > 1:
+                    overlapped.set()
+            time.sleep(0.2)
+            with lock:
+                running.discard(name)
+            return name
+
+        return stage
+
+    graph = stages.StageGraph()
+    for series in ("TS_01", "TS_02"):
+        aligned = graph.add(f"{series}/align", work(f"{series}/align"), pool=gpu_pool)
+        graph.add(
+            f"{series}/reconstruct",
+            work(f"{series}/reconstruct"),
+            after=[aligned],
+            pool=cpu_pool,
+        )
+
+    start = time.monotonic()
+    graph.run()
+
+    # Serial would take 0.8 s
+    assert time.monotonic() - start < 0.7
+    assert overlapped.is_set()
+
+
+def test_failure_stops_dependents():
+    """Stages after a failed one don't run, the error is raised."""
+    called = []
+    graph = stages.StageGraph()
+    graph.add("bad", lambda: 1 / 0)
+    graph.add("after bad", lambda _: called.append("after bad"), after=["bad"])
+    graph.add("independent", lambda: called.append("independent"))
+
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert called == ["independent"]
+
+
+def test_unknown_dependency():
+    """Stages can only come after stages that were added before."""
+    graph = stages.StageGraph()
+    with pytest.raises(ValueError):
+        graph.add("b", lambda a: a, after=["a"])
+
+
+def test_skipped_stage_leaves_out_dependents():
+    """Stages after a skipped one don't run, without an error."""
+    called = []
+
+    def skip():
+        raise stages.Skipped("claimed elsewhere")
+
+    graph = stages.StageGraph()
+    graph.add("skipped", skip)
+    graph.add(
+        "after skipped", lambda _: called.append("after skipped"), after=["skipped"]
+    )
+    graph.add("independent", lambda: called.append("independent"))
+
+    assert graph.run() == {"independent": None}
+    assert called == ["independent"]
+
+
+def test_failed_is_set_for_waiting_stages():
+    """Stages waiting for others learn that the graph failed."""
+    graph = stages.StageGraph()
+    graph.add("bad", lambda: 1 / 0)
+    graph.add("waiting", lambda _slot: graph.failed.wait(5), pool=stages.Pool(1))
+
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert graph.failed.is_set()
@@ -0,0 +1,73 @@
+"""Tests for per-tilt quality control."""
+
+import json
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+import pytest
+
+from tomotools.utils import mdocfile, tilt_qc
+from tomotools.utils.tiltseries import TiltSeries, format_view_ranges
+
+
+@pytest.fixture
+def ts_with_bad_tilts(tmp_path: Path):
+    """Create a tilt series with a dark (view 1) and a blank tilt (view 9)."""
+    rng = np.random.default_rng(0)
+    angles = np.arange(-30, 31, 6)
+    # Beer-Lambert: intensity decreases with 1/cos(tilt)
+    means = 100 * np.exp(-0.3 / np.cos(np.radians(angles)))
+    data = np.stack([rng.poisson(mean, (64, 64)) for mean in means]).astype(np.float32)
+    data[0] = rng.poisson(2, (64, 64))
+    data[8] = means[8]
+
+    ts_path = tmp_path / "TS_01.mrc"
+    with mrcfile.new(ts_path, data) as mrc:
+        mrc.voxel_size = 2.5
+    mdocfile.write(
+        {
+            "titles": [],
+            "sections": [{"TiltAngle": float(angle)} for angle in angles],
+            "framesets": [],
+        },
+        f"{ts_path}.mdoc",
+    )
+    return TiltSeries(ts_path)
+
+
+def test_format_view_ranges():
+    """Zero-indexed views are written as compact 1-indexed ranges."""
+    assert format_view_ranges([0, 38, 39, 40]) == "1,39-41"
+    assert format_view_ranges([]) == ""
+
+
+def test_tilt_statistics(ts_with_bad_tilts: TiltSeries):
+    """Statistics are computed for every tilt, tilt angles taken from the mdoc."""
+    stats = tilt_qc.tilt_statistics(ts_with_bad_tilts)
+
+    assert len(stats) == 11
+    assert stats["tilt_angle"].tolist() == list(range(-30, 31, 6))
+    assert stats.loc[8, "std"] == 0
+    assert (stats["p1"] <= stats["p50"]).all() and (stats["p50"] <= stats["p99"]).all()
+
+
+def test_flag_tilts(ts_with_bad_tilts: TiltSeries):
+    """Dark and blank tilts are flagged, regular tilts are not."""
+    stats = tilt_qc.flag_tilts(tilt_qc.tilt_statistics(ts_with_bad_tilts))
+
+    assert stats.loc[stats["dark"], "view"].tolist() == [0]
+    assert stats.loc[stats["blank"], "view"].tolist() == [8]
+    assert stats.loc[stats["exclude"], "view"].tolist() == [0, 8]
+
+
+def test_write_qc_report(ts_with_bad_tilts: TiltSeries):
+    """The report lists the flagged views in batch-file notation."""
+    stats = tilt_qc.flag_tilts(tilt_qc.tilt_statistics(ts_with_bad_tilts))
+    csv_file, json_file = tilt_qc.write_qc_report(ts_with_bad_tilts, stats)
+
+    assert csv_file.is_file()
+    with open(json_file) as file:
+        report = json.load(file)
+    assert report["exclude"] == "1,9"
+    assert len(report["tilts"]) == 11
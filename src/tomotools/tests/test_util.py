@@ -0,0 +1,43 @@
+"""Tests for helpers in utils.util."""
+
+import subprocess
+import time
+
+import pytest
+
+from tomotools.utils import jobs, util
+
+
+def test_run_concurrently_budget(monkeypatch):
+    """Commands run at the same time and share the CPU budget."""
+    # Independent of the CPUs of this machine, which bound the default runner
+    monkeypatch.setattr(jobs, "_default_runner", jobs.JobRunner(workers=3))
+    start = time.monotonic()
+    results = util.run_concurrently(
+        [["sh", "-c", "sleep 0.5; echo $OMP_NUM_THREADS"]] * 3,
+        cpus=6,
+        capture_output=True,
+        text=True,
+    )
+
+    assert time.monotonic() - start < 1.4
+    assert [result.stdout.strip() for result in results] == ["2", "2", "2"]
+
+
+def test_run_concurrently_checks_all(tmp_path):
+    """A failing command raises, but only once all commands are finished."""
+    marker = tmp_path / "done"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        util.run_concurrently(
+            [["sh", "-c", "exit 1"], ["sh", "-c", f"sleep 0.2; touch {marker}"]],
+            cpus=2,
+        )
+
+    assert marker.is_file()
+
+
+def test_cpu_budget(monkeypatch):
+    """TOMOTOOLS_CPUS overrides the number of available CPUs."""
+    monkeypatch.setenv("TOMOTOOLS_CPUS", "3")
+    assert util.cpu_budget() == 3
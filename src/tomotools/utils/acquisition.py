@@ -0,0 +1,119 @@
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from tomotools.utils import discovery, mdocfile
+
+
+class WatchedSeries:
+    """A tilt series being acquired, followed through its mdoc."""
+
+    def __init__(self, mdoc_file: Path):
+        self.tail = mdocfile.MdocTail(mdoc_file)
+        # Sections that couldn't be handled yet, e.g. as their frames are missing
+        self.waiting: list[mdocfile.MdocEvent] = []
+        self.size = -1
+        self.last_change = time.monotonic()
+        self.finished = False
+
+    @property
+    def mdoc_file(self) -> Path:
+        return self.tail.path
+
+    def changed(self) -> bool:
+        """Whether the mdoc grew since the last call."""
+        try:
+            size = self.mdoc_file.stat().st_size
+        except FileNotFoundError:
+            return False
+        changed, self.size = size != self.size, size
+        return changed
+
+
+def follow(
+    directories: list[Path],
+    on_section: Callable[[Path, dict, int, dict], bool],
+    on_complete: Callable[[Path, dict], None],
+    idle_timeout: float,
+    interval: float = 5.0,
+    stop_after: float | None = None,
+    skip: Callable[[Path], bool] = lambda mdoc_file: False,
+):
+    """Follow the tilt series mdocs that appear in directories.
+
+    on_section(mdoc_file, mdoc, index, section) is called for every section as
+    soon as it is complete. It returns False if the section can't be handled
+    yet, e.g. as its frames are still missing, and is called again later.
+    A tilt series is complete once its mdoc didn't change for idle_timeout
+    seconds and all sections are handled. Then on_complete(mdoc_file, mdoc) is
+    called with the whole mdoc. Series whose frames are still missing another
+    idle_timeout later are given up, as are series for which on_section or
+    on_complete raise. Mdocs for which skip returns True are ignored, e.g.
+    those already processed.
+
+    Returns once no series is open and no new mdoc appeared for stop_after
+    seconds. Without stop_after, watches until interrupted.
+    """
+    open_series: dict[Path, WatchedSeries] = {}
+    done: set[Path] = set()
+    last_activity = time.monotonic()
+
+    while True:
+        for directory in directories:
+            for mdoc_file in discovery.index(directory).tiltseries_mdocs():
+                if mdoc_file in open_series or mdoc_file in done:
+                    continue
+                if skip(mdoc_file):
+                    done.add(mdoc_file)
+                    continue
+                print(f"Found new tilt series {mdoc_file.name}, following it.")
+                open_series[mdoc_file] = WatchedSeries(mdoc_file)
+                last_activity = time.monotonic()
+
+        for mdoc_file, series in list(open_series.items()):
+            now = time.monotonic()
+            if series.changed():
+                series.last_change = now
+            idle = now - series.last_change > idle_timeout
+            if idle and not series.finished:
+                # The last section isn't followed by another one
+                events = series.tail.finish()
+                series.finished = True
+                series.last_change = now
+                idle = False
+            else:
+                events = series.tail.poll()
+            # Framesets only occur in the mdocs of single movies
+            series.waiting += [event for event in events if event.kind == "section"]
+
+            mdoc = series.tail.mdoc
+            try:
+                waiting = [
+                    event
+                    for event in series.waiting
+                    if not on_section(mdoc_file, mdoc, event.index, event.data)
+                ]
+                if len(waiting) < len(series.waiting):
+                    series.last_change = now
+                series.waiting = waiting
+
+                if series.finished and not series.waiting:
+                    on_complete(mdoc_file, mdoc)
+                elif series.finished and idle:
+                    print(f"Frames of {mdoc_file.name} are still missing, giving up.")
+                else:
+                    continue
+            except Exception as error:
+                # One broken tilt series doesn't stop watching the others
+                print(f"Processing {mdoc_file.name} failed: {error}. Skipping.")
+            del open_series[mdoc_file]
+            done.add(mdoc_file)
+            last_activity = time.monotonic()
+
+        if (
+            stop_after is not None
+            and not open_series
+            and time.monotonic() - last_activity > stop_after
+        ):
+            return
+        time.sleep(interval)
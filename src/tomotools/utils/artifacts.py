@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from tomotools.utils import discovery
+
+_CHUNK = 16 * 1024 * 1024
+_DEFAULT_SIZE_GB = 100.0
+
+# Absolute path -> ((inode, mtime, size), digest)
+_hashes: dict[str, tuple[tuple[int, int, int], str]] = {}
+_hashes_lock = threading.Lock()
+
+
+class ArtifactCache:
+    """Intermediate files of a stage, keyed by its inputs and parameters.
+
+    The key of a stage is a hash of the content of its input files, the stage
+    name and its parameters, so stages whose inputs didn't change are reused
+    even if later stages run with other parameters. Cached files are
+    materialised as hard links, falling back to copies across file systems.
+    As a hard link shares its content with the cache, files that tools
+    update in place, e.g. alignments, are passed as copied and stored and
+    materialised as copies. Other targets are removed on a cache miss, so
+    the tools write new files instead of changing cached ones.
+
+    Once the cache grows beyond max_bytes, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries = self.root / "entries"
+        self._hashes = self.root / "hashes"
+
+    def key(self, stage: str, inputs: Iterable[Path | None], params: dict) -> str:
+        """Return the key of a stage run on inputs with params."""
+        content = {
+            "stage": stage,
+            "inputs": [self.file_hash(file) for file in inputs if file is not None],
+            "params": params,
+        }
+        return hashlib.sha256(
+            json.dumps(content, default=str, sort_keys=True).encode()
+        ).hexdigest()
+
+    def fetch(self, key: str, targets: list[Path], copied: Iterable[Path] = ()) -> bool:
+        """Materialise the files of key at targets, return whether it was cached.
+
+        Existing targets are replaced. Targets in copied are copies, not links.
+        On a miss, the other targets are removed, so that the tool writing
+        them doesn't change cached files through a link.
+        """
+        copied = {Path(file) for file in copied}
+        entry = self._entries / key
+        files = [entry / str(i) for i in range(len(targets))]
+        try:
+            with open(entry / "files.json") as f:
+                cached = json.load(f) == len(targets)
+            if cached:
+                for file, target in zip(files, targets):
+                    _materialise(file, target, link=target not in copied)
+        except (OSError, ValueError):
+            # Missing, incomplete or evicted meanwhile
+            cached = False
+        if not cached:
+            for target in targets:
+                if target not in copied:
+                    target.unlink(missing_ok=True)
+            return False
+        # The modification time of an entry marks its last use
+        os.utime(entry)
+        for i, target in enumerate(targets):
+            self._remember(target, f"{key}-{i}")
+        return True
+
+    def store(self, key: str, files: list[Path], copied: Iterable[Path] = ()):
+        """Add files as the result of key, then evict old entries if needed.
+
+        Files in copied are stored as copies, see fetch.
+        """
+        copied = {Path(file) for file in copied}
+        self._entries.mkdir(parents=True, exist_ok=True)
+        entry = self._entries / key
+        tmp = Path(tempfile.mkdtemp(dir=self._entries, prefix=f".{key}."))
+        try:
+            for i, file in enumerate(files):
+                _materialise(file, tmp / str(i), link=file not in copied)
+            with open(tmp / "files.json", "w") as f:
+                json.dump(len(files), f)
+            try:
+                tmp.rename(entry)
+            except OSError:
+                # Stored concurrently by another run
+                shutil.rmtree(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        # Files made from cached inputs have the key as their content hash,
+        # so the next stage doesn't read them again
+        for i, file in enumerate(files):
+            self._remember(file, f"{key}-{i}")
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond max_bytes."""
+        entries = []
+        total = 0
+        try:
+            candidates = list(os.scandir(self._entries))
+        except FileNotFoundError:
+            return
+        for entry in candidates:
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime_ns, size, entry.path))
+            except FileNotFoundError:
+                continue
+            total += size
+
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Renamed first, so nobody materialises an incomplete entry
+            doomed = Path(tempfile.mkdtemp(dir=self._entries, prefix=".evicted."))
+            try:
+                os.rename(entry_path, doomed / "entry")
+            except OSError:
+                continue
+            finally:
+                shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+
+    def file_hash(self, file: Path) -> str:
+        """Return the content hash of file.
+
+        Hashes are remembered by path, inode, modification time and size, in
+        memory and in the cache directory, so unchanged files are read once.
+        """
+        stat = os.stat(file)
+        key = str(Path(file).absolute())
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with _hashes_lock:
+            known = _hashes.get(key)
+        if known is not None and known[0] == stamp:
+            return known[1]
+
+        memo = self._hashes / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+        try:
+            with open(memo) as f:
+                memo_key, memo_stamp, digest = json.load(f)
+            if memo_key == key and tuple(memo_stamp) == stamp:
+                with _hashes_lock:
+                    _hashes[key] = (stamp, digest)
+                return digest
+        except (OSError, ValueError):
+            pass
+
+        sha = hashlib.sha256()
+        with open(file, "rb") as f:
+            while chunk := f.read(_CHUNK):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        # Files modified just now may change again without changing the stamp
+        if not discovery.is_racy(stat.st_mtime_ns):
+            self._remember(file, digest)
+        return digest
+
+    def _remember(self, file: Path, digest: str):
+        stat = os.stat(file)
+        key = str(Path(file).absolute())
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with _hashes_lock:
+            _hashes[key] = (stamp, digest)
+        memo = self._hashes / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+        try:
+            self._hashes.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self._hashes, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump([key, stamp, digest], f)
+            os.replace(tmp, memo)
+        except OSError:
+            return
+
+
+def _materialise(source: Path, target: Path, link: bool = True):
+    """Hard link source to target, or copy it if that fails or not link.
+
+    Replaces target.
+    """
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.{time.monotonic_ns()}")
+    try:
+        if not link:
+            shutil.copy2(source, tmp)
+        else:
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def default_cache() -> ArtifactCache | None:
+    """Return the cache set up via envars, None if it is disabled.
+
+    TOMOTOOLS_ARTIFACT_CACHE is the cache directory, TOMOTOOLS_ARTIFACT_CACHE_GB
+    its size limit in GB (default: 100).
+    """
+    root = os.environ.get("TOMOTOOLS_ARTIFACT_CACHE")
+    if not root:
+        return None
+    try:
+        size_gb = float(os.environ.get("TOMOTOOLS_ARTIFACT_CACHE_GB", ""))
+    except ValueError:
+        size_gb = _DEFAULT_SIZE_GB
+    return ArtifactCache(Path(root), int(size_gb * 1024**3))
+
+
+def clear_cache():
+    """Forget the file hashes remembered in memory."""
+    with _hashes_lock:
+        _hashes.clear()
@@ -0,0 +1,160 @@
+import json
+import os
+import tempfile
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+from tomotools.utils import claims
+
+CHECKPOINT_NAME = ".tomotools_checkpoint.json"
+VERSION = 1
+
+# Checkpoint file -> Checkpoint, so all threads of a run share one
+_open: dict[str, "Checkpoint"] = {}
+_open_lock = threading.Lock()
+
+Stamp = dict[str, list[int] | None]
+
+
+def stamp(files: Iterable[Path | None]) -> Stamp:
+    """Return modification time and size of files, None for missing ones."""
+    stamps = {}
+    for file in files:
+        if file is None:
+            continue
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            stamps[str(Path(file).absolute())] = None
+        else:
+            stamps[str(Path(file).absolute())] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def _normalize(params: dict) -> dict:
+    """Make params comparable to their JSON round trip, e.g. paths and tuples."""
+    return json.loads(json.dumps(params, default=str, sort_keys=True))
+
+
+class Checkpoint:
+    """Completed steps of a run, to skip them when it is repeated.
+
+    A step is keyed by a name like "TS_01/align". It counts as done as long as
+    its inputs are unchanged, it ran with the same parameters and its outputs
+    are still there, unchanged. Steps are written to the file as soon as they
+    are recorded, so a run that dies can be continued where it stopped.
+    """
+
+    def __init__(self, file: Path):
+        self.file = Path(file)
+        self._lock = threading.Lock()
+        self._steps: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.file) as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != VERSION:
+            return {}
+        steps = content.get("steps")
+        if not isinstance(steps, dict):
+            return {}
+        # Damaged steps count as not done
+        return {
+            key: step
+            for key, step in steps.items()
+            if isinstance(step, dict)
+            and isinstance(step.get("inputs"), dict)
+            and isinstance(step.get("outputs"), dict)
+            and "params" in step
+        }
+
+    def refresh(self):
+        """Read steps recorded by other processes in the meantime."""
+        with self._lock:
+            self._steps = self._load()
+
+    def done(
+        self, key: str, inputs: Iterable[Path | None], params: dict
+    ) -> list[Path] | None:
+        """Return the outputs of step key, if it is done. Else, return None."""
+        with self._lock:
+            step = self._steps.get(key)
+        if step is None:
+            return None
+        if step["inputs"] != stamp(inputs) or step["params"] != _normalize(params):
+            return None
+        if any(entry is None for entry in step["outputs"].values()):
+            return None
+        if stamp(Path(output) for output in step["outputs"]) != step["outputs"]:
+            return None
+        return [Path(output) for output in step["outputs"]]
+
+    def record(
+        self,
+        key: str,
+        inputs: Stamp,
+        params: dict,
+        outputs: Iterable[Path | None],
+    ):
+        """Record that step key is done.
+
+        inputs is the stamp of the input files, taken before the step ran, as
+        steps may change their inputs.
+        """
+        with self._lock:
+            self._steps[key] = {
+                "inputs": inputs,
+                "params": _normalize(params),
+                "outputs": stamp(outputs),
+            }
+            self._save(key)
+
+    def forget(self, key: str) -> list[Path]:
+        """Mark step key as not done, e.g. before redoing it.
+
+        Return the outputs it had recorded, so they can be cleaned up.
+        """
+        with self._lock:
+            step = self._steps.pop(key, None)
+            if step is None:
+                return []
+            self._save(key)
+        return [Path(output) for output in step["outputs"]]
+
+    def _save(self, key: str):
+        # Jobs of other tilt series, also on other nodes, may record their
+        # steps in the same file
+        with claims.locked(self.file.with_name(f".{self.file.name}.lock")):
+            self._merge_and_write(key)
+
+    def _merge_and_write(self, key: str):
+        steps = self._load()
+        if key in self._steps:
+            steps[key] = self._steps[key]
+        else:
+            steps.pop(key, None)
+        self._steps = steps
+        content = {"version": VERSION, "steps": self._steps}
+        fd, tmp = tempfile.mkstemp(
+            dir=self.file.parent, prefix=f".{self.file.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(content, file, indent=1)
+            os.replace(tmp, self.file)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def open_checkpoint(directory: Path) -> Checkpoint:
+    """Return the checkpoint of directory, shared within the process."""
+    file = Path(directory).absolute() / CHECKPOINT_NAME
+    with _open_lock:
+        if str(file) not in _open:
+            _open[str(file)] = Checkpoint(file)
+        return _open[str(file)]
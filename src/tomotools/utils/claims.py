@@ -0,0 +1,250 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+# Seconds between refreshes of a held claim
+HEARTBEAT = 30
+# Seconds without heartbeat after which a claim of another host is broken,
+# unless set with the envar TOMOTOOLS_CLAIM_TIMEOUT
+STALE_AFTER = 300.0
+
+
+class ClaimLost(RuntimeError):
+    """Raised when the work of a claim that was taken over is to be recorded."""
+
+
+def claim_timeout() -> float:
+    """Return the seconds after which claims without heartbeat are broken."""
+    try:
+        return float(os.environ.get("TOMOTOOLS_CLAIM_TIMEOUT", ""))
+    except ValueError:
+        return STALE_AFTER
+
+
+def claim_file(path: Path) -> Path:
+    """Return the claim file for work on path, a hidden file next to it."""
+    path = Path(path)
+    return path.with_name(f".{path.name}.claim")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to someone else
+        return True
+    return True
+
+
+def _server_time(directory: Path) -> float:
+    """Return the current time as the file system of directory sees it.
+
+    Nodes' clocks may differ, so claim ages are measured against the
+    modification time of a fresh file on the same file system.
+    """
+    fd, probe = tempfile.mkstemp(dir=directory, prefix=".tomotools_clock.")
+    try:
+        return os.fstat(fd).st_mtime
+    finally:
+        os.close(fd)
+        os.unlink(probe)
+
+
+class Claim:
+    """Exclusive claim on a piece of work, e.g. a tilt series, between processes.
+
+    The claim is a file holding host, pid and a token of its owner. It is
+    created atomically with os.link, which is also atomic on NFS, where
+    O_EXCL is not to be trusted. While the claim is held, a thread refreshes
+    its modification time every heartbeat seconds. Claims of dead processes
+    on this host and claims without heartbeat for stale_after seconds are
+    broken, so work of a crashed node is picked up again.
+
+    If the claim is broken nevertheless, e.g. as this node was unreachable
+    for a while, the heartbeat sets .lost. Owners check it with ensure_held
+    before recording their results.
+    """
+
+    def __init__(
+        self,
+        file: Path,
+        heartbeat: float | None = HEARTBEAT,
+        stale_after: float | None = None,
+    ):
+        self.file = Path(file)
+        self.heartbeat = heartbeat
+        self.stale_after = claim_timeout() if stale_after is None else stale_after
+        self.info = {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "token": uuid.uuid4().hex,
+            "started": time.time(),
+        }
+        self.held = False
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def holder(self) -> dict | None:
+        """Return host, pid and token of the current owner, None if unclaimed."""
+        try:
+            return json.loads(self.file.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return {}
+
+    def acquire(self) -> bool:
+        """Try to claim, breaking stale claims. Return whether the claim is held."""
+        if self.held:
+            return True
+        for _ in range(3):
+            if self._create():
+                self.held = True
+                self.lost.clear()
+                self._start_heartbeat()
+                return True
+            holder = self.holder()
+            if holder is None:
+                # Released in the meantime
+                continue
+            if not self._is_stale(holder):
+                return False
+            self._break(holder)
+        return False
+
+    def ensure_held(self):
+        """Raise ClaimLost if another process took over the claim."""
+        if self.lost.is_set() or (self.held and not self._owned()):
+            self.lost.set()
+            raise ClaimLost(
+                f"Lost the claim on {self.file} to {describe(self.holder())}."
+            )
+
+    def release(self):
+        """Give up the claim, if it is still held."""
+        if not self.held:
+            return
+        self.held = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._owned():
+            self.file.unlink(missing_ok=True)
+
+    def __enter__(self) -> "Claim":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def _create(self) -> bool:
+        tmp = self.file.with_name(
+            f"{self.file.name}.{self.info['host']}.{self.info['token']}"
+        )
+        tmp.write_text(json.dumps(self.info))
+        try:
+            os.link(tmp, self.file)
+        except OSError:
+            # On NFS, link may fail after all if its reply got lost,
+            # the link count of tmp tells what happened
+            pass
+        try:
+            return os.stat(tmp).st_nlink == 2
+        finally:
+            tmp.unlink()
+
+    def _owned(self) -> bool:
+        holder = self.holder()
+        return holder is not None and holder.get("token") == self.info["token"]
+
+    def _is_stale(self, holder: dict) -> bool:
+        if holder.get("host") == self.info["host"] and "pid" in holder:
+            if holder["pid"] != self.info["pid"] and not _pid_alive(holder["pid"]):
+                return True
+        try:
+            heartbeat = self.file.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        return _server_time(self.file.parent) - heartbeat > self.stale_after
+
+    def _break(self, holder: dict):
+        # Only one of the processes breaking a claim gets to rename it. If
+        # another one broke it and claimed in between, that claim is broken
+        # instead, which its owner notices by its heartbeat.
+        broken = self.file.with_name(f"{self.file.name}.broken.{self.info['token']}")
+        try:
+            os.rename(self.file, broken)
+        except FileNotFoundError:
+            return
+        print(
+            f"Breaking the stale claim of {holder.get('host')} "
+            f"(pid {holder.get('pid')}) on {self.file}."
+        )
+        broken.unlink(missing_ok=True)
+
+    def _start_heartbeat(self):
+        if self.heartbeat is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._beat, name="tomotools-claim", daemon=True
+        )
+        self._thread.start()
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            try:
+                owned = self._owned()
+                if owned:
+                    os.utime(self.file)
+            except FileNotFoundError:
+                owned = False
+            if not owned:
+                print(f"Warning: lost the claim on {self.file} to another process.")
+                self.lost.set()
+                return
+
+
+@contextmanager
+def claimed(path: Path) -> Iterator[Claim | None]:
+    """Claim the work on path for the block, yield None if it's claimed elsewhere."""
+    claim = Claim(claim_file(path))
+    if not claim.acquire():
+        yield None
+        return
+    try:
+        yield claim
+    finally:
+        claim.release()
+
+
+@contextmanager
+def locked(file: Path, timeout: float = 60, interval: float = 0.05) -> Iterator[None]:
+    """Hold the lock file for a short block, waiting for other processes.
+
+    Locks are held briefly, so they're considered stale after timeout.
+    """
+    lock = Claim(file, heartbeat=None, stale_after=timeout)
+    while not lock.acquire():
+        time.sleep(interval)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def describe(holder: dict | None) -> str:
+    """Return a readable owner of a claim, for messages."""
+    if not holder:
+        return "another process"
+    return f"{holder.get('host', '?')} (pid {holder.get('pid', '?')})"
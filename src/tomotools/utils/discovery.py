@@ -0,0 +1,159 @@
+import fnmatch
+import os
+import re
+import threading
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+# Halves of a stack or reconstruction, MotionCor2/tomotools notation first
+SPLIT_SUFFIXES = [("_EVN", "_ODD"), ("_even", "_odd")]
+
+# Stems of reconstructions, like the globs *_rec.mrc and *_rec_bin_[0-9]*.mrc
+_RECONSTRUCTION = re.compile(r"_rec(_bin_\d.*)?$")
+
+# Directories modified this recently are rescanned, as more files may arrive
+# within the resolution of the directory timestamp (same idea as racy git)
+_RACY_NS = 2_000_000_000
+
+# Absolute directory -> (mtime, index)
+_cache: dict[str, tuple[int, "DirectoryIndex"]] = {}
+_cache_lock = threading.Lock()
+
+
+def _kind(name: str) -> str | None:
+    """Classify a file by its name."""
+    stem, suffix = os.path.splitext(name)
+    if suffix == ".mdoc":
+        if "allviews" in name or "cutviews" in name:
+            return None
+        return "mdoc"
+    if suffix in (".xf", ".tlt", ".aln", ".defocus"):
+        return suffix[1:]
+    if name.endswith("_ctfplotter.txt"):
+        return "defocus"
+    if suffix not in (".mrc", ".st"):
+        return None
+    if any(stem.endswith(half) for pair in SPLIT_SUFFIXES for half in pair):
+        return "half"
+    if _RECONSTRUCTION.search(stem):
+        return "reconstruction"
+    return "stack"
+
+
+class DirectoryIndex:
+    """All files of one directory, listed with a single os.scandir pass.
+
+    Files are classified by name into mdoc, stack, half, xf, tlt, aln,
+    defocus and reconstruction. Lookups afterwards don't touch the filesystem.
+    """
+
+    def __init__(self, directory: Path, names: Iterable[str] | None = None):
+        """Scan directory, unless its file names are passed, e.g. from a manifest."""
+        self.directory = Path(directory)
+        if names is None:
+            names = []
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    # Like glob, skip hidden files
+                    if not entry.name.startswith(".") and entry.is_file():
+                        names.append(entry.name)
+        self.names: frozenset[str] = frozenset(names)
+
+        self.kinds: dict[str, list[Path]] = {}
+        for name in sorted(names):
+            kind = _kind(name)
+            if kind is not None:
+                self.kinds.setdefault(kind, []).append(self.directory / name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def get(self, name: str) -> Path | None:
+        """Return path of file name in the directory, None if it doesn't exist."""
+        return self.directory / name if name in self.names else None
+
+    def of_kind(self, kind: str) -> list[Path]:
+        """Return all files of one kind, sorted by name."""
+        return self.kinds.get(kind, [])
+
+    def match(self, pattern: str) -> list[Path]:
+        """Return all files matching a glob pattern, sorted by name."""
+        return [
+            self.directory / name
+            for name in sorted(fnmatch.filter(self.names, pattern))
+        ]
+
+    def split_files(self, stem: str, suffix: str = ".mrc") -> tuple[Path, Path] | None:
+        """Return EVN/ODD (or even/odd) halves of stem, if both exist."""
+        for evn, odd in SPLIT_SUFFIXES:
+            evn_name, odd_name = f"{stem}{evn}{suffix}", f"{stem}{odd}{suffix}"
+            if evn_name in self.names and odd_name in self.names:
+                return self.directory / evn_name, self.directory / odd_name
+        return None
+
+    def defocus_file(self, stem: str) -> Path | None:
+        """Return defocus file of stem, preferring the ctfplotter output."""
+        return self.get(f"{stem}_ctfplotter.txt") or self.get(f"{stem}.defocus")
+
+    def tiltseries_mdocs(self) -> list[Path]:
+        """Return mdoc files of tilt series, without those of IMOD's views."""
+        return self.of_kind("mdoc")
+
+    def reconstructions(self) -> list[Path]:
+        """Return reconstructions, without full_rec, even_rec and odd_rec."""
+        binned = self.match("*_rec_bin_[0-9]*.mrc")
+        unbinned = [
+            file
+            for file in self.match("*_rec.mrc")
+            if not (
+                file.name.endswith("even_rec.mrc")
+                or file.name.endswith("_odd_rec.mrc")
+                or file.name.endswith("_full_rec.mrc")
+            )
+        ]
+        return binned + unbinned
+
+
+def index(directory: Path) -> DirectoryIndex:
+    """Return the index of directory, scanning it only if it changed.
+
+    Indices are cached for the whole process and validated by the
+    modification time of the directory.
+    """
+    directory = Path(directory)
+    key = str(directory.absolute())
+    mtime = os.stat(directory).st_mtime_ns
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    directory_index = DirectoryIndex(directory)
+    if not is_racy(mtime):
+        with _cache_lock:
+            _cache[key] = (mtime, directory_index)
+    return directory_index
+
+
+def is_racy(mtime: int, now: int | None = None) -> bool:
+    """Whether a directory modified at mtime may still change unnoticed."""
+    now = time.time_ns() if now is None else now
+    return now - mtime <= _RACY_NS
+
+
+def prime(directory: Path, mtime: int, names: Iterable[str]):
+    """Add a listing made elsewhere, e.g. from a session manifest, to the cache.
+
+    It is only used as long as the directory still has modification time mtime.
+    """
+    directory_index = DirectoryIndex(directory, names)
+    with _cache_lock:
+        _cache[str(Path(directory).absolute())] = (mtime, directory_index)
+
+
+def clear_cache():
+    """Forget all cached directory indices."""
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,240 @@
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Protocol
+
+# Job states, as reported by poll
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# The scheduler doesn't know the job (anymore), and it left no exit status
+UNKNOWN = "unknown"
+
+# What schedulers report, mapped to the states above. Unknown states count
+# as running, so a job is only given up on if the scheduler says so.
+_STATES = {
+    "PENDING": QUEUED,
+    "PD": QUEUED,
+    "QUEUED": QUEUED,
+    "Q": QUEUED,
+    "RUNNING": RUNNING,
+    "R": RUNNING,
+    "COMPLETED": DONE,
+    "CD": DONE,
+    "DONE": DONE,
+    "FAILED": FAILED,
+    "F": FAILED,
+    "CANCELLED": FAILED,
+    "CA": FAILED,
+    "TIMEOUT": FAILED,
+    "TO": FAILED,
+    "OUT_OF_MEMORY": FAILED,
+    "OOM": FAILED,
+    "NODE_FAIL": FAILED,
+}
+
+
+class Job(NamedTuple):
+    """A submitted job."""
+
+    id: str
+    name: str
+    log: Path
+
+
+class Executor(Protocol):
+    """Runs commands as jobs, e.g. on the nodes of a cluster."""
+
+    def submit(self, args: list, name: str, log: Path) -> Job: ...
+
+    def poll(self, job: Job) -> str: ...
+
+
+def exit_file(log: Path) -> Path:
+    """Return the file the job script of log writes its exit status to."""
+    return log.with_suffix(".exit")
+
+
+def job_script(args: list, log: Path) -> Path:
+    """Write a shell script running args in the current directory, next to log.
+
+    Once args are finished, the script writes their exit status to
+    exit_file(log), so jobs the scheduler forgot about can still be judged.
+    """
+    script = log.with_suffix(".sh")
+    status = shlex.quote(str(exit_file(log)))
+    exit_file(log).unlink(missing_ok=True)
+    script.write_text(
+        "#!/bin/sh\n"
+        f"cd {shlex.quote(os.getcwd())}\n"
+        f"{shlex.join(str(arg) for arg in args)}\n"
+        "status=$?\n"
+        f'echo "$status" > {status}.tmp && mv {status}.tmp {status}\n'
+        'exit "$status"\n'
+    )
+    script.chmod(0o755)
+    return script
+
+
+def exit_state(log: Path) -> str:
+    """Return DONE or FAILED from the exit status of a job, UNKNOWN if none."""
+    try:
+        status = exit_file(log).read_text().strip()
+    except FileNotFoundError:
+        return UNKNOWN
+    return DONE if status == "0" else FAILED
+
+
+class LocalExecutor:
+    """Stand-in for a batch scheduler on a single machine.
+
+    Jobs are queued and run as subprocesses of this process, at most slots
+    of them at a time, with their output in the job log. Just like on a
+    cluster, jobs run a job script and only the log and the state are known
+    of them.
+    """
+
+    def __init__(self, slots: int = 1):
+        self.slots = max(1, slots)
+        self._queue: list[tuple[Job, Path]] = []
+        self._running: dict[str, subprocess.Popen] = {}
+        self._returncodes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def submit(self, args: list, name: str, log: Path) -> Job:
+        """Queue a job, return it."""
+        script = job_script(args, log)
+        with self._lock:
+            self._count += 1
+            job = Job(f"local-{self._count}", name, log)
+            self._queue.append((job, script))
+            self._start_queued()
+        return job
+
+    def poll(self, job: Job) -> str:
+        """Return the state of job."""
+        with self._lock:
+            self._start_queued()
+            if job.id in self._returncodes:
+                return DONE if self._returncodes[job.id] == 0 else FAILED
+            if job.id in self._running:
+                return RUNNING
+            if any(queued.id == job.id for queued, _ in self._queue):
+                return QUEUED
+        raise KeyError(f"Unknown job {job.id}.")
+
+    def _start_queued(self):
+        for job_id, process in list(self._running.items()):
+            if process.poll() is not None:
+                self._returncodes[job_id] = process.returncode
+                del self._running[job_id]
+        while self._queue and len(self._running) < self.slots:
+            job, script = self._queue.pop(0)
+            with open(job.log, "w") as log:
+                self._running[job.id] = subprocess.Popen(
+                    ["sh", script], stdout=log, stderr=subprocess.STDOUT
+                )
+
+
+class ScriptExecutor:
+    """Submits jobs to a batch scheduler through two scripts.
+
+    submit_script is called with the job script, the job name and the log
+    file, and prints the job id as the last word of its output. poll_script
+    is called with the job id and prints the state of the job, e.g. PENDING,
+    RUNNING, COMPLETED or FAILED, as known from Slurm. Wrappers around
+    sbatch/squeue or qsub/qstat fit this. Schedulers forget finished jobs,
+    e.g. squeue without sacct, so if poll_script fails or prints nothing, the
+    exit status the job script left next to the log decides.
+    """
+
+    def __init__(self, submit_script: str, poll_script: str):
+        self.submit_script = submit_script
+        self.poll_script = poll_script
+
+    def submit(self, args: list, name: str, log: Path) -> Job:
+        """Submit a job, return it."""
+        script = job_script(args, log)
+        result = subprocess.run(
+            [self.submit_script, script, name, log],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        words = result.stdout.split()
+        if not words:
+            raise RuntimeError(f"{self.submit_script} printed no job id for {name}.")
+        return Job(words[-1], name, log)
+
+    def poll(self, job: Job) -> str:
+        """Return the state of job."""
+        result = subprocess.run(
+            [self.poll_script, job.id], capture_output=True, text=True, check=False
+        )
+        words = result.stdout.split()
+        if result.returncode != 0 or not words:
+            # Finished and forgotten, or the scheduler is busy
+            return exit_state(job.log)
+        return _STATES.get(words[0].upper().rstrip("+"), RUNNING)
+
+
+def from_spec(spec: str) -> Executor:
+    """Create an executor from a spec like "local", "local:4" or "script".
+
+    "script" uses the envars TOMOTOOLS_SUBMIT_SCRIPT and TOMOTOOLS_POLL_SCRIPT.
+    """
+    kind, _, slots = spec.partition(":")
+    if kind == "local":
+        return LocalExecutor(int(slots) if slots else 1)
+    if kind == "script":
+        submit_script = os.environ.get("TOMOTOOLS_SUBMIT_SCRIPT")
+        poll_script = os.environ.get("TOMOTOOLS_POLL_SCRIPT")
+        if not submit_script or not poll_script:
+            raise ValueError(
+                "Set TOMOTOOLS_SUBMIT_SCRIPT and TOMOTOOLS_POLL_SCRIPT to use "
+                "the script executor."
+            )
+        return ScriptExecutor(submit_script, poll_script)
+    raise ValueError(f"Unknown executor {spec}, use local, local:N or script.")
+
+
+def tomotools_command(*args) -> list[str]:
+    """Return the command line to run tomotools with args in a job."""
+    return [sys.executable, "-m", "tomotools", *[str(arg) for arg in args]]
+
+
+def wait_all(
+    executor: Executor, jobs: list[Job], interval: float = 10, max_unknown: int = 30
+) -> list[Job]:
+    """Poll jobs until all are finished, return the failed ones.
+
+    Jobs whose state is UNKNOWN for max_unknown polls in a row count as failed.
+    """
+    pending = list(jobs)
+    failed = []
+    unknown = {job.id: 0 for job in jobs}
+    while pending:
+        still_pending = []
+        for job in pending:
+            state = executor.poll(job)
+            unknown[job.id] = unknown[job.id] + 1 if state == UNKNOWN else 0
+            if unknown[job.id] >= max_unknown:
+                print(f"Lost track of job {job.name} ({job.id}), see {job.log}.")
+                failed.append(job)
+            elif state == FAILED:
+                print(f"Job {job.name} ({job.id}) failed, see {job.log}.")
+                failed.append(job)
+            elif state == DONE:
+                print(f"Job {job.name} ({job.id}) is done.")
+            else:
+                still_pending.append(job)
+        pending = still_pending
+        if pending:
+            time.sleep(interval)
+    return failed
@@ -0,0 +1,136 @@
+import queue
+import subprocess
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_inventory: list["Gpu"] | None = None
+_inventory_lock = threading.Lock()
+
+
+class Gpu(NamedTuple):
+    """One GPU as listed by nvidia-smi."""
+
+    index: int
+    name: str
+    memory: int  # MiB
+
+
+def inventory() -> list[Gpu]:
+    """Return the GPUs of this node.
+
+    nvidia-smi is only queried once per process. Without it, or if it fails,
+    no GPUs are found.
+    """
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = _query()
+        return list(_inventory)
+
+
+def _query() -> list[Gpu]:
+    try:
+        result = subprocess.run(
+            [
+                "nvidia-smi",
+                "--query-gpu=index,name,memory.total",
+                "--format=csv,noheader,nounits",
+            ],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    except OSError:
+        return []
+    if result.returncode != 0:
+        return []
+
+    found = []
+    for line in result.stdout.splitlines():
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) != 3:
+            continue
+        index, name, memory = fields
+        found.append(
+            Gpu(
+                index=int(index),
+                name=name,
+                memory=int(memory) if memory.isdigit() else 0,
+            )
+        )
+    return found
+
+
+def clear_cache():
+    """Forget the GPU inventory, so nvidia-smi is asked again."""
+    global _inventory
+    with _inventory_lock:
+        _inventory = None
+
+
+def gpu_ids(gpu: str | None = None) -> list[int]:
+    """Parse a list of GPUs like "0,1", default: all GPUs of the node.
+
+    If no GPU can be found, GPU 0 is returned, which is what the GPU tools use
+    by default.
+    """
+    if gpu is not None:
+        return [int(gpu_id) for gpu_id in gpu.split(",") if gpu_id.strip()]
+    return [found.index for found in inventory()] or [0]
+
+
+class GpuPool:
+    """Hand out GPUs to concurrent jobs, so that each GPU has its own job.
+
+    Large GPUs can run several jobs at the same time, set via jobs_per_gpu.
+    """
+
+    def __init__(self, gpus: Iterable[int], jobs_per_gpu: int = 1):
+        self.gpus = list(gpus)
+        if not self.gpus:
+            raise ValueError("GpuPool needs at least one GPU.")
+        self.jobs_per_gpu = max(1, jobs_per_gpu)
+        self._free: queue.SimpleQueue[int] = queue.SimpleQueue()
+        # Round-robin, so the first jobs are spread over all GPUs
+        for _ in range(self.jobs_per_gpu):
+            for gpu in self.gpus:
+                self._free.put(gpu)
+
+    @property
+    def slots(self) -> int:
+        """Number of jobs that can run at the same time."""
+        return len(self.gpus) * self.jobs_per_gpu
+
+    @contextmanager
+    def acquire(self) -> Iterator[int]:
+        """Wait for a free GPU and hold it until the block is left."""
+        gpu = self._free.get()
+        try:
+            yield gpu
+        finally:
+            self._free.put(gpu)
+
+    def map(self, function: Callable[[T, int], R], items: Iterable[T]) -> list[R]:
+        """Call function(item, gpu) for all items, each as soon as a GPU is free.
+
+        Results are returned in the order of the items. The first exception
+        is raised once all calls are finished.
+        """
+
+        def call(item: T) -> R:
+            with self.acquire() as gpu:
+                return function(item, gpu)
+
+        items = list(items)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(len(items), self.slots)),
+            thread_name_prefix="tomotools-gpu",
+        ) as pool:
+            futures = [pool.submit(call, item) for item in items]
+        return [future.result() for future in futures]
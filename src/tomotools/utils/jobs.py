@@ -0,0 +1,353 @@
+import contextlib
+import os
+import queue
+import re
+import socket
+import subprocess
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, TypeVar
+
+T = TypeVar("T")
+P = TypeVar("P")
+R = TypeVar("R")
+
+# Directory of the job logs next to the outputs, unless a log_dir is set
+LOG_DIR_NAME = "tomotools_logs"
+
+
+def cpu_budget() -> int:
+    """Return number of CPUs tomotools may use.
+
+    Can be set with the envar TOMOTOOLS_CPUS, defaults to all available CPUs.
+    """
+    if "TOMOTOOLS_CPUS" in os.environ:
+        return max(1, int(os.environ["TOMOTOOLS_CPUS"]))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class JobRecord(NamedTuple):
+    """What ran, how long it took and how it ended."""
+
+    name: str
+    args: list[str]
+    returncode: int
+    started: float
+    duration: float
+    log: Path | None
+
+
+class JobRunner:
+    """Run external tools in a bounded pool of workers.
+
+    Every job is a subprocess. Jobs can be given a thread budget, which is
+    passed to the tool via OMP_NUM_THREADS and IMOD_PROCESSORS. Output that
+    would otherwise be discarded or printed is written to a log file per job,
+    so the output of parallel jobs isn't interleaved. The logs go into
+    log_dir, if set, otherwise into a directory per run below tomotools_logs
+    next to the outputs of each job, see job_log_dir. Return codes are checked
+    unless check=False, and every finished job is kept in .records with its
+    timing.
+
+    At most workers jobs run at once, whether they were submitted or run in
+    the calling thread. Jobs bounded otherwise, e.g. by a gpus.GpuPool, can
+    bypass this with run(bounded=False).
+
+    Workers default to the envar TOMOTOOLS_JOBS or the CPU budget, log_dir to
+    the envar TOMOTOOLS_LOG_DIR.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        cpus: int | None = None,
+        log_dir: Path | None = None,
+    ):
+        self.cpus = cpu_budget() if cpus is None else cpus
+        if workers is None:
+            workers = int(os.environ.get("TOMOTOOLS_JOBS", self.cpus))
+        self.workers = max(1, workers)
+        if log_dir is None and os.environ.get("TOMOTOOLS_LOG_DIR"):
+            log_dir = Path(os.environ["TOMOTOOLS_LOG_DIR"])
+        self.log_dir = log_dir
+        # Runs of separate processes may log into the same directory
+        self.run_name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}_{socket.gethostname()}_{os.getpid()}"
+        )
+        self.records: list[JobRecord] = []
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="tomotools-job"
+        )
+        # Shared by jobs in the pool and jobs run in the calling thread
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def submit(
+        self,
+        args: list,
+        name: str | None = None,
+        threads: int | None = None,
+        check: bool = True,
+        **kwargs,
+    ) -> "Future[subprocess.CompletedProcess]":
+        """Start args as soon as a worker is free.
+
+        name defaults to the executable. Further kwargs are passed to
+        subprocess.run. The future raises CalledProcessError if check is True
+        and the tool fails.
+        """
+        job = self._prepare(args, name, threads, kwargs)
+        return self._pool.submit(self._run, *job, check)
+
+    def _prepare(
+        self, args: list, name: str | None, threads: int | None, kwargs: dict
+    ) -> tuple[list[str], str, Path | None, dict]:
+        """Name the job, set its thread budget and choose its log file."""
+        log_dir = self.job_log_dir(args, kwargs.get("cwd"))
+        args = [str(arg) for arg in args]
+        name = Path(args[0]).name if name is None else name
+        with self._lock:
+            self._count += 1
+            number = self._count
+
+        kwargs = dict(kwargs)
+        if threads is not None:
+            kwargs["env"] = {
+                **kwargs.get("env", os.environ),
+                "OMP_NUM_THREADS": str(threads),
+                "IMOD_PROCESSORS": str(threads),
+            }
+
+        log = None
+        uncaptured = [
+            kwargs.get(stream) in (None, subprocess.DEVNULL)
+            for stream in ("stdout", "stderr")
+        ]
+        if any(uncaptured) and not kwargs.get("capture_output"):
+            safe_name = re.sub(r"[^\w.-]", "_", name)
+            log = log_dir / f"{number:04d}_{safe_name}.log"
+        return args, name, log, kwargs
+
+    def job_log_dir(self, args: list, cwd: Path | str | None = None) -> Path:
+        """Return the directory for the log of the job args, run in cwd.
+
+        Without log_dir, that is next to the last path among the arguments,
+        usually the output of the tool, or else in its working directory.
+        """
+        if self.log_dir is not None:
+            return self.log_dir
+        cwd = Path.cwd() if cwd is None else Path(cwd)
+        paths = [cwd / arg for arg in args[1:] if isinstance(arg, os.PathLike)]
+        directory = paths[-1].parent if paths else cwd
+        return directory / LOG_DIR_NAME / self.run_name
+
+    def _run(
+        self,
+        args: list[str],
+        name: str,
+        log: Path | None,
+        kwargs: dict,
+        check: bool,
+        bounded: bool = True,
+    ) -> subprocess.CompletedProcess:
+        with self._slots if bounded else contextlib.nullcontext():
+            return self._run_unbounded(args, name, log, kwargs, check)
+
+    def _run_unbounded(
+        self, args: list[str], name: str, log: Path | None, kwargs: dict, check: bool
+    ) -> subprocess.CompletedProcess:
+        started = time.time()
+        start = time.perf_counter()
+        if log is None:
+            result = subprocess.run(args, check=False, **kwargs)
+        else:
+            log.parent.mkdir(parents=True, exist_ok=True)
+            with open(log, "w") as file:
+                file.write(f"$ {' '.join(args)}\n")
+                file.flush()
+                # Output that would be discarded or printed goes into the log
+                for stream in ("stdout", "stderr"):
+                    if kwargs.get(stream) in (None, subprocess.DEVNULL):
+                        kwargs[stream] = file
+                result = subprocess.run(args, check=False, **kwargs)
+
+        with self._lock:
+            self.records.append(
+                JobRecord(
+                    name=name,
+                    args=args,
+                    returncode=result.returncode,
+                    started=started,
+                    duration=time.perf_counter() - start,
+                    log=log,
+                )
+            )
+        if check and result.returncode != 0 and log is not None:
+            print(f"{name} failed, see {log}")
+        if check:
+            result.check_returncode()
+        return result
+
+    def run(
+        self,
+        args: list,
+        name: str | None = None,
+        threads: int | None = None,
+        check: bool = True,
+        bounded: bool = True,
+        **kwargs,
+    ) -> subprocess.CompletedProcess:
+        """Run a single job in the calling thread and wait for it, see submit.
+
+        The job waits for a free worker, unless bounded is False. That is for
+        callers that are limited otherwise, e.g. one job per GPU, and
+        shouldn't wait for CPU jobs.
+        """
+        return self._run(*self._prepare(args, name, threads, kwargs), check, bounded)
+
+    def run_all(
+        self,
+        commands: list[list],
+        cpus: int | None = None,
+        check: bool = True,
+        **kwargs,
+    ) -> list[subprocess.CompletedProcess]:
+        """Run independent commands at the same time and wait for all of them.
+
+        The commands run in the pool of the runner, so together with other
+        jobs at most workers run at once. The budget, cpus (default: the
+        budget of the runner), is split evenly between the commands that run
+        at the same time. If check is True, raise CalledProcessError once all
+        commands are finished, if any of them failed.
+        """
+        cpus = self.cpus if cpus is None else cpus
+        concurrent = max(1, min(len(commands), cpus, self.workers))
+        threads = max(1, cpus // concurrent)
+        futures = [
+            self._pool.submit(
+                self._run, *self._prepare(command, None, threads, kwargs), False
+            )
+            for command in commands
+        ]
+        results = [future.result() for future in futures]
+        if check:
+            for result in results:
+                result.check_returncode()
+        return results
+
+    def summary(self) -> str:
+        """Return count and total run time of the finished jobs, per tool."""
+        totals: dict[str, list] = {}
+        with self._lock:
+            for record in self.records:
+                total = totals.setdefault(record.name, [0, 0.0, 0])
+                total[0] += 1
+                total[1] += record.duration
+                total[2] += record.returncode != 0
+        return "\n".join(
+            f"{name}: {count} jobs, {duration:.1f} s, {failed} failed"
+            for name, (count, duration, failed) in sorted(totals.items())
+        )
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs, optionally wait for the running ones."""
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+_default_runner: JobRunner | None = None
+_default_lock = threading.Lock()
+
+
+def default_runner() -> JobRunner:
+    """Return the runner shared by all of tomotools, created on first use."""
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
+
+
+def submit(args: list, **kwargs) -> "Future[subprocess.CompletedProcess]":
+    """Submit a job to the default runner, see JobRunner.submit."""
+    return default_runner().submit(args, **kwargs)
+
+
+def run(args: list, **kwargs) -> subprocess.CompletedProcess:
+    """Run a job with the default runner and wait for it, see JobRunner.submit."""
+    return default_runner().run(args, **kwargs)
+
+
+def run_all(commands: list[list], **kwargs) -> list[subprocess.CompletedProcess]:
+    """Run commands concurrently with the default runner, see JobRunner.run_all."""
+    return default_runner().run_all(commands, **kwargs)
+
+
+def pipelined(
+    items: Iterable[T],
+    produce: Callable[[T], P],
+    consume: Callable[[T, P], R],
+    depth: int = 1,
+) -> list[R]:
+    """Overlap the two steps of processing consecutive items.
+
+    produce(item) runs in a background thread, consume(item, product) in the
+    calling thread, in order. E.g. the GPUs work on the next item while the
+    CPU finishes the current one. At most depth items are produced, or being
+    produced, ahead of the one being consumed, which keeps the intermediate
+    files on disk in check.
+
+    Returns the results of consume. If either step fails, no further items are
+    produced and the exception is raised once the running step is finished.
+    """
+    # Products that weren't taken by the consumer yet, including the one in work
+    ahead = threading.Semaphore(max(1, depth))
+    products: queue.Queue = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def wait_for_slot() -> bool:
+        while not ahead.acquire(timeout=0.1):
+            if stop.is_set():
+                return False
+        return not stop.is_set()
+
+    def producer():
+        try:
+            for item in items:
+                if not wait_for_slot():
+                    return
+                products.put((item, produce(item), None))
+        except Exception as error:
+            products.put((None, None, error))
+        finally:
+            # Also after errors, so the consumer never waits forever
+            products.put((done, None, None))
+
+    thread = threading.Thread(target=producer, name="tomotools-pipeline")
+    thread.start()
+    results = []
+    try:
+        while True:
+            item, product, error = products.get()
+            if error is not None:
+                raise error
+            if item is done:
+                break
+            ahead.release()
+            results.append(consume(item, product))
+    finally:
+        stop.set()
+        thread.join()
+    return results
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from tomotools.utils import discovery, mrcheader
+
+MANIFEST_NAME = ".tomotools_manifest.json"
+VERSION = 1
+
+
+def session_dirs(input_files) -> list[Path]:
+    """Return the directories of the given input files and folders, in order."""
+    dirs: dict[Path, None] = {}
+    for input_file in input_files:
+        input_file = Path(input_file)
+        directory = input_file if input_file.is_dir() else input_file.parent
+        dirs[directory.absolute()] = None
+    return list(dirs)
+
+
+def load(directory: Path) -> bool:
+    """Fill the discovery and header caches from the manifest of directory.
+
+    The file listing is used if the directory wasn't modified since the manifest
+    was written. Headers are used as long as their files are unchanged.
+    Returns whether the file listing was used.
+    """
+    try:
+        with open(Path(directory) / MANIFEST_NAME) as file:
+            manifest = json.load(file)
+        mtime = os.stat(directory).st_mtime_ns
+    except (OSError, ValueError):
+        return False
+    try:
+        if manifest.get("version") != VERSION:
+            return False
+        # Check the whole manifest before priming the caches with any of it
+        headers = {}
+        for name, (stamp, fields) in manifest["headers"].items():
+            fields["voxel_size"] = tuple(fields["voxel_size"])
+            fields["exttyp"] = fields["exttyp"].encode("latin-1")
+            fields["labels"] = tuple(fields["labels"])
+            headers[Path(directory) / name] = (
+                tuple(stamp),
+                mrcheader.MrcHeader(**fields),
+            )
+        listed_mtime, listed = int(manifest["mtime"]), int(manifest["listed"])
+        names = [str(name) for name in manifest["names"]]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        # Damaged or written by something else
+        return False
+
+    for path, (stamp, header) in headers.items():
+        mrcheader.prime(path, stamp, header)
+
+    if listed_mtime != mtime or discovery.is_racy(listed_mtime, listed):
+        return False
+    discovery.prime(directory, mtime, names)
+    return True
+
+
+def save(directory: Path):
+    """Write the manifest of directory: its files and cached headers.
+
+    The manifest is rewritten in place, as replacing it would change the
+    modification time of the directory. Unwritable directories are skipped.
+    """
+    manifest_file = Path(directory) / MANIFEST_NAME
+    try:
+        # Creating the manifest changes the directory, so do it before listing
+        manifest_file.touch()
+        mtime = os.stat(directory).st_mtime_ns
+        listed = time.time_ns()
+        index = discovery.index(directory)
+        headers = {
+            path.name: (
+                stamp,
+                header._asdict() | {"exttyp": header.exttyp.decode("latin-1")},
+            )
+            for path, (stamp, header) in mrcheader.cached_headers(directory).items()
+            if path.name in index
+        }
+        manifest = {
+            "version": VERSION,
+            "mtime": mtime,
+            "listed": listed,
+            "names": sorted(index.names),
+            "headers": headers,
+        }
+        with open(manifest_file, "w") as file:
+            json.dump(manifest, file)
+    except OSError:
+        return
+
+
+def load_sessions(input_files) -> list[Path]:
+    """Load the manifests of all session directories of the input files.
+
+    Returns the session directories, to be passed to save_sessions later.
+    """
+    dirs = session_dirs(input_files)
+    for directory in dirs:
+        load(directory)
+    return dirs
+
+
+def save_sessions(dirs: list[Path]):
+    """Update the manifests of the given session directories."""
+    for directory in dirs:
+        if directory.is_dir():
+            save(directory)
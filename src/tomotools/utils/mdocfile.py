@@ -1,29 +1,89 @@
-from operator import itemgetter
+import bisect
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Iterator
 from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+
+from tomotools.utils import discovery
+
+# Tokens int() or float() would accept, checked in this order
+_INT = re.compile(r"[+-]?[0-9]+").fullmatch
+_FLOAT = re.compile(r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?").fullmatch
+_NONFINITE = frozenset(("nan", "inf", "infinity"))
+_NUMBER_CHARS = "0123456789_+-.eE"
+
+# Section and frameset markers, and TiltAngle values. Unanchored patterns are
+# much faster, so matches are checked to be at the start of a line afterwards.
+_SECTION_MARKER = re.compile(r"\[(?:(ZValue)|FrameSet) =")
+_TILT_ANGLE = re.compile(r"TiltAngle = ([^\n]*)")
+_SECTION_MARKER_BYTES = re.compile(rb"\[(?:(ZValue)|FrameSet) =")
+
+# Absolute path -> ((inode, mtime, size), parsed mdoc), least recently used first
+_CACHE_SIZE = 256
+_cache: OrderedDict[str, tuple[tuple[int, int, int], dict]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Entries of a parsed mdoc besides the global keys
+_ENTRIES = ("titles", "sections", "framesets")
+
+
+def _convert_unusual(field: str):
+    """Convert a token the patterns don't cover, exactly like int() and float()."""
+    try:
+        return int(field)
+    except ValueError:
+        pass
+    try:
+        return float(field)
+    except ValueError:
+        pass
+    # No conversion possible
+    return field
+
+
+def _convert_token(field: str):
+    """Convert a single token without spaces to int, float or keep it as str."""
+    if _INT(field):
+        return int(field)
+    if _FLOAT(field):
+        return float(field)
+    # Only these can still be accepted by int() or float(): unicode digits,
+    # whitespace other than space, nan/inf and digits grouped by underscores
+    if (
+        not field.isascii()
+        or not field.isprintable()
+        or field.lstrip("+-").lower() in _NONFINITE
+        or ("_" in field and not field.strip(_NUMBER_CHARS))
+    ):
+        return _convert_unusual(field)
+    return field
 
 
 def _convert_value_field(field: str):
     if " " in field:
         # If there's a space in the field,
         # it might either be a string containing spaces or a tuple of ints/floats
-        fields_split = [_convert_value_field(f) for f in field.split()]
+        fields_split = [_convert_token(f) for f in field.split()]
         # check if all fields were successfully converted to int or float
-        if all(isinstance(v, int) or isinstance(v, float) for v in fields_split):
+        if all(type(v) is not str for v in fields_split):
             return fields_split
         else:
             # otherwise it must have been a string
             return field
     else:
-        try:
-            return int(field)
-        except ValueError:
-            pass
-        try:
-            return float(field)
-        except ValueError:
-            pass
-        # No conversion possible
-        return field
+        return _convert_token(field)
 
 
 def find_relative_path(working_dir: Path, abs_path: Path):
@@ -42,8 +102,230 @@ def find_relative_path(working_dir: Path, abs_path: Path):
     return working_dir.joinpath(abs_path)
 
 
+class FrameIndex:
+    """Index of the frame files in a directory, to resolve SubFramePath values.
+
+    The directory is listed once, recursively if asked for. resolve gives the
+    same result as find_relative_path, but without a stat per path component.
+    Paths that the index can't answer exactly are still probed on disk, e.g.
+    paths through subdirectories that weren't listed.
+    """
+
+    def __init__(self, directory: Path, recursive: bool = False):
+        self.directory = Path(directory)
+        self.recursive = recursive
+        # File name -> paths relative to directory, as tuples of their parts
+        self._files: dict[str, list[tuple[str, ...]]] = {}
+        # Names of subdirectories that weren't listed
+        self._unlisted: set[str] = set()
+        try:
+            self._scan(self.directory, ())
+        except FileNotFoundError:
+            # Nothing to index, resolve then probes and returns None
+            pass
+
+    def _scan(self, directory: Path, parts: tuple[str, ...]):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # Don't follow symlinks, they could form loops
+                    if self.recursive and not entry.is_symlink():
+                        self._scan(Path(entry.path), parts + (entry.name,))
+                    else:
+                        self._unlisted.add(entry.name)
+                elif entry.is_file():
+                    self._files.setdefault(entry.name, []).append(parts + (entry.name,))
+
+    def resolve(self, subframe_path: Path) -> Path | None:
+        """Find subframe_path relative to the directory, like find_relative_path."""
+        parts = subframe_path.parts
+        if not parts:
+            return None
+        if (
+            subframe_path.is_absolute()
+            or ".." in parts
+            or any(part in self._unlisted for part in parts[:-1])
+        ):
+            return find_relative_path(self.directory, subframe_path)
+
+        # find_relative_path returns the longest existing suffix of the path
+        best = None
+        for relative in self._files.get(parts[-1], ()):
+            n = len(relative)
+            if parts[-n:] == relative and (best is None or n > len(best)):
+                best = relative
+        if best is None:
+            # The file may have been written after the directory was listed
+            return find_relative_path(self.directory, subframe_path)
+        return self.directory.joinpath(*best)
+
+
 def read(file: Path):
-    """Read mdoc from path as dictionary."""
+    """Read mdoc from path as dictionary.
+
+    Parsed mdocs are cached, keyed by path, inode, modification time and size.
+    Every call returns a copy, so callers can modify it.
+    If the envar TOMOTOOLS_MDOC_CACHE is set to a directory, parsed mdocs are
+    also stored there as JSON, to be reused by later tomotools runs.
+    """
+    stat = os.stat(file)
+    key = str(Path(file).absolute())
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            _cache.move_to_end(key)
+            return _copy(cached[1], file)
+
+    mdoc = _load_stored(key, stamp)
+    if mdoc is None:
+        with open(file) as f:
+            mdoc = _parse(f.read(), file)
+        # Files modified just now may change again without changing the stamp
+        if discovery.is_racy(stat.st_mtime_ns):
+            return mdoc
+        _store(key, stamp, mdoc)
+
+    with _cache_lock:
+        _cache[key] = (stamp, mdoc)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return _copy(mdoc, file)
+
+
+def read_sidecars(files: list[Path], max_workers: int = 16) -> list[dict | None]:
+    """Read many small mdoc files concurrently, None for missing ones.
+
+    Meant for per-movie mdocs, where the latency of the file system dominates.
+    """
+
+    def read_sidecar(file: Path) -> dict | None:
+        try:
+            return read(file)
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    if len(files) <= 1:
+        return [read_sidecar(file) for file in files]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        return list(executor.map(read_sidecar, files))
+
+
+# Marks mdocs that weren't read yet, as None means there is no mdoc
+_NOT_READ = object()
+
+
+class SidecarMdoc:
+    """Mixin for files with an mdoc of their own, e.g. movies and micrographs.
+
+    The mdoc at .mdoc_path is read on first access of .mdoc, or for many
+    files at once with read_mdocs.
+    """
+
+    mdoc_path: Path
+    _mdoc = _NOT_READ
+
+    @property
+    def mdoc(self) -> dict | None:
+        """The mdoc, read on first access. None if there is none."""
+        if self._mdoc is _NOT_READ:
+            self._mdoc = read_sidecars([self.mdoc_path])[0]
+        return self._mdoc
+
+    @mdoc.setter
+    def mdoc(self, mdoc: dict | None):
+        self._mdoc = mdoc
+
+    @staticmethod
+    def read_mdocs(files: "list[SidecarMdoc]"):
+        """Read the mdocs of all files at once, concurrently."""
+        unread = [file for file in files if file._mdoc is _NOT_READ]
+        mdocs = read_sidecars([file.mdoc_path for file in unread])
+        for file, mdoc in zip(unread, mdocs):
+            file._mdoc = mdoc
+
+
+def _copy(mdoc: dict, file: Path) -> dict:
+    """Copy a parsed mdoc. Values are scalars or lists of scalars."""
+
+    def copy_section(section: dict) -> dict:
+        return {
+            key: value.copy() if type(value) is list else value
+            for key, value in section.items()
+        }
+
+    copy = copy_section(mdoc)
+    copy["path"] = file
+    copy["titles"] = mdoc["titles"].copy()
+    copy["sections"] = [copy_section(section) for section in mdoc["sections"]]
+    copy["framesets"] = [copy_section(frameset) for frameset in mdoc["framesets"]]
+    return copy
+
+
+def _cache_file(key: str) -> Path | None:
+    cache_dir = os.environ.get("TOMOTOOLS_MDOC_CACHE")
+    if not cache_dir:
+        return None
+    return Path(cache_dir) / f"{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+
+def _load_stored(key: str, stamp: tuple) -> dict | None:
+    """Load a parsed mdoc from the on-disk cache, None if missing or outdated."""
+    cache_file = _cache_file(key)
+    if cache_file is None:
+        return None
+    try:
+        with open(cache_file) as f:
+            content = json.load(f)
+        stored_key, stored_stamp, mdoc = (
+            content["key"],
+            tuple(content["stamp"]),
+            content["mdoc"],
+        )
+        if not all(type(mdoc[entry]) is list for entry in _ENTRIES):
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        # Missing, from another tomotools version or written concurrently
+        return None
+    if stored_key != key or stored_stamp != stamp:
+        return None
+    return mdoc
+
+
+def _store(key: str, stamp: tuple, mdoc: dict):
+    """Save a parsed mdoc to the on-disk cache, if it is enabled."""
+    cache_file = _cache_file(key)
+    if cache_file is None:
+        return
+    # The path is set by read, depending on how the file was named
+    content = {
+        "key": key,
+        "stamp": stamp,
+        "mdoc": {name: value for name, value in mdoc.items() if name != "path"},
+    }
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp, cache_file)
+    except (OSError, TypeError, ValueError):
+        # E.g. a full disk, or values JSON can't hold
+        os.unlink(tmp)
+
+
+def clear_cache():
+    """Forget all mdocs cached in memory."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _parse(text: str, file: Path) -> dict:
+    """Parse the contents of an mdoc file."""
     mdoc = {}
     mdoc["path"] = file
     mdoc["titles"] = []
@@ -52,58 +334,275 @@ def read(file: Path):
     # The currently edited dict, at the beginning this is "global" the mdoc itself
     # For each ZValue current_section will be set to the dict belonging to that section
     current_section = mdoc
-    with open(file) as f:
-        for line in f:
-            line = line.strip()
-            # field, value = line.split(' = ')
+    # Values repeat a lot between sections, so each is converted only once.
+    # Lists are copied, so sections don't share them.
+    converted: dict[str, object] = {}
+    # Same lines as iterating over the file, but without the per-line overhead
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == "[":
             if line.startswith("[T ="):  # Title
                 mdoc["titles"].append(line[4:-1])
+                continue
             elif line.startswith("[ZValue ="):  # Section
                 current_section = {}
                 mdoc["sections"].append(current_section)
+                continue
             elif line.startswith("[FrameSet ="):  # Section
                 current_section = {}
                 mdoc["framesets"].append(current_section)
-            elif len(line) == 0:
                 continue
-            else:
-                try:
-                    key, value = line.split(" = ", maxsplit=1)
-                    current_section[key] = _convert_value_field(value)
-                except ValueError:
-                    print(f'Parsing error, invalid line: "{line}"')
+        key, sep, value = line.partition(" = ")
+        if not sep:
+            print(f'Parsing error, invalid line: "{line}"')
+            continue
+        if value in converted:
+            field = converted[value]
+        else:
+            field = converted[value] = _convert_value_field(value)
+        current_section[key] = field.copy() if type(field) is list else field
     return mdoc
 
 
-def _write_key_value(file, key, value):
+class LazyMdoc:
+    """An mdoc file of which only as much is parsed as is asked for.
+
+    Global keys, titles and the number of sections are parsed on creation.
+    Tilt angles and full sections are parsed on first access.
+    read() returns the same dictionary as mdocfile.read.
+    """
+
+    def __init__(self, file: Path):
+        self.path = file
+        with open(file) as f:
+            self._text = f.read()
+        markers = [
+            match
+            for match in _SECTION_MARKER.finditer(self._text)
+            if self._starts_line(match.start())
+        ]
+        # Sections end at the next section or frameset
+        ends = [match.start() for match in markers[1:]] + [len(self._text)]
+        self._sections = [
+            (match.end(), end)
+            for match, end in zip(markers, ends)
+            if match.group(1) == "ZValue"
+        ]
+        head = self._text[: markers[0].start()] if markers else self._text
+        self.globals = _parse(head, file)
+        self._mdoc: dict | None = None
+        self._tilt_angles: list | None = None
+
+    def _starts_line(self, position: int) -> bool:
+        """Whether only whitespace precedes position in its line."""
+        line_start = self._text.rfind("\n", 0, position) + 1
+        return self._text[line_start:position].isspace() or line_start == position
+
+    @property
+    def n_sections(self) -> int:
+        """Number of sections."""
+        return len(self._sections)
+
+    def get(self, key, default=None):
+        """Return a global value."""
+        return self.globals.get(key, default)
+
+    def __getitem__(self, key):
+        return self.globals[key]
+
+    def tilt_angles(self) -> list:
+        """Return the TiltAngle of every section, without parsing the rest."""
+        if self._mdoc is not None:
+            return [section["TiltAngle"] for section in self._mdoc["sections"]]
+        if self._tilt_angles is None:
+            starts = [start for start, _ in self._sections]
+            values: list[str | None] = [None] * len(starts)
+            position = starts[0] if starts else len(self._text)
+            for match in _TILT_ANGLE.finditer(self._text, position):
+                i = bisect.bisect_right(starts, match.start()) - 1
+                # Skip matches in framesets or within other lines
+                if match.start() < self._sections[i][1] and self._starts_line(
+                    match.start()
+                ):
+                    # Like read, the last value wins
+                    values[i] = match.group(1).rstrip()
+            if None in values:
+                raise KeyError(f"Section without TiltAngle in {self.path}.")
+            converted = {value: _convert_value_field(value) for value in set(values)}
+            self._tilt_angles = [converted[value] for value in values]
+        return self._tilt_angles
+
+    @property
+    def sections(self) -> list[dict]:
+        """Return all sections, parsing the whole file."""
+        return self.read()["sections"]
+
+    def read(self) -> dict:
+        """Return the whole mdoc as dictionary, like mdocfile.read."""
+        if self._mdoc is None:
+            self._mdoc = _parse(self._text, self.path)
+            # The text isn't needed anymore
+            self._text = ""
+        return self._mdoc
+
+
+class MdocEvent(NamedTuple):
+    """A section or frameset appended to an mdoc."""
+
+    kind: str  # "section" or "frameset"
+    index: int
+    data: dict
+
+
+class MdocTail:
+    """Follow an mdoc file while it is being written, e.g. by SerialEM.
+
+    poll() parses only what was appended since the last call, and returns the
+    newly completed sections and framesets as events. A section is complete
+    once the next one starts or it is followed by a blank line, like SerialEM
+    writes them. finish() also returns a last, unterminated section.
+    The mdoc read so far is available as .mdoc, in the format of read().
+    """
+
+    def __init__(self, file: Path):
+        self.path = file
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        # (st_dev, st_ino) of the file read so far
+        self._identity: tuple[int, int] | None = None
+        self.mdoc = {"path": self.path, "titles": [], "sections": [], "framesets": []}
+
+    def poll(self) -> list[MdocEvent]:
+        """Return events for all sections completed since the last call."""
+        return self._read(finish=False)
+
+    def finish(self) -> list[MdocEvent]:
+        """Like poll, but treat the end of the file as end of the last section."""
+        return self._read(finish=True)
+
+    def _read(self, finish: bool) -> list[MdocEvent]:
+        try:
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                identity = (st.st_dev, st.st_ino)
+                if st.st_size < self.offset or self._identity not in (None, identity):
+                    # The file was replaced or truncated, start over
+                    self._reset()
+                self._identity = identity
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        # Only complete lines, the last one may still be written
+        data = data[: data.rfind(b"\n") + 1]
+        markers = [
+            match
+            for match in _SECTION_MARKER_BYTES.finditer(data)
+            if not data[data.rfind(b"\n", 0, match.start()) + 1 : match.start()].strip()
+        ]
+        if finish or data.endswith((b"\n\n", b"\n\r\n")):
+            end = len(data)
+        elif self.offset == 0 and not markers:
+            # Globals and titles are complete once the first section starts
+            end = 0
+        else:
+            end = markers[-1].start() if markers else 0
+        if end == 0:
+            return []
+
+        chunk = _parse(data[:end].decode(), self.path)
+        self.offset += end
+
+        for key, value in chunk.items():
+            if key not in ("path", "titles", "sections", "framesets"):
+                self.mdoc[key] = value
+        self.mdoc["titles"] += chunk["titles"]
+
+        # Events in file order, sections and framesets may be interleaved
+        entries = {plural: iter(chunk[plural]) for plural in ("sections", "framesets")}
+        events = []
+        for match in markers:
+            if match.start() >= end:
+                break
+            kind, plural = (
+                ("section", "sections") if match.group(1) else ("frameset", "framesets")
+            )
+            entry = next(entries[plural])
+            events.append(MdocEvent(kind, len(self.mdoc[plural]), entry))
+            self.mdoc[plural].append(entry)
+        return events
+
+    def follow(
+        self, interval: float = 5.0, idle_timeout: float | None = None
+    ) -> Iterator[MdocEvent]:
+        """Yield events as sections are appended.
+
+        Stops once nothing was appended for idle_timeout seconds, then the last
+        section is yielded, too. Without idle_timeout, this never stops.
+        """
+        last_event = time.monotonic()
+        while True:
+            events = self.poll()
+            yield from events
+            if events:
+                last_event = time.monotonic()
+            elif (
+                idle_timeout is not None
+                and time.monotonic() - last_event > idle_timeout
+            ):
+                yield from self.finish()
+                return
+            time.sleep(interval)
+
+
+def _format_key_value(key, value) -> str:
     if isinstance(value, list):
-        file.write(f"{key} = {' '.join([str(v) for v in value])}\n")
+        return f"{key} = {' '.join([str(v) for v in value])}\n"
     else:
-        file.write(f"{key} = {value!s}\n")
+        return f"{key} = {value!s}\n"
 
 
 def write(mdoc, path):
-    """Write mdoc from dict at path."""
-    with open(path, "w") as file:
-        # First write global vars, then titles, ZValues and FrameSets
-        for key, value in mdoc.items():
-            if key in ("titles", "sections", "framesets"):
-                continue
-            _write_key_value(file, key, value)
+    """Write mdoc from dict at path.
 
-        for title in mdoc["titles"]:
-            file.write(f"\n\n[T = {title}]")
+    The mdoc is written to a temporary file in one go, which then replaces path.
+    Readers therefore never see a partially written mdoc.
+    """
+    # First write global vars, then titles, ZValues and FrameSets
+    parts = [
+        _format_key_value(key, value)
+        for key, value in mdoc.items()
+        if key not in ("titles", "sections", "framesets")
+    ]
 
-        file.write("\n")
-        for i, section in enumerate(mdoc["sections"]):
-            file.write(f"\n[ZValue = {i}]\n")
-            for key, value in section.items():
-                _write_key_value(file, key, value)
+    for title in mdoc["titles"]:
+        parts.append(f"\n\n[T = {title}]")
 
-        for i, frameset in enumerate(mdoc["framesets"]):
-            file.write(f"[FrameSet = {i}]\n")
-            for key, value in frameset.items():
-                _write_key_value(file, key, value)
+    parts.append("\n")
+    for i, section in enumerate(mdoc["sections"]):
+        parts.append(f"\n[ZValue = {i}]\n")
+        parts += [_format_key_value(key, value) for key, value in section.items()]
+
+    for i, frameset in enumerate(mdoc["framesets"]):
+        parts.append(f"[FrameSet = {i}]\n")
+        parts += [_format_key_value(key, value) for key, value in frameset.items()]
+
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    # Unlike mkstemp, this leaves the permissions to the umask, like open()
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write("".join(parts))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 
 def downgrade_DateTime(mdoc: dict):
@@ -118,25 +617,71 @@ def downgrade_DateTime(mdoc: dict):
     return mdoc
 
 
-def insert_prior_dose(mdoc: dict):
-    """Add PriorRecordDose according to DateTime."""
-    # Sorte by DateTime to get order of acquisition
-    mdoc["sections"] = sorted(mdoc["sections"], key=itemgetter("DateTime"))
+def sections_table(mdoc: dict) -> pd.DataFrame:
+    """Return the sections of mdoc as DataFrame, one row per section.
 
-    acc_dose = 0
+    Keys missing in some sections are pd.NA. Columns of ints stay integer
+    columns, and columns mixing types are kept as objects, so every value
+    keeps its type. Use table_to_sections to convert back.
+    """
+    sections = mdoc["sections"]
+    keys = dict.fromkeys(key for section in sections for key in section)
+    columns = {}
+    for key in keys:
+        values = [section.get(key, pd.NA) for section in sections]
+        types = {type(value) for value in values if value is not pd.NA}
+        missing = any(value is pd.NA for value in values)
+        if types == {int}:
+            dtype = "Int64" if missing else "int64"
+        elif types == {float} and not missing:
+            dtype = "float64"
+        else:
+            dtype = object
+        columns[key] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(sections)))
 
-    for section in mdoc["sections"]:
-        section["PriorRecordDose"] = acc_dose
-        acc_dose += section["ExposureDose"]
 
-    mdoc["sections"] = sorted(mdoc["sections"], key=itemgetter("TiltAngle"))
+def table_to_sections(table: pd.DataFrame) -> list[dict]:
+    """Convert a table of sections back to the list of dicts used by write.
+
+    Keys are left out of the sections that didn't have them, i.e. where the
+    table holds pd.NA. Other values, NaN included, are kept.
+    """
+    columns = {column: table[column].tolist() for column in table.columns}
+    sections = []
+    for i in range(len(table)):
+        section = {}
+        for column, values in columns.items():
+            value = values[i]
+            if type(value) is list:
+                section[column] = value.copy()
+            elif value is not pd.NA and value is not None:
+                section[column] = value
+        sections.append(section)
+    return sections
+
+
+def insert_prior_dose(mdoc: dict):
+    """Add PriorRecordDose according to DateTime."""
+    # Sort by DateTime to get order of acquisition
+    table = sections_table(mdoc).sort_values("DateTime", kind="stable")
+    # Summed like the doses are written, so integer doses stay integers
+    doses = table["ExposureDose"].tolist()
+    table["PriorRecordDose"] = pd.Series(
+        list(itertools.accumulate(doses[:-1], initial=0)),
+        index=table.index,
+        dtype=object,
+    )
+
+    table = table.sort_values("TiltAngle", kind="stable")
+    mdoc["sections"] = table_to_sections(table)
 
     return mdoc
 
 
 def get_start_tilt(mdoc: dict):
     """Returns the starting tilt, even after reordering."""
-    # Sorte by DateTime to get order of acquisition
-    mdoc["sections"] = sorted(mdoc["sections"], key=itemgetter("DateTime"))
-
-    return mdoc["sections"][0]["TiltAngle"]
+    # The first tilt in order of acquisition, ties keep their order like sorted()
+    table = sections_table(mdoc)
+    first = table["DateTime"].to_numpy().argsort(kind="stable")[0]
+    return table["TiltAngle"].tolist()[first]
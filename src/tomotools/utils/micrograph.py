@@ -5,11 +5,11 @@ from os.path import isfile, join
 from pathlib import Path
 
 
-from tomotools.utils import mdocfile, util
+from tomotools.utils import gpus, jobs, mdocfile
 from tomotools.utils.movie import Movie
 
 
-class Micrograph:
+class Micrograph(mdocfile.SidecarMdoc):
     """Class for Micrographs."""
 
     def __init__(self, path: Path, tilt_angle: float = 0.0):
@@ -17,7 +17,6 @@ class Micrograph:
             raise FileNotFoundError(f"File not found: {path}")
         self.path: Path = path
         self.mdoc_path: Path = Path(str(path) + ".mdoc")
-        self.mdoc = mdocfile.read(self.mdoc_path) if self.mdoc_path.is_file() else None
         self.tilt_angle: float = tilt_angle
         self.is_split: bool = False
         self.evn_path: Path | None = None
@@ -58,47 +57,38 @@ class Micrograph:
         mcflip: int | None = None,
         override_gainref: Path | None = None,
         gpu: str | None = None,
+        threads: int | None = None,
+        gain_mrc: Path | None = None,
     ) -> "list[Micrograph]":
-        """Create micrograph from a list of movies using MotionCor."""
+        """Create micrograph from a list of movies using MotionCor.
+
+        Movies are distributed over the GPUs (default: all), each GPU corrects
+        one movie at a time with threads CPU threads (default: an even share
+        of the CPU budget). gain_mrc is the gain reference already converted
+        by convert_gainref, e.g. once for all movies of a tilt series.
+        """
         tempdir = output_dir.joinpath("motioncor2_temp")
         tempdir.mkdir(parents=True)
 
+        # All per-movie mdocs are needed below, read them in one go
+        Movie.read_mdocs(movies)
+
         # Find gain reference
         # 1. Use override_gainref if given
         # 2. Otherwise, check mdoc for gain reference
         if override_gainref is not None:
             override_gainref = Path(override_gainref)
-        elif override_gainref is None and movies[0].mdoc is not None:
-            # Check if there is a subframe mdoc and if it contains a gain reference path
-            gain_refs = {
-                movie.mdoc["framesets"][0].get("GainReference", None)
-                for movie in movies
-                if movie.mdoc is not None
-            }
-            gain_refs.discard(None)
-            if len(gain_refs) > 1:
-                raise Exception("Found multiple gain references, only one is supported")
-            elif len(gain_refs) == 1:
-                # The gain ref should be in the same folder as the input file(s)
-                # Check if it's there.
-                override_gainref = Path(gain_refs.pop())
-                override_gainref = movies[0].path.parent / override_gainref  # pyright: ignore[reportOperatorIssue]
-                if not override_gainref.is_file():  # pyright: ignore[reportOptionalMemberAccess]
-                    raise FileNotFoundError(
-                        f"Couldn't find gain reference at {override_gainref}, aborting"
-                    )
+        else:
+            override_gainref = find_gainref(movies)
 
         # Convert gain reference to mrc if needed
-        if override_gainref is None:
+        if gain_mrc is not None:
+            gain_ref_mrc = gain_mrc
+        elif override_gainref is None:
             gain_ref_mrc = None
             print("No gainref is given or found, continuing without gain correction.")
         else:
-            gain_ref_mrc = _ensure_gainref_mrc(override_gainref, output_dir)
-            if not gain_ref_mrc.is_file():
-                raise FileNotFoundError(
-                    f"The GainRef file {gain_ref_mrc} doesn't exist!"
-                )
-            print(f"Using gainref file {gain_ref_mrc}")
+            gain_ref_mrc = convert_gainref(override_gainref, output_dir)
 
         # Build and run MotionCor command
         command = [
@@ -107,15 +97,6 @@ class Micrograph:
             str(binning),
         ]
 
-        if gpu is None:
-            command += (
-                ["-Gpu"] + [str(i) for i in range(util.num_gpus())]
-                if util.num_gpus() > 0
-                else []
-            )
-        else:
-            command += ["-Gpu", gpu]
-
         if splitsum:
             command += ["-SplitSum", "1"]
 
@@ -151,22 +132,54 @@ class Micrograph:
         else:
             command += ["-Group", str(group)]
 
-        # Now, correct every movie separately, since -Serial 1 causes issues
-        for movie in movies:
+        # Now, correct every movie separately, since -Serial 1 causes issues.
+        # Each GPU corrects one movie at a time, with a log per movie.
+        gpu_pool = gpus.GpuPool(gpus.gpu_ids(gpu))
+        if threads is None:
+            threads = max(1, jobs.cpu_budget() // gpu_pool.slots)
+        log_dir = tempdir / "logs"
+        log_dir.mkdir()
+
+        def correct(numbered_movie: tuple[int, Movie], gpu_id: int) -> Path:
+            number, movie = numbered_movie
             in_flag = "-InMrc" if movie.is_mrc else "-InTiff"
             out_path = (output_dir / movie.path.with_suffix(".mrc").name).absolute()
-            movie_command = command + [
-                in_flag,
-                movie.path,
-                "-OutMrc",
-                out_path,
-            ]
+            log = log_dir / f"{number:04d}_{movie.path.stem}.log"
+            with open(log, "w") as out, open(log.with_suffix(".err"), "w") as err:
+                try:
+                    jobs.run(
+                        command
+                        + [
+                            "-Gpu",
+                            str(gpu_id),
+                            in_flag,
+                            movie.path,
+                            "-OutMrc",
+                            out_path,
+                        ],
+                        name="MotionCor",
+                        threads=threads,
+                        # Bounded by the GPU pool
+                        bounded=False,
+                        cwd=output_dir,
+                        stdout=out,
+                        stderr=err,
+                    )
+                except subprocess.CalledProcessError:
+                    print(f"MotionCor failed on {movie.path}, see {log}")
+                    raise
+            return log
 
-            with (
-                open(output_dir / "motioncor2.log", "a") as out,
-                open(output_dir / "motioncor2.err", "a") as err,
-            ):
-                subprocess.run(movie_command, cwd=output_dir, stdout=out, stderr=err)
+        logs = gpu_pool.map(correct, enumerate(movies))
+
+        # Keep the combined logs of all movies, in order
+        with (
+            open(output_dir / "motioncor2.log", "a") as out,
+            open(output_dir / "motioncor2.err", "a") as err,
+        ):
+            for log in logs:
+                out.write(log.read_text())
+                err.write(log.with_suffix(".err").read_text())
 
         # If present, copy the mdoc files to the output dir
         # Rename from .tif.mdoc to .mrc.mdoc
@@ -245,6 +258,45 @@ def motioncor_executable() -> str | None:
         raise FileNotFoundError("MotionCor not found. Check README.md for setup info.")
 
 
+def find_gainref(movies: list[Movie]) -> Path | None:
+    """Return the gain reference named in the mdocs of the movies, if any."""
+    # All per-movie mdocs are needed, read them in one go
+    Movie.read_mdocs(movies)
+    if movies[0].mdoc is None:
+        return None
+    # Check if there is a subframe mdoc and if it contains a gain reference path
+    gain_refs = {
+        movie.mdoc["framesets"][0].get("GainReference", None)
+        for movie in movies
+        if movie.mdoc is not None
+    }
+    gain_refs.discard(None)
+    if len(gain_refs) > 1:
+        raise Exception("Found multiple gain references, only one is supported")
+    elif len(gain_refs) == 1:
+        # The gain ref should be in the same folder as the input file(s)
+        # Check if it's there.
+        gain_ref = movies[0].path.parent / Path(gain_refs.pop())
+        if not gain_ref.is_file():
+            raise FileNotFoundError(
+                f"Couldn't find gain reference at {gain_ref}, aborting"
+            )
+        return gain_ref
+    return None
+
+
+def convert_gainref(gain_ref: Path, output_dir: Path) -> Path:
+    """Convert the gain reference to mrc in output_dir/motioncor2_gain if needed.
+
+    Returns the mrc file.
+    """
+    gain_ref_mrc = _ensure_gainref_mrc(gain_ref, output_dir)
+    if not gain_ref_mrc.is_file():
+        raise FileNotFoundError(f"The GainRef file {gain_ref_mrc} doesn't exist!")
+    print(f"Using gainref file {gain_ref_mrc}")
+    return gain_ref_mrc
+
+
 def _ensure_gainref_mrc(gain_ref: Path, output_dir: Path) -> Path:
     temp_gain = output_dir / "motioncor2_gain"
     temp_gain.mkdir()
@@ -254,9 +306,9 @@ def _ensure_gainref_mrc(gain_ref: Path, output_dir: Path) -> Path:
         case ".mrc":
             gain_out = gain_ref
         case ".dm4":
-            subprocess.run(["dm2mrc", gain_ref, gain_out], stdout=subprocess.DEVNULL)
+            jobs.run(["dm2mrc", gain_ref, gain_out], stdout=subprocess.DEVNULL)
         case ".tif" | ".tiff" | ".gain":
-            subprocess.run(["tif2mrc", gain_ref, gain_out], stdout=subprocess.DEVNULL)
+            jobs.run(["tif2mrc", gain_ref, gain_out], stdout=subprocess.DEVNULL)
         case _:
             raise AttributeError(
                 "Gain reference can only be in .tif(f) or .dm4 format!"
@@ -322,6 +374,6 @@ def defects_tif(gainref: Path, tempdir: Path, template: Path) -> Path | None:
         return None
     defects_tif = Path(tempdir) / defects_txt.with_suffix(".tif")
 
-    subprocess.run(["clip", "defect", "-D", defects_txt, template, defects_tif])
+    jobs.run(["clip", "defect", "-D", defects_txt, template, defects_tif])
     print(f"Found and converted defects file {defects_tif}")
     return defects_tif
@@ -4,7 +4,7 @@ from pathlib import Path
 from tomotools.utils import mdocfile
 
 
-class Movie:
+class Movie(mdocfile.SidecarMdoc):
     """Object for frameseries / movie."""
 
     def __init__(self, path: Path, tilt_angle: float = 0.0):
@@ -13,9 +13,6 @@ class Movie:
         self.path: Path = path
         self.tilt_angle: float = tilt_angle
         self.mdoc_path: Path = Path(f"{path}.mdoc")
-        self.mdoc: dict | None = (
-            mdocfile.read(self.mdoc_path) if self.mdoc_path.is_file() else None
-        )
 
     @property
     def is_mrc(self):
@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+from mrcfile.dtypes import HEADER_DTYPE
+
+_AXIS_ANGLE_PATTERNS = [
+    # SerialEM spelling first, then Tomo5
+    re.compile(r"Tilt axis angle\s*=\s*([+-]?\d*\.?\d+)"),
+    re.compile(r"TiltAxisAngle\s*=\s*([+-]?\d*\.?\d+)"),
+]
+
+# Absolute path -> ((mtime, size), header), so a rewritten file replaces its entry
+_cache: dict[str, tuple[tuple[int, int], "MrcHeader"]] = {}
+_cache_lock = threading.Lock()
+
+
+class MrcHeader(NamedTuple):
+    """The parts of an MRC header tomotools needs."""
+
+    nx: int
+    ny: int
+    nz: int
+    mode: int
+    voxel_size: tuple[float, float, float]
+    exttyp: bytes
+    labels: tuple[str, ...]
+
+    @property
+    def dimZYX(self) -> tuple[int, int, int]:
+        """Dimensions in the order of the data array."""
+        return (self.nz, self.ny, self.nx)
+
+    @property
+    def angpix(self) -> float:
+        """Pixel size in x."""
+        return self.voxel_size[0]
+
+    @property
+    def axis_angle(self) -> float | None:
+        """Tilt axis angle from the labels, None if it isn't there."""
+        for pattern in _AXIS_ANGLE_PATTERNS:
+            for label in self.labels:
+                match = pattern.search(label)
+                if match is not None:
+                    return float(match.group(1))
+        return None
+
+
+def _parse(raw: bytes, path: Path) -> MrcHeader:
+    """Parse the 1024-byte main header."""
+    header = np.frombuffer(raw, dtype=HEADER_DTYPE, count=1)[0]
+    if header["map"] != b"MAP ":
+        raise ValueError(f"{path} is not an MRC file.")
+    # Machine stamp 0x11 is big-endian, everything else is little-endian
+    if header["machst"][0] == 0x11:
+        header = np.frombuffer(raw, dtype=HEADER_DTYPE.newbyteorder(">"), count=1)[0]
+
+    nx, ny, nz = (int(header[n]) for n in ("nx", "ny", "nz"))
+    cella = header["cella"]
+    sampling = [int(header[m]) for m in ("mx", "my", "mz")]
+    voxel_size = tuple(
+        float(cella[i]) / sampling[i] if sampling[i] != 0 else 0.0 for i in range(3)
+    )
+    # Not every writer keeps nlabl up to date, so all non-empty labels are kept
+    labels = tuple(
+        label.decode("ascii", errors="replace").strip()
+        for label in header["label"]
+        if label.strip()
+    )
+    return MrcHeader(
+        nx=nx,
+        ny=ny,
+        nz=nz,
+        mode=int(header["mode"]),
+        voxel_size=voxel_size,
+        exttyp=bytes(header["exttyp"]),
+        labels=labels,
+    )
+
+
+def read_header(path: Path) -> MrcHeader:
+    """Read the main header of an MRC file, without mapping its data.
+
+    Headers are cached for the whole process, keyed by path, modification time
+    and size of the file. A rewritten file is therefore read again.
+    """
+    path = Path(path)
+    stat = os.stat(path)
+    key, stamp = str(path.absolute()), (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(path, "rb") as file:
+        raw = file.read(HEADER_DTYPE.itemsize)
+    if len(raw) < HEADER_DTYPE.itemsize:
+        raise ValueError(f"{path} is too short to be an MRC file.")
+    header = _parse(raw, path)
+
+    with _cache_lock:
+        _cache[key] = (stamp, header)
+    return header
+
+
+def cached_headers(directory: Path) -> dict[Path, tuple[tuple[int, int], MrcHeader]]:
+    """Return the cached headers of files in directory, with their stamps."""
+    directory = Path(directory).absolute()
+    with _cache_lock:
+        return {
+            Path(key): entry
+            for key, entry in _cache.items()
+            if Path(key).parent == directory
+        }
+
+
+def prime(path: Path, stamp: tuple[int, int], header: MrcHeader):
+    """Add a header read elsewhere, e.g. from a session manifest, to the cache.
+
+    It is only used as long as the file still has the given (mtime, size) stamp.
+    """
+    with _cache_lock:
+        _cache[str(Path(path).absolute())] = (tuple(stamp), header)
+
+
+def invalidate(path: Path):
+    """Forget the cached header of path, e.g. after editing it in place."""
+    with _cache_lock:
+        _cache.pop(str(Path(path).absolute()), None)
+
+
+def clear_cache():
+    """Forget all cached headers."""
+    with _cache_lock:
+        _cache.clear()
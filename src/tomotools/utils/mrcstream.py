@@ -0,0 +1,151 @@
+import queue
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import mrcfile
+import numpy as np
+
+_DONE = object()
+
+
+def _drain(q: queue.Queue, thread: threading.Thread):
+    """Empty q until thread is finished, so that it isn't stuck on put()."""
+    while thread.is_alive():
+        try:
+            q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+
+def iter_chunks(
+    path: Path, chunk_size: int = 1, prefetch: int = 2
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Iterate over an mrc file in chunks along its first (z) axis.
+
+    Yields the index of the first section and a (chunk_size, ny, nx) array.
+    The last chunk can be smaller.
+
+    If prefetch is 0, the chunks are views into the memory-mapped file. Otherwise,
+    a background thread reads up to prefetch chunks ahead into memory, which
+    overlaps disk I/O with the processing of the current chunk.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+
+    with mrcfile.mmap(path, mode="r") as mrc:
+        data = mrc.data
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        starts = range(0, data.shape[0], chunk_size)
+
+        if prefetch == 0:
+            for start in starts:
+                yield start, data[start : start + chunk_size]
+            return
+
+        chunks: queue.Queue = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def read_ahead():
+            try:
+                for start in starts:
+                    if stop.is_set():
+                        return
+                    # Copying forces the read from disk in this thread
+                    chunks.put((start, np.array(data[start : start + chunk_size])))
+                chunks.put(_DONE)
+            except Exception as e:
+                chunks.put(e)
+
+        reader = threading.Thread(target=read_ahead, daemon=True)
+        reader.start()
+        try:
+            while (item := chunks.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            _drain(chunks, reader)
+            reader.join()
+
+
+class ChunkWriter:
+    """Write a new mrc file chunk by chunk along its z axis.
+
+    Chunks are copied into the memory-mapped file by a background thread, so the
+    next chunk can be computed meanwhile. The header can be edited via .mrc
+    before closing. Header statistics are updated on close.
+
+    Use as context manager:
+        with ChunkWriter(path, (nz, ny, nx)) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        shape: tuple[int, int, int],
+        mrc_mode: int = 2,
+        extended_header: np.ndarray | None = None,
+        exttyp: bytes | None = None,
+        queue_size: int = 2,
+    ):
+        self.path = path
+        self.mrc = mrcfile.new_mmap(
+            path,
+            shape=shape,
+            mrc_mode=mrc_mode,
+            overwrite=True,
+            extended_header=extended_header,
+            exttyp=exttyp,
+        )
+        self._next = 0
+        self._error: Exception | None = None
+        self._chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._write_behind, daemon=True)
+        self._thread.start()
+
+    def _write_behind(self):
+        while (item := self._chunks.get()) is not _DONE:
+            if self._error is not None:
+                continue
+            start, chunk = item
+            try:
+                self.mrc.data[start : start + chunk.shape[0]] = chunk
+            except Exception as e:
+                self._error = e
+
+    def write(self, chunk: np.ndarray):
+        """Append chunk, either a single (ny, nx) section or a (n, ny, nx) stack."""
+        if self._error is not None:
+            raise self._error
+        # Views, e.g. into another memory-mapped file, may be gone before writing
+        if not chunk.flags.owndata:
+            chunk = chunk.copy()
+        if chunk.ndim == 2:
+            chunk = chunk[np.newaxis]
+        if self._next + chunk.shape[0] > self.mrc.data.shape[0]:
+            raise IndexError(f"Too many sections written to {self.path}.")
+        self._chunks.put((self._next, chunk))
+        self._next += chunk.shape[0]
+
+    def close(self):
+        """Wait for pending writes, update header statistics and close the file."""
+        if self._thread.is_alive():
+            self._chunks.put(_DONE)
+            self._thread.join()
+        try:
+            if self._error is not None:
+                raise self._error
+            self.mrc.update_header_stats()
+        finally:
+            self.mrc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from tomotools.utils import checkpoint
+
+# Scratch space a tilt series needs, as a multiple of its staged inputs:
+# aligned, binned and dose-filtered stacks exist side by side for a while
+SPACE_FACTOR = 4
+
+
+class Scratch:
+    """Local scratch space for the intermediate files of tilt series.
+
+    Inputs are copied into a workspace of their own in a fresh directory
+    below root, e.g. on a local NVMe drive or tmpfs, so the random I/O of
+    the tools stays off network storage. Products are copied back by a
+    background thread, so the next tilt series can start in the meantime.
+    Closing the scratch space waits for those copies and removes it,
+    together with the workspaces of failed tilt series.
+    """
+
+    def __init__(self, root: Path, space_factor: float = SPACE_FACTOR):
+        Path(root).mkdir(parents=True, exist_ok=True)
+        self.root = Path(tempfile.mkdtemp(prefix="tomotools-", dir=root)).absolute()
+        self.space_factor = space_factor
+        self._copier = ThreadPoolExecutor(1, thread_name_prefix="tomotools-copy")
+        self._copies: list[Future] = []
+        # Workspace -> bytes set aside for it
+        self._reserved: dict[Path, int] = {}
+        self._lock = threading.Lock()
+
+    def stage_in(self, name: str, files: Iterable[Path]) -> Path | None:
+        """Copy files into a new workspace, return it.
+
+        Return None if there isn't enough space, even once the pending copies
+        are done, so the tilt series has to be processed in place.
+        """
+        files = [Path(file) for file in files]
+        needed = int(self.space_factor * sum(file.stat().st_size for file in files))
+        # Tilt series of separate directories may have the same name
+        workspace = Path(tempfile.mkdtemp(prefix=f"{name}.", dir=self.root))
+        if not self._reserve(workspace, needed):
+            # Products of earlier tilt series may still take up space
+            self._wait_for_copies()
+            if not self._reserve(workspace, needed):
+                self.discard(workspace)
+                print(
+                    f"Not enough scratch space for {name} in {self.root} "
+                    f"({needed / 1024**3:.1f} GB), processing it in place."
+                )
+                return None
+
+        try:
+            for file in files:
+                shutil.copy2(file, workspace / file.name)
+        except BaseException:
+            self.discard(workspace)
+            raise
+        return workspace
+
+    def copy_back(
+        self,
+        workspace: Path,
+        destination: Path,
+        inputs: checkpoint.Stamp,
+        then: Callable[[], None] | None = None,
+    ) -> Future:
+        """Copy the products in workspace to destination in the background.
+
+        inputs is the stamp of the workspace right after staging in, so files
+        that weren't changed since are not copied back. then is called once
+        all files are in place, before the workspace is removed.
+        """
+        with self._lock:
+            future = self._copier.submit(
+                self._copy_back, workspace, destination, inputs, then
+            )
+            self._copies.append(future)
+        return future
+
+    def discard(self, workspace: Path):
+        """Remove a workspace, e.g. of a failed tilt series."""
+        shutil.rmtree(workspace, ignore_errors=True)
+        with self._lock:
+            self._reserved.pop(workspace, None)
+
+    def close(self):
+        """Wait for the pending copies, then remove the scratch space.
+
+        Raises the first error of the copies, after cleaning up.
+        """
+        try:
+            for future in self._wait_for_copies():
+                future.result()
+        finally:
+            self._copier.shutdown(wait=True)
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def _reserve(self, workspace: Path, needed: int) -> bool:
+        with self._lock:
+            free = shutil.disk_usage(self.root).free - sum(self._reserved.values())
+            if needed > free:
+                return False
+            self._reserved[workspace] = needed
+            return True
+
+    def _wait_for_copies(self) -> list[Future]:
+        with self._lock:
+            copies = list(self._copies)
+        wait(copies)
+        return copies
+
+    def _copy_back(
+        self,
+        workspace: Path,
+        destination: Path,
+        inputs: checkpoint.Stamp,
+        then: Callable[[], None] | None,
+    ):
+        files = [file for file in sorted(workspace.rglob("*")) if file.is_file()]
+        stamps = checkpoint.stamp(files)
+        products = [
+            file for file in files if stamps[str(file)] != inputs.get(str(file))
+        ]
+        for file in products:
+            target = destination / file.relative_to(workspace)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Readers never see partial files
+            tmp = target.with_name(f".{target.name}.tomotools-copy")
+            try:
+                shutil.copy2(file, tmp)
+                os.replace(tmp, target)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+        print(f"Copied {len(products)} files back from {workspace} to {destination}.")
+        if then is not None:
+            then()
+        self.discard(workspace)
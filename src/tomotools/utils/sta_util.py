@@ -9,7 +9,7 @@ from typing import Literal
 import click
 import mrcfile
 
-from tomotools.utils import mdocfile, tomogram
+from tomotools.utils import jobs, mdocfile, tomogram
 from tomotools.utils.tiltseries import (
     TiltSeries,
     align_with_imod,
@@ -59,7 +59,7 @@ def aretomo_export(ts: TiltSeries):
         aretomo_exe = aretomo_executable()
         if aretomo_exe is None:
             raise FileNotFoundError("AreTomo executable not found.")
-        subprocess.run(
+        jobs.run(
             [
                 aretomo_exe,
                 "-InMrc",
@@ -195,10 +195,10 @@ def _get_subframes(mdoc: dict, src_dir: Path) -> list[Path]:
     if not all("SubFramePath" in section for section in mdoc["sections"]):
         raise ValueError("No SubFramePath in mdoc")
     subframes: list[Path] = []
+    frame_index = mdocfile.FrameIndex(Path(src_dir))
     for section in mdoc["sections"]:
-        subframe_path = mdocfile.find_relative_path(
-            Path(src_dir),
-            Path(section.get("SubFramePath", "").replace("\\", path.sep)),
+        subframe_path = frame_index.resolve(
+            Path(section.get("SubFramePath", "").replace("\\", path.sep))
         )
         if subframe_path is None:
             raise ValueError(
@@ -227,7 +227,7 @@ def _link_or_copy_frames(
 
 
 def _extract_frames(ts: TiltSeries, mdoc: dict, target_dir: Path) -> list[Path]:
-    subprocess.run(
+    jobs.run(
         [
             "newstack",
             "-split",
@@ -0,0 +1,148 @@
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, NamedTuple, Protocol
+
+
+class SlotPool(Protocol):
+    """Resource that a limited number of stages can hold at once.
+
+    gpus.GpuPool is one, handing out GPU ids.
+    """
+
+    slots: int
+
+    def acquire(self) -> Any: ...
+
+
+class Pool:
+    """Plain resource pool, e.g. for CPU-bound stages, handing out slot numbers."""
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self._free: queue.SimpleQueue[int] = queue.SimpleQueue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+
+    @contextmanager
+    def acquire(self) -> Iterator[int]:
+        """Wait for a free slot and hold it until the block is left."""
+        slot = self._free.get()
+        try:
+            yield slot
+        finally:
+            self._free.put(slot)
+
+
+class Skipped(Exception):
+    """Raised by a stage to skip it and the stages after it, without failing."""
+
+
+class Stage(NamedTuple):
+    """One stage of a StageGraph."""
+
+    name: str
+    function: Callable
+    after: tuple[str, ...]
+    pool: SlotPool | None
+
+
+class StageGraph:
+    """Stages of work that depend on each other, run as soon as they can.
+
+    A stage is called with the results of the stages it comes after, and the
+    slot of its pool, if it has one. Stages of separate pools run
+    concurrently, so e.g. a GPU-bound alignment of one tilt series runs while
+    another one is reconstructed on the CPU. Each pool runs at most as many
+    stages as it has slots. failed is set once a stage fails, so stages that
+    wait for others can give up.
+    """
+
+    def __init__(self):
+        self._stages: dict[str, Stage] = {}
+        self.failed = threading.Event()
+
+    def add(
+        self,
+        name: str,
+        function: Callable,
+        after: Iterable[str] = (),
+        pool: SlotPool | None = None,
+    ) -> str:
+        """Add a stage, return its name to use in after."""
+        after = tuple(after)
+        if name in self._stages:
+            raise ValueError(f"Stage {name} was already added.")
+        for dependency in after:
+            # Stages can only depend on earlier ones, so there are no cycles
+            if dependency not in self._stages:
+                raise ValueError(f"Stage {name} comes after unknown {dependency}.")
+        self._stages[name] = Stage(name, function, after, pool)
+        return name
+
+    def run(self) -> dict[str, Any]:
+        """Run all stages, return their results by name.
+
+        If a stage fails, no further stages are started and the first
+        exception is raised once the running stages are finished. Stages that
+        raise Skipped only leave out the stages after them, which don't get a
+        result.
+        """
+        executors: dict[int, ThreadPoolExecutor] = {}
+        for stage in self._stages.values():
+            key = id(stage.pool)
+            if key not in executors:
+                executors[key] = ThreadPoolExecutor(
+                    max_workers=stage.pool.slots if stage.pool is not None else 4,
+                    thread_name_prefix="tomotools-stage",
+                )
+
+        waiting_for = {name: len(stage.after) for name, stage in self._stages.items()}
+        dependents: dict[str, list[str]] = {name: [] for name in self._stages}
+        for stage in self._stages.values():
+            for dependency in stage.after:
+                dependents[dependency].append(stage.name)
+
+        results: dict[str, Any] = {}
+        running: dict[Future, str] = {}
+        error: BaseException | None = None
+
+        def start(name: str):
+            stage = self._stages[name]
+            args = [results[dependency] for dependency in stage.after]
+            running[executors[id(stage.pool)].submit(_call, stage, args)] = name
+
+        try:
+            for name, count in waiting_for.items():
+                if count == 0:
+                    start(name)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if isinstance(future.exception(), Skipped):
+                        continue
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        self.failed.set()
+                        continue
+                    results[name] = future.result()
+                    for dependent in dependents[name]:
+                        waiting_for[dependent] -= 1
+                        if waiting_for[dependent] == 0 and error is None:
+                            start(dependent)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+        if error is not None:
+            raise error
+        return results
+
+
+def _call(stage: Stage, args: list) -> Any:
+    if stage.pool is None:
+        return stage.function(*args)
+    with stage.pool.acquire() as slot:
+        return stage.function(*args, slot)
@@ -0,0 +1,161 @@
+import json
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from tomotools.utils import mdocfile
+from tomotools.utils.tiltseries import TiltSeries, format_view_ranges
+
+PERCENTILES = (1, 5, 50, 95, 99)
+
+
+@cache
+def _frequency_bands(box: int) -> tuple[np.ndarray, np.ndarray]:
+    """Masks of the low and high frequency bands of a rfft2 of size box."""
+    fy = np.fft.fftfreq(box)[:, None]
+    fx = np.fft.rfftfreq(box)[None, :]
+    # Radius as fraction of Nyquist
+    r = np.sqrt(fy**2 + fx**2) * 2
+    return (r > 0.05) & (r <= 0.15), (r > 0.3) & (r <= 0.45)
+
+
+def spectral_decay(image: np.ndarray, box: int = 512) -> float:
+    """Ice-thickness proxy: log ratio of low- to high-frequency power.
+
+    Uses a centered box of the image. Thicker ice damps high frequencies,
+    so the value increases with thickness.
+    """
+    ny, nx = image.shape
+    box = min(box, ny, nx)
+    y0, x0 = (ny - box) // 2, (nx - box) // 2
+    crop = image[y0 : y0 + box, x0 : x0 + box].astype(np.float32)
+    power = np.abs(np.fft.rfft2(crop - crop.mean())) ** 2
+    low_band, high_band = _frequency_bands(box)
+    low, high = power[low_band].mean(), power[high_band].mean()
+    if low <= 0 or high <= 0:
+        return float("nan")
+    return float(np.log(low / high))
+
+
+def _tilt_angles(ts: TiltSeries, n_tilts: int) -> np.ndarray:
+    """Tilt angles from the mdoc, NaN if they can't be matched to the stack."""
+    if ts.mdoc is not None and ts.mdoc.is_file():
+        sections = mdocfile.read(ts.mdoc)["sections"]
+        if len(sections) == n_tilts:
+            return np.array([section.get("TiltAngle", np.nan) for section in sections])
+    return np.full(n_tilts, np.nan)
+
+
+def tilt_statistics(ts: TiltSeries, chunk_size: int = 8) -> pd.DataFrame:
+    """Compute statistics for every tilt of a TiltSeries.
+
+    The stack is streamed in chunks of tilts, statistics are computed per chunk.
+    Percentiles are computed on every second pixel in x and y.
+    """
+    rows = []
+    for _, tilts in ts.iter_tilts(chunk_size=chunk_size):
+        n = tilts.shape[0]
+        sample = tilts[:, ::2, ::2].reshape(n, -1)
+        rows.append(
+            np.column_stack(
+                [
+                    tilts.mean(axis=(1, 2), dtype=np.float64),
+                    tilts.std(axis=(1, 2), dtype=np.float64),
+                    np.percentile(sample, PERCENTILES, axis=1).T,
+                    [spectral_decay(tilt) for tilt in tilts],
+                ]
+            )
+        )
+
+    stats = pd.DataFrame(
+        np.concatenate(rows),
+        columns=["mean", "std"]
+        + [f"p{percentile}" for percentile in PERCENTILES]
+        + ["spectral_decay"],
+    )
+    stats.insert(0, "view", np.arange(len(stats)))
+    stats.insert(1, "tilt_angle", _tilt_angles(ts, len(stats)))
+    return stats
+
+
+def _robust_z(values: np.ndarray) -> np.ndarray:
+    """Z-score using median and median absolute deviation."""
+    median = np.nanmedian(values)
+    mad = np.nanmedian(np.abs(values - median)) * 1.4826
+    if not mad > 0:
+        return np.zeros_like(values)
+    return (values - median) / mad
+
+
+def flag_tilts(
+    stats: pd.DataFrame,
+    dark_fraction: float = 0.2,
+    blank_fraction: float = 0.05,
+    outlier_z: float = 5.0,
+) -> pd.DataFrame:
+    """Flag dark, blank and outlier tilts in the output of tilt_statistics.
+
+    - dark: mean below dark_fraction of the median mean of all tilts.
+    - blank: p5-p95 spread below blank_fraction of the median spread.
+    - outlier: the remaining tilts are compared to Beer-Lambert behaviour,
+      i.e. log(mean) linear in 1/cos(tilt angle), and by their spectral decay.
+      Tilts deviating by more than outlier_z robust z-scores are flagged.
+    """
+    stats = stats.copy()
+    mean = stats["mean"].to_numpy()
+    spread = (stats["p95"] - stats["p5"]).to_numpy()
+
+    # Normalised stacks have means around 0, dark tilts can't be found by mean then
+    reference = np.median(mean)
+    stats["dark"] = mean < dark_fraction * reference if reference > 0 else False
+    stats["blank"] = (spread <= blank_fraction * np.median(spread)) & ~stats["dark"]
+
+    valid = ~(stats["dark"] | stats["blank"]).to_numpy() & (mean > 0)
+    residual = np.full(len(stats), np.nan)
+    angles = stats["tilt_angle"].to_numpy()
+    if valid.sum() >= 3:
+        if np.isnan(angles).any():
+            residual[valid] = np.log(mean[valid])
+        else:
+            path_length = 1 / np.cos(np.radians(angles))
+            fit = np.polyfit(path_length[valid], np.log(mean[valid]), 1)
+            residual[valid] = np.log(mean[valid]) - np.polyval(fit, path_length[valid])
+
+    decay = np.where(valid, stats["spectral_decay"].to_numpy(), np.nan)
+    outlier = (np.abs(_robust_z(residual)) > outlier_z) | (
+        np.abs(_robust_z(decay)) > outlier_z
+    )
+    stats["outlier"] = outlier & valid
+    stats["exclude"] = stats["dark"] | stats["blank"] | stats["outlier"]
+    return stats
+
+
+def write_qc_report(
+    ts: TiltSeries, stats: pd.DataFrame, out_dir: Path | None = None
+) -> tuple[Path, Path]:
+    """Write flagged statistics as <stem>_qc.csv and <stem>_qc.json.
+
+    Returns paths of the csv and json file.
+    """
+    out_dir = ts.path.parent if out_dir is None else out_dir
+    csv_file = out_dir / f"{ts.path.stem}_qc.csv"
+    json_file = out_dir / f"{ts.path.stem}_qc.json"
+
+    stats.to_csv(csv_file, index=False)
+
+    excluded = stats.loc[stats["exclude"], "view"].tolist()
+    report = {
+        "tilt_series": str(ts.path),
+        "views": len(stats),
+        "exclude": format_view_ranges(excluded),
+        "dark": format_view_ranges(stats.loc[stats["dark"], "view"].tolist()),
+        "blank": format_view_ranges(stats.loc[stats["blank"], "view"].tolist()),
+        "outlier": format_view_ranges(stats.loc[stats["outlier"], "view"].tolist()),
+        "tilts": json.loads(stats.to_json(orient="records")),
+    }
+    with open(json_file, "w") as file:
+        json.dump(report, file, indent=2)
+
+    return csv_file, json_file
@@ -1,11 +1,11 @@
 from collections.abc import Iterator
 import csv
+import json
 import math
 import os
 import re
 import shutil
 import subprocess
-from operator import itemgetter
 from os import path
 from pathlib import Path
 
@@ -13,7 +13,16 @@ import mrcfile
 import numpy as np
 import pandas as pd
 
-from tomotools.utils import edffile, mdocfile, util
+from tomotools.utils import (
+    discovery,
+    edffile,
+    gpus,
+    jobs,
+    mdocfile,
+    mrcheader,
+    mrcstream,
+    util,
+)
 from tomotools.utils.micrograph import Micrograph
 
 
@@ -63,9 +72,7 @@ class TiltSeries:
         # except those generated from allviews and cutviews, which are generated by imod
         if not path.is_dir():
             raise NotADirectoryError(f"{path} is not a directory!")
-        for mdoc in path.glob("*.mdoc"):
-            if "allviews" in mdoc.name or "cutviews" in mdoc.name:
-                continue
+        for mdoc in discovery.index(path).tiltseries_mdocs():
             yield from TiltSeries._from_file(mdoc.with_suffix(""))
 
     @staticmethod
@@ -99,20 +106,11 @@ class TiltSeries:
         1. The same directory as the mrc file, suffixed with _EVN/_ODD
         2. The same directory as the mrc file, suffixed with _even/_odd
         """
-        for even, odd in [
-            (
-                self.path.with_name(self.path.stem + "_EVN.mrc"),
-                self.path.with_name(self.path.stem + "_ODD.mrc"),
-            ),
-            (
-                self.path.with_name(self.path.stem + "_even.mrc"),
-                self.path.with_name(self.path.stem + "_odd.mrc"),
-            ),
-        ]:
-            if even.is_file() and odd.is_file():
-                self.with_split_files(even, odd)
-                return True
-        return False
+        split_files = discovery.index(self.path.parent).split_files(self.path.stem)
+        if split_files is None:
+            return False
+        self.with_split_files(*split_files)
+        return True
 
     def with_split_files(self, evn_file: Path, odd_file: Path) -> "TiltSeries":
         """Create TiltSeries with EVN/ODD by giving their paths."""
@@ -144,53 +142,42 @@ class TiltSeries:
             if file is not None and file.is_file():
                 file.unlink()
 
+    def iter_tilts(
+        self, chunk_size: int = 1, prefetch: int = 2
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        """Iterate over the stack in chunks of tilts, without loading all of it.
+
+        Yields the index of the first tilt and a (chunk_size, y, x) array.
+        See mrcstream.iter_chunks for prefetching.
+        """
+        yield from mrcstream.iter_chunks(self.path, chunk_size, prefetch)
+
     def defocus_file(self):
         """Return path of defocus file from ctfplotter."""
-        if path.exists(self.path.with_name(f"{self.path.stem}_ctfplotter.txt")):
-            return self.path.with_name(f"{self.path.stem}_ctfplotter.txt")
-        elif path.exists(self.path.with_name(f"{self.path.stem}.defocus")):
-            return self.path.with_name(f"{self.path.stem}.defocus")
-        else:
-            return None
+        return discovery.index(self.path.parent).defocus_file(self.path.stem)
+
+    @property
+    def header(self) -> mrcheader.MrcHeader:
+        """Return header of the stack, cached process-wide."""
+        return mrcheader.read_header(self.path)
 
     @property
     def angpix(self) -> float:
         """Return angpix from header."""
-        if hasattr(self, "_angpix"):
-            return self._angpix
-        with mrcfile.mmap(self.path) as mrc:
-            self._angpix = float(mrc.voxel_size.x)
-        return self._angpix
+        return self.header.angpix
 
     @property
-    def dimZYX(self) -> tuple[float, float, float]:
+    def dimZYX(self) -> tuple[int, int, int]:
         """Return ZYX dimensions."""
-        if hasattr(self, "_dimZYX"):
-            return self._dimZYX
-        with mrcfile.mmap(self.path) as mrc:
-            if mrc.data is None:
-                raise ValueError("No data in MRC file.")
-            self._dimZYX = mrc.data.shape
-        return self._dimZYX
+        return self.header.dimZYX
 
     @property
     def axis_angle(self) -> float:
         """Return tilt axis angle from header."""
-        if hasattr(self, "_axis_angle"):
-            return self._axis_angle
-        with mrcfile.mmap(self.path) as mrc:
-            # Check SerialEM-type header spelling first
-            header = str(mrc.header).split("Tilt axis angle = ", 1)
-
-            if len(header) == 1:
-                # Otherwise, try Tomo5 writing
-                header = str(mrc.header).split("TiltAxisAngle = ", 1)
-
-                if len(header) == 1:
-                    raise NotImplementedError("Can't find tilt axis in header.")
-
-            self._axis_angle = float(header[1][0:4])
-        return self._axis_angle
+        axis_angle = self.header.axis_angle
+        if axis_angle is None:
+            raise NotImplementedError("Can't find tilt axis in header.")
+        return axis_angle
 
     def _update_axis_angle(self, tilt_axis_angle: float):
         """Update TiltAxisAngle in header."""
@@ -232,9 +219,8 @@ class TiltSeries:
                 [re.sub(pattern, replacement, line) for line in labels], dtype="|S80"
             )
 
-            self._axis_angle = tilt_axis_angle
-
-            return
+        mrcheader.invalidate(self.path)
+        return
 
     @staticmethod
     def _update_mrc_header_from_mdoc(path: Path, mdoc: dict):
@@ -249,6 +235,7 @@ class TiltSeries:
                 mrc.header["label"][i] = title
             mrc.header["nlabl"] = len(mdoc["titles"])
             mrc.voxel_size = mdoc["sections"][0]["PixelSpacing"]
+        mrcheader.invalidate(path)
 
     @staticmethod
     def _update_mdoc_from_mrc_header(path: Path, mdoc: dict):
@@ -282,6 +269,9 @@ class TiltSeries:
             )
 
         # First, take care of the MDOC files
+        Micrograph.read_mdocs(micrographs)
+        # Sections to change are edited as table, then written back to stack_mdoc
+        sections = None
         if all(micrograph.mdoc for micrograph in micrographs):
             # If all movies have their own associated mdoc, merge the mdoc files
             stack_mdoc = {"titles": [], "sections": [], "framesets": []}
@@ -299,38 +289,32 @@ class TiltSeries:
             if overwrite_titles is not None:
                 # Update titles and append frameset as new section
                 stack_mdoc["titles"] = overwrite_titles
-            if overwrite_dose is not None:
-                for section in stack_mdoc["sections"]:
-                    section["ExposureDose"] = overwrite_dose
 
         elif mdoc is not None:
             stack_mdoc = mdoc
             if reorder:
-                stack_mdoc["sections"] = sorted(
-                    stack_mdoc["sections"], key=itemgetter("TiltAngle")
+                sections = mdocfile.sections_table(stack_mdoc).sort_values(
+                    "TiltAngle", kind="stable"
                 )
-            if overwrite_dose is not None:
-                for section in stack_mdoc["sections"]:
-                    section["ExposureDose"] = overwrite_dose
         else:
             raise FileNotFoundError(
                 "No original MDOC was provided and the movies don't have MDOCs."
             )
 
+        if overwrite_dose is not None:
+            if sections is None:
+                sections = mdocfile.sections_table(stack_mdoc)
+            sections["ExposureDose"] = overwrite_dose
+        if sections is not None:
+            stack_mdoc["sections"] = mdocfile.table_to_sections(sections)
+
         # Now, create the TiltSeries files
+        # Full and EVN/ODD stacks are independent, so run newstack concurrently
         micrograph_paths = [str(micrograph.path) for micrograph in micrographs]
-        subprocess.run(
-            ["newstack"] + micrograph_paths + [ts_path, "-quiet"],
-            stdout=subprocess.DEVNULL,
-        )
+        stacks = [(micrograph_paths, ts_path)]
 
-        # Sync MRC header and MDOC
-        TiltSeries._update_mrc_header_from_mdoc(ts_path, stack_mdoc)
-        TiltSeries._update_mdoc_from_mrc_header(ts_path, stack_mdoc)
-
-        mdocfile.write(stack_mdoc, str(ts_path) + ".mdoc")
-
-        if all(micrograph.is_split for micrograph in micrographs):
+        is_split = all(micrograph.is_split for micrograph in micrographs)
+        if is_split:
             micrograph_evn_paths = [
                 str(micrograph.evn_path) for micrograph in micrographs
             ]
@@ -339,16 +323,20 @@ class TiltSeries:
             ]
             ts_evn = ts_path.with_name(ts_path.stem + "_even.mrc")
             ts_odd = ts_path.with_name(ts_path.stem + "_odd.mrc")
+            stacks += [(micrograph_evn_paths, ts_evn), (micrograph_odd_paths, ts_odd)]
 
-            subprocess.run(
-                ["newstack"] + micrograph_evn_paths + [ts_evn, "-quiet"],
-                stdout=subprocess.DEVNULL,
-            )
-            subprocess.run(
-                ["newstack"] + micrograph_odd_paths + [ts_odd, "-quiet"],
-                stdout=subprocess.DEVNULL,
-            )
+        util.run_concurrently(
+            [["newstack"] + paths + [stack, "-quiet"] for paths, stack in stacks],
+            stdout=subprocess.DEVNULL,
+        )
+
+        # Sync MRC header and MDOC
+        TiltSeries._update_mrc_header_from_mdoc(ts_path, stack_mdoc)
+        TiltSeries._update_mdoc_from_mrc_header(ts_path, stack_mdoc)
+
+        mdocfile.write(stack_mdoc, str(ts_path) + ".mdoc")
 
+        if is_split:
             TiltSeries._update_mrc_header_from_mdoc(ts_evn, stack_mdoc)
             TiltSeries._update_mrc_header_from_mdoc(ts_odd, stack_mdoc)
             return TiltSeries(ts_path).with_split_files(ts_evn, ts_odd)
@@ -383,75 +371,50 @@ def aretomo_executable() -> str | None:
 def bin_tiltseries(
     ts: TiltSeries, bin: int, do_evn_odd: bool = False, overwrite: bool = False
 ) -> "TiltSeries":
-    """Bin a TiltSeries object."""
-    if not overwrite:
-        binned_stack = ts.path.with_name(f"{ts.path.stem}_bin_{bin}.mrc")
-    else:
-        binned_stack = ts.path
+    """Bin a TiltSeries object.
 
-    subprocess.run(
-        [
-            "newstack",
-            "-in",
-            ts.path,
-            "-bin",
-            str(bin),
-            "-antialias",
-            "-1",
-            "-ou",
-            binned_stack,
-            "-quiet",
-        ],
-        stdout=subprocess.DEVNULL,
-    )
-
-    print(f"{ts.path}: Binned to {bin}.")
+    Full and EVN/ODD stacks are binned concurrently. With overwrite, the
+    binned stacks replace the input stacks, leaving hard links to the input
+    stacks untouched.
+    """
+    binned_stack = ts.path.with_name(f"{ts.path.stem}_bin_{bin}.mrc")
+    stacks = [(ts.path, binned_stack)]
 
     if do_evn_odd and ts.is_split:
         assert ts.evn_path is not None and ts.odd_path is not None
-        if overwrite:
-            binned_stack_evn = ts.evn_path
-            binned_stack_odd = ts.odd_path
-        else:
-            binned_stack_evn = ts.evn_path.with_name(
-                f"{ts.path.stem}_bin_{bin}_EVN.mrc"
-            )
-            binned_stack_odd = ts.odd_path.with_name(
-                f"{ts.path.stem}_bin_{bin}_ODD.mrc"
-            )
+        binned_stack_evn = ts.evn_path.with_name(f"{ts.path.stem}_bin_{bin}_EVN.mrc")
+        binned_stack_odd = ts.odd_path.with_name(f"{ts.path.stem}_bin_{bin}_ODD.mrc")
+        stacks += [(ts.evn_path, binned_stack_evn), (ts.odd_path, binned_stack_odd)]
 
-        subprocess.run(
+    util.run_concurrently(
+        [
             [
                 "newstack",
                 "-in",
-                ts.evn_path,
+                stack_in,
                 "-bin",
                 str(bin),
                 "-antialias",
                 "-1",
                 "-ou",
-                binned_stack_evn,
+                stack_out,
                 "-quiet",
-            ],
-            stdout=subprocess.DEVNULL,
-        )
+            ]
+            for stack_in, stack_out in stacks
+        ],
+        stdout=subprocess.DEVNULL,
+    )
 
-        subprocess.run(
-            [
-                "newstack",
-                "-in",
-                ts.odd_path,
-                "-bin",
-                str(bin),
-                "-antialias",
-                "-1",
-                "-ou",
-                binned_stack_odd,
-                "-quiet",
-            ],
-            stdout=subprocess.DEVNULL,
-        )
+    if overwrite:
+        for stack_in, stack_out in stacks:
+            os.replace(stack_out, stack_in)
+        binned_stack = ts.path
+        if len(stacks) > 1:
+            binned_stack_evn, binned_stack_odd = ts.evn_path, ts.odd_path
+
+    print(f"{ts.path}: Binned to {bin}.")
 
+    if do_evn_odd and ts.is_split:
         print(f"{ts.path}: Binned EVN/ODD to {bin}.")
 
         return (
@@ -491,22 +454,14 @@ def align_with_areTomo(
     aln_file = ts.path.with_suffix(".aln")
     orig_mdoc = ts.mdoc
 
-    if gpu is None:
-        # gpu_id = [0]
-        gpu_id = [int(i) for i in range(0, util.num_gpus())]
+    gpu_flag = ["-Gpu"] + [str(gpu_id) for gpu_id in gpus.gpu_ids(gpu)]
 
-    else:
-        # Turn GPU list into list of integers
-        gpu_id = gpu.split(",")
-        gpu_id = [int(gpu) for gpu in gpu_id]
-
-    with mrcfile.mmap(ts.path) as mrc:
-        angpix = float(mrc.voxel_size.x)
+    angpix = ts.angpix
 
     tlt_file = ts.path.with_suffix(".rawtlt")
 
     if not path.isfile(tlt_file):
-        subprocess.run(["extracttilts", ts.path, tlt_file], stdout=subprocess.DEVNULL)
+        jobs.run(["extracttilts", ts.path, tlt_file], stdout=subprocess.DEVNULL)
 
     if previous:
         if not path.isfile(aln_file):
@@ -514,7 +469,7 @@ def align_with_areTomo(
                 f"{ts.path}: --previous was passed, but no alignment at {aln_file}."
             )
 
-        subprocess.run(
+        jobs.run(
             [
                 aretomo_exe,
                 "-InMrc",
@@ -527,8 +482,10 @@ def align_with_areTomo(
                 aln_file,
                 "-VolZ",
                 "0",
-            ],
+            ]
+            + gpu_flag,
             stdout=subprocess.DEVNULL,
+            bounded=False,
         )
 
     if not previous:
@@ -542,7 +499,7 @@ def align_with_areTomo(
 
         alignZ = str(round(volz * 10 / angpix))
 
-        subprocess.run(
+        jobs.run(
             [
                 aretomo_exe,
                 "-InMrc",
@@ -559,9 +516,10 @@ def align_with_areTomo(
                 alignZ,
             ]
             + (["-TiltAxis", str(override_axis)] if override_axis is not None else [])
-            + (["-Gpu"] + [str(i) for i in gpu_id])
+            + gpu_flag
             + (["-Patch", patch_x, patch_y] if local else []),
             stdout=subprocess.DEVNULL,
+            bounded=False,
         )
 
     with mrcfile.mmap(ali_stack, mode="r+") as mrc:
@@ -582,39 +540,30 @@ def align_with_areTomo(
         assert ts.evn_path is not None and ts.odd_path is not None
         ali_stack_evn = ts.evn_path.with_name(f"{ts.path.stem}_ali_EVN.mrc")
         ali_stack_odd = ts.odd_path.with_name(f"{ts.path.stem}_ali_ODD.mrc")
-        subprocess.run(
-            [
-                aretomo_exe,
-                "-InMrc",
-                ts.evn_path,
-                "-OutMrc",
-                ali_stack_evn,
-                "-AngFile",
-                tlt_file,
-                "-AlnFile",
-                aln_file,
-                "-VolZ",
-                "0",
-            ],
-            stdout=subprocess.DEVNULL,
-        )
+        # One after the other, on the GPU this tilt series already holds
+        for stack_in, stack_out in [
+            (ts.evn_path, ali_stack_evn),
+            (ts.odd_path, ali_stack_odd),
+        ]:
+            jobs.run(
+                [
+                    aretomo_exe,
+                    "-InMrc",
+                    stack_in,
+                    "-OutMrc",
+                    stack_out,
+                    "-AngFile",
+                    tlt_file,
+                    "-AlnFile",
+                    aln_file,
+                    "-VolZ",
+                    "0",
+                ]
+                + gpu_flag,
+                stdout=subprocess.DEVNULL,
+                bounded=False,
+            )
 
-        subprocess.run(
-            [
-                aretomo_exe,
-                "-InMrc",
-                ts.odd_path,
-                "-OutMrc",
-                ali_stack_odd,
-                "-AngFile",
-                tlt_file,
-                "-AlnFile",
-                aln_file,
-                "-VolZ",
-                "0",
-            ],
-            stdout=subprocess.DEVNULL,
-        )
         with mrcfile.mmap(ali_stack_evn, mode="r+") as mrc:
             mrc.voxel_size = str(angpix)
             mrc.update_header_stats()
@@ -635,11 +584,35 @@ def align_with_areTomo(
     return TiltSeries(ali_stack).with_mdoc(orig_mdoc)
 
 
+def align_all_with_areTomo(
+    series: list[TiltSeries],
+    gpu: str | None,
+    jobs_per_gpu: int = 1,
+    **kwargs,
+) -> list[TiltSeries]:
+    """Align many TiltSeries with AreTomo, one job per GPU at a time.
+
+    AreTomo barely gets faster with more GPUs, so each tilt series is aligned
+    on a single GPU and the others align further tilt series meanwhile.
+    gpu selects the GPUs, eg. "0,1", default: all. Large GPUs can run
+    jobs_per_gpu alignments at the same time. Further kwargs are passed to
+    align_with_areTomo.
+
+    Returns the aligned TiltSeries, in the order of the input.
+    """
+    pool = gpus.GpuPool(gpus.gpu_ids(gpu), jobs_per_gpu)
+    return pool.map(
+        lambda ts, gpu_id: align_with_areTomo(ts=ts, gpu=str(gpu_id), **kwargs),
+        series,
+    )
+
+
 def dose_filter(ts: TiltSeries, do_evn_odd: bool) -> TiltSeries:
     """Runs mtffilter on the given TiltSeries object.
 
     Uses the doses in the associated mdoc file.
-    Will take into account EVN/ODD stacks if do_evn_odd is passed.
+    Will take into account EVN/ODD stacks if do_evn_odd is passed, these are
+    filtered concurrently with the full stack.
     mdoc needs to contain only ExposureDose, as PriorRecordDose is deduced by mtffilter
     based on the DateTime entry, see mtffilter -help, section "-dtype"
     """
@@ -651,49 +624,23 @@ def dose_filter(ts: TiltSeries, do_evn_odd: bool) -> TiltSeries:
     else:
         orig_mdoc = ts.mdoc
         filtered_stack = ts.path.with_name(f"{ts.path.stem}_filtered.mrc")
-        subprocess.run(
-            [
-                "mtffilter",
-                "-dtype",
-                "4",
-                "-dfile",
-                ts.mdoc,
-                ts.path,
-                filtered_stack,
-            ],
-            stdout=subprocess.DEVNULL,
-        )
+        stacks = [(ts.path, filtered_stack)]
 
         if ts.is_split and do_evn_odd:
             assert ts.evn_path is not None and ts.odd_path is not None
             filtered_evn = ts.path.with_name(f"{ts.path.stem}_filtered_EVN.mrc")
             filtered_odd = ts.path.with_name(f"{ts.path.stem}_filtered_ODD.mrc")
+            stacks += [(ts.evn_path, filtered_evn), (ts.odd_path, filtered_odd)]
 
-            subprocess.run(
-                [
-                    "mtffilter",
-                    "-dtype",
-                    "4",
-                    "-dfile",
-                    ts.mdoc,
-                    ts.evn_path,
-                    filtered_evn,
-                ],
-                stdout=subprocess.DEVNULL,
-            )
-            subprocess.run(
-                [
-                    "mtffilter",
-                    "-dtype",
-                    "4",
-                    "-dfile",
-                    ts.mdoc,
-                    ts.odd_path,
-                    filtered_odd,
-                ],
-                stdout=subprocess.DEVNULL,
-            )
+        util.run_concurrently(
+            [
+                ["mtffilter", "-dtype", "4", "-dfile", ts.mdoc, stack_in, stack_out]
+                for stack_in, stack_out in stacks
+            ],
+            stdout=subprocess.DEVNULL,
+        )
 
+        if ts.is_split and do_evn_odd:
             print(f"Done dose-filtering {ts.path} and EVN/ODD stacks.")
             return (
                 TiltSeries(filtered_stack)
@@ -728,73 +675,23 @@ def align_with_imod(ts: TiltSeries, previous: bool, do_evn_odd: bool, binning=1)
         shutil.copyfile(ts.path.with_suffix(".tlt"), ali_stack.with_suffix(".tlt"))
 
         out_x, out_y = binned_size(ts, binning)
-
-        subprocess.run(
-            [
-                "newstack",
-                "-InputFile",
-                ts.path,
-                "-OutputFile",
-                ali_stack,
-                "-TransformFile",
-                ts.path.with_suffix(".xf"),
-                "-TaperAtFill",
-                "1,1",
-                "-AdjustOrigin",
-                "-OffsetsInXandY",
-                "0,0",
-                "-ImagesAreBinned",
-                "1",
-                "-SizeToOutputInXandY",
-                f"{out_x},{out_y}",
-                "-quiet",
-            ]
-            + (
-                ["-bin", str(binning), "-AntialiasFilter", "-1"] if binning != 1 else []
-            ),
-            stdout=subprocess.DEVNULL,
-        )
+        stacks = [(ts.path, ali_stack)]
 
         if do_evn_odd and ts.is_split:
             assert ts.evn_path is not None and ts.odd_path is not None
             ali_stack_evn = ts.evn_path.with_name(f"{ts.path.stem}_ali_even.mrc")
             ali_stack_odd = ts.odd_path.with_name(f"{ts.path.stem}_ali_odd.mrc")
+            stacks += [(ts.evn_path, ali_stack_evn), (ts.odd_path, ali_stack_odd)]
 
-            subprocess.run(
-                [
-                    "newstack",
-                    "-InputFile",
-                    ts.evn_path,
-                    "-OutputFile",
-                    ali_stack_evn,
-                    "-TransformFile",
-                    ts.path.with_suffix(".xf"),
-                    "-TaperAtFill",
-                    "1,1",
-                    "-AdjustOrigin",
-                    "-OffsetsInXandY",
-                    "0,0",
-                    "-ImagesAreBinned",
-                    "1",
-                    "-SizeToOutputInXandY",
-                    f"{out_x},{out_y}",
-                    "-quiet",
-                ]
-                + (
-                    ["-bin", str(binning), "-AntialiasFilter", "-1"]
-                    if binning != 1
-                    else []
-                ),
-                stdout=subprocess.DEVNULL,
-            )
-
-            subprocess.run(
+        # Full and EVN/ODD stacks are independent, so run them concurrently
+        util.run_concurrently(
+            [
                 [
                     "newstack",
                     "-InputFile",
-                    ts.odd_path,
+                    stack_in,
                     "-OutputFile",
-                    ali_stack_odd,
+                    stack_out,
                     "-TransformFile",
                     ts.path.with_suffix(".xf"),
                     "-TaperAtFill",
@@ -812,10 +709,13 @@ def align_with_imod(ts: TiltSeries, previous: bool, do_evn_odd: bool, binning=1)
                     ["-bin", str(binning), "-AntialiasFilter", "-1"]
                     if binning != 1
                     else []
-                ),
-                stdout=subprocess.DEVNULL,
-            )
+                )
+                for stack_in, stack_out in stacks
+            ],
+            stdout=subprocess.DEVNULL,
+        )
 
+        if do_evn_odd and ts.is_split:
             print(f"Aligned {ts.path} and associated EVN/ODD stacks with imod.")
             return (
                 TiltSeries(ali_stack)
@@ -881,7 +781,7 @@ def run_ctfplotter(ts: TiltSeries, overwrite: bool):
             raise FileNotFoundError(f"Tlt file not found for {ts.path}.")
 
         with open(path.join(ts.path.parent, "ctfplotter.log"), "a") as out:
-            subprocess.run(
+            jobs.run(
                 [
                     "ctfplotter",
                     "-InputStack",
@@ -1012,6 +912,233 @@ def parse_darkimgs(ts: TiltSeries):
     return dark_tilts
 
 
+def parse_view_ranges(spec: str) -> list[int]:
+    """Parse an excludeviews-style view list like "1,39-41".
+
+    Views are given 1-indexed, as for imod. Returns sorted, zero-indexed views.
+    """
+    views = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if len(part) == 0:
+            continue
+        start, _, end = part.partition("-")
+        first, last = int(start), int(end) if end else int(start)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid view range {part} in {spec}.")
+        views.update(range(first - 1, last))
+    return sorted(views)
+
+
+def format_view_ranges(views: list[int]) -> str:
+    """Format zero-indexed views as 1-indexed view list, see parse_view_ranges."""
+    ranges: list[list[int]] = []
+    for view in sorted(set(views)):
+        if len(ranges) > 0 and view == ranges[-1][1] + 1:
+            ranges[-1][1] = view
+        else:
+            ranges.append([view, view])
+    return ",".join(
+        f"{first + 1}" if first == last else f"{first + 1}-{last + 1}"
+        for first, last in ranges
+    )
+
+
+def _extended_record_size(mrc) -> int:
+    """Return bytes per view in the extended header, or 0 if it is not per-view."""
+    ext = mrc.extended_header
+    if ext is None or ext.nbytes == 0:
+        return 0
+    # FEI1/FEI2 headers are parsed by mrcfile into one record per view
+    if ext.dtype.names is not None:
+        return ext.dtype.itemsize
+    # SerialEM / Agard headers store the bytes per view as nint (bytes 129-130)
+    if mrc.header.exttyp in (b"SERI", b"AGAR"):
+        int16 = np.dtype("i2").newbyteorder(mrc.header.mode.dtype.byteorder)
+        return int(np.frombuffer(mrc.header.extra2.tobytes()[16:18], int16)[0])
+    return 0
+
+
+def _stack_writer(
+    mrc, out_path: Path, n_views: int, ext: bytes
+) -> mrcstream.ChunkWriter:
+    """Return writer for a new stack of n_views views, with header info of mrc."""
+    ny, nx = mrc.data.shape[1:]
+    writer = mrcstream.ChunkWriter(
+        out_path,
+        shape=(n_views, ny, nx),
+        mrc_mode=int(mrc.header.mode),
+        extended_header=np.frombuffer(ext, dtype="V1") if ext else None,
+        exttyp=mrc.header.exttyp.item() if ext else None,
+    )
+    for field in ("extra2", "origin", "nlabl", "label"):
+        writer.mrc.header[field] = mrc.header[field]
+    writer.mrc.voxel_size = mrc.voxel_size
+    return writer
+
+
+def exclude_views(
+    ts: TiltSeries, views: list[int], record_dir: Path | None = None
+) -> TiltSeries:
+    """Remove views from the stack, its EVN/ODD stacks and its mdoc in one pass.
+
+    Views are zero-indexed, see parse_view_ranges. Each file is streamed view by
+    view into a temporary file, which then replaces the original.
+
+    Instead of imod's _cutviews0 stacks and mdocs, the removed views are moved
+    into a single excluded-views stack in record_dir (default: excluded_views
+    next to the stack), those of the EVN/ODD stacks after those of the stack.
+    A small restore record next to it keeps the view indices, their extended
+    header records and mdoc sections. Use restore_views to undo the exclusion.
+    Raises FileExistsError if views of the tilt series were excluded before and
+    not restored yet, as their record would be lost.
+    """
+    if record_dir is None:
+        record_dir = ts.path.parent / "excluded_views"
+
+    stacks = {"stack": ts.path}
+    if ts.is_split:
+        stacks.update({"evn": ts.evn_path, "odd": ts.odd_path})
+
+    with mrcfile.mmap(ts.path) as mrc:
+        nz = mrc.data.shape[0]
+    drop = sorted(set(views))
+    if len(drop) == 0:
+        return ts
+    if drop[0] < 0 or drop[-1] >= nz:
+        raise IndexError(f"{ts.path} has {nz} views, cannot exclude views {drop}.")
+    keep = [z for z in range(nz) if z not in drop]
+
+    excluded_stack = record_dir / f"{ts.path.stem}_excluded.mrc"
+    if excluded_stack.with_suffix(".json").exists() or excluded_stack.exists():
+        raise FileExistsError(
+            f"Views of {ts.path} were already excluded into {excluded_stack}, "
+            "restore them with tomotools restore-views first."
+        )
+    record_dir.mkdir(exist_ok=True)
+    record = {"nz": nz, "views": drop, "stacks": list(stacks), "ext": {}}
+    temp_files = {}
+    with mrcfile.mmap(ts.path) as mrc:
+        excluded = _stack_writer(mrc, excluded_stack, len(drop) * len(stacks), b"")
+    try:
+        with excluded:
+            for key, stack in stacks.items():
+                temp_files[stack] = stack.with_name(f"{stack.stem}_excluding.mrc")
+                with mrcfile.mmap(stack) as mrc:
+                    if mrc.data.shape[0] != nz:
+                        raise ValueError(
+                            f"{stack} does not have the same views as {ts.path}."
+                        )
+                    ext = (
+                        mrc.extended_header.tobytes()
+                        if mrc.extended_header is not None
+                        else b""
+                    )
+                    size = _extended_record_size(mrc)
+                    records = (
+                        [ext[z * size : (z + 1) * size] for z in range(nz)]
+                        if size
+                        else []
+                    )
+                    kept_ext = b"".join(records[z] for z in keep).ljust(len(ext), b"\0")
+
+                    with _stack_writer(
+                        mrc, temp_files[stack], len(keep), kept_ext if size else ext
+                    ) as out:
+                        for z, view in mrcstream.iter_chunks(stack):
+                            if z in drop:
+                                excluded.write(view)
+                            else:
+                                out.write(view)
+                    record["ext"][key] = b"".join(records[z] for z in drop).hex()
+    except BaseException:
+        # No half-written stacks stay behind
+        for temp_file in temp_files.values():
+            temp_file.unlink(missing_ok=True)
+        excluded_stack.unlink(missing_ok=True)
+        raise
+
+    record["sections"] = []
+    mdoc = None
+    if ts.mdoc is not None and ts.mdoc.is_file():
+        mdoc = mdocfile.read(ts.mdoc)
+        if len(mdoc["sections"]) == nz:
+            record["sections"] = [mdoc["sections"][z] for z in drop]
+            mdoc["sections"] = [mdoc["sections"][z] for z in keep]
+        else:
+            print(f"{ts.mdoc} does not match the stack, leaving it unchanged.")
+            mdoc = None
+
+    with open(excluded_stack.with_suffix(".json"), "w") as file:
+        json.dump(record, file, default=str, indent=1)
+
+    for stack, temp_file in temp_files.items():
+        os.replace(temp_file, stack)
+    if mdoc is not None:
+        mdocfile.write(mdoc, ts.mdoc)
+
+    return ts
+
+
+def restore_views(ts: TiltSeries, record_file: Path) -> TiltSeries:
+    """Re-insert views removed by exclude_views from its restore record.
+
+    The restore record and the excluded-views stack next to it are removed
+    afterwards, as their views are back in the stacks.
+    """
+    record_file = Path(record_file)
+    with open(record_file) as file:
+        record = json.load(file)
+    nz, views = record["nz"], record["views"]
+    excluded_stack = record_file.with_suffix(".mrc")
+
+    stacks = {"stack": ts.path}
+    if "evn" in record["stacks"] and ts.is_split:
+        stacks.update({"evn": ts.evn_path, "odd": ts.odd_path})
+
+    temp_files = {}
+    with mrcfile.mmap(excluded_stack) as excluded:
+        for key, stack in stacks.items():
+            temp_files[stack] = stack.with_name(f"{stack.stem}_restoring.mrc")
+            first = record["stacks"].index(key) * len(views)
+            cut = excluded.data[first : first + len(views)]
+            cut_ext = bytes.fromhex(record["ext"][key])
+            with mrcfile.mmap(stack) as mrc:
+                ext = (
+                    mrc.extended_header.tobytes()
+                    if mrc.extended_header is not None
+                    else b""
+                )
+                size = _extended_record_size(mrc)
+                # Index of each view in the cut views (True) or the kept ones
+                order, kept = [], iter(range(mrc.data.shape[0]))
+                for z in range(nz):
+                    order.append(
+                        (True, views.index(z)) if z in views else (False, next(kept))
+                    )
+                if size:
+                    ext = b"".join(
+                        (cut_ext if is_cut else ext)[i * size : (i + 1) * size]
+                        for is_cut, i in order
+                    ).ljust(len(ext), b"\0")
+                with _stack_writer(mrc, temp_files[stack], nz, ext) as out:
+                    for is_cut, i in order:
+                        out.write(cut[i] if is_cut else mrc.data[i])
+
+    for stack, temp_file in temp_files.items():
+        os.replace(temp_file, stack)
+
+    if len(record["sections"]) > 0 and ts.mdoc is not None and ts.mdoc.is_file():
+        mdoc = mdocfile.read(ts.mdoc)
+        for z, section in zip(views, record["sections"]):
+            mdoc["sections"].insert(z, section)
+        mdocfile.write(mdoc, ts.mdoc)
+
+    excluded_stack.unlink()
+    record_file.unlink()
+    return ts
+
+
 def convert_input_to_TiltSeries(input_files: list[Path], mdoc_ok=False):
     """Takes list of input files or folders from Click.
 
@@ -1050,11 +1177,7 @@ def convert_input_to_TiltSeries(input_files: list[Path], mdoc_ok=False):
         elif input_file.is_dir():
             return_list += [
                 TiltSeries(file.with_suffix(""))
-                for file in list(
-                    set(Path(input_file).glob("*.mdoc"))
-                    - set(Path(input_file).glob("*allviews*.mdoc"))
-                    - set(Path(input_file).glob("*cutviews*.mdoc"))
-                )
+                for file in discovery.index(input_file).tiltseries_mdocs()
             ]
 
     for file in return_list:
@@ -1062,22 +1185,6 @@ def convert_input_to_TiltSeries(input_files: list[Path], mdoc_ok=False):
             print(f"Found mdoc for {file.mdoc}.")
 
         else:
-            if path.isfile(
-                file.path.with_name(f"{file.path.stem}_EVN.mrc")
-            ) and path.isfile(file.path.with_name(f"{file.path.stem}_ODD.mrc")):
-                file = file.with_split_files(
-                    file.path.with_name(f"{file.path.stem}_EVN.mrc"),
-                    file.path.with_name(f"{file.path.stem}_ODD.mrc"),
-                )
-
-            elif path.isfile(
-                file.path.with_name(f"{file.path.stem}_even.mrc")
-            ) and path.isfile(file.path.with_name(f"{file.path.stem}_odd.mrc")):
-                file = file.with_split_files(
-                    file.path.with_name(f"{file.path.stem}_even.mrc"),
-                    file.path.with_name(f"{file.path.stem}_odd.mrc"),
-                )
-
             if file.is_split:
                 print(f"Found TiltSeries {file.path} with EVN and ODD stacks.")
             else:
@@ -1,12 +1,13 @@
 import os
 import subprocess
+from collections.abc import Iterator
 from os import path
 from pathlib import Path
 
 
-import mrcfile
+import numpy as np
 
-from tomotools.utils import comfile
+from tomotools.utils import comfile, discovery, jobs, mrcheader, mrcstream, util
 from tomotools.utils.tiltseries import TiltSeries
 
 
@@ -41,22 +42,22 @@ class Tomogram:
     @property
     def angpix(self) -> float:
         """Return angpix from header."""
-        if hasattr(self, "_angpix"):
-            return self._angpix
-        with mrcfile.mmap(self.path) as mrc:
-            self._angpix = float(mrc.voxel_size.x)
-        return self._angpix
+        return mrcheader.read_header(self.path).angpix
 
     @property
-    def dimZYX(self) -> tuple[float, float, float]:
+    def dimZYX(self) -> tuple[int, int, int]:
         """Return ZYX dimensions."""
-        if hasattr(self, "_dimZYX"):
-            return self._dimZYX
-        with mrcfile.mmap(self.path) as mrc:
-            if mrc.data is None:
-                raise ValueError("No data in MRC file.")
-            self._dimZYX = mrc.data.shape
-        return self._dimZYX
+        return mrcheader.read_header(self.path).dimZYX
+
+    def iter_slabs(
+        self, slab_size: int = 16, prefetch: int = 2
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        """Iterate over the volume in z-slabs, without loading all of it.
+
+        Yields the index of the first slice and a (slab_size, y, x) array.
+        See mrcstream.iter_chunks for prefetching.
+        """
+        yield from mrcstream.iter_chunks(self.path, slab_size, prefetch)
 
     @staticmethod
     def from_tiltseries(
@@ -89,52 +90,10 @@ class Tomogram:
 
         # Perform imod WBP
         full_rec = tiltseries.path.with_name(f"{tiltseries.path.stem}_full_rec.mrc")
+        stacks = [(ali_stack, full_rec)]
 
-        subprocess.run(
-            ["tilt"]
-            + (["-FakeSIRTiterations", str(sirt)] if sirt > 0 else [])
-            + [
-                "-InputProjections",
-                ali_stack,
-                "-OutputFile",
-                full_rec,
-                "-IMAGEBINNED",
-                str(binned),
-                "-XAXISTILT",
-                str(x_axis_tilt),
-                "-TILTFILE",
-                f"{list(tiltseries.path.parent.glob('*.tlt'))[0]}",
-                "-THICKNESS",
-                str(thickness),
-                "-RADIAL",
-                "0.35,0.035",
-                "-FalloffIsTrueSigma",
-                "1",
-                "-SCALE",
-                "0.0,0.05",
-                "-PERPENDICULAR",
-                "-MODE",
-                "2",
-                "-FULLIMAGE",
-                f"{full_reconstruction_x} {full_reconstruction_y}",
-                "-SUBSETSTART",
-                "0,0",
-                "-AdjustOrigin",
-                "-ActionIfGPUFails",
-                "1,2",
-                "-OFFSET",
-                "0.0",
-                "-SHIFT",
-                f"0.0,{z_shift}",
-                "-UseGPU",
-                "0",
-            ],
-            stdout=subprocess.DEVNULL,
-        )
-
-        print(f"{tiltseries.path}: Finished reconstruction.")
-
-        if do_EVN_ODD and tiltseries.is_split:
+        split = do_EVN_ODD and tiltseries.is_split
+        if split:
             assert tiltseries.evn_path is not None and tiltseries.odd_path is not None
             full_rec_evn = tiltseries.path.with_name(
                 f"{tiltseries.path.stem}_full_rec_EVN.mrc"
@@ -142,63 +101,29 @@ class Tomogram:
             full_rec_odd = tiltseries.path.with_name(
                 f"{tiltseries.path.stem}_full_rec_ODD.mrc"
             )
+            stacks += [
+                (tiltseries.evn_path, full_rec_evn),
+                (tiltseries.odd_path, full_rec_odd),
+            ]
 
-            subprocess.run(
-                ["tilt"]
-                + (["-FakeSIRTiterations", str(sirt)] if sirt > 0 else [])
-                + [
-                    "-InputProjections",
-                    tiltseries.evn_path,
-                    "-OutputFile",
-                    full_rec_evn,
-                    "-IMAGEBINNED",
-                    str(binned),
-                    "-XAXISTILT",
-                    str(x_axis_tilt),
-                    "-TILTFILE",
-                    f"{list(tiltseries.path.parent.glob('*.tlt'))[0]}",
-                    "-THICKNESS",
-                    str(thickness),
-                    "-RADIAL",
-                    "0.35,0.035",
-                    "-FalloffIsTrueSigma",
-                    "1",
-                    "-SCALE",
-                    "0.0,0.05",
-                    "-PERPENDICULAR",
-                    "-MODE",
-                    "2",
-                    "-FULLIMAGE",
-                    f"{full_reconstruction_x} {full_reconstruction_y}",
-                    "-SUBSETSTART",
-                    "0,0",
-                    "-AdjustOrigin",
-                    "-ActionIfGPUFails",
-                    "1,2",
-                    "-OFFSET",
-                    "0.0",
-                    "-SHIFT",
-                    f"0.0,{z_shift}",
-                    "-UseGPU",
-                    "0",
-                ],
-                stdout=subprocess.DEVNULL,
-            )
+        tilt_file = f"{discovery.index(tiltseries.path.parent).of_kind('tlt')[0]}"
 
-            subprocess.run(
+        # Full and EVN/ODD reconstructions are independent, run them concurrently
+        util.run_concurrently(
+            [
                 ["tilt"]
                 + (["-FakeSIRTiterations", str(sirt)] if sirt > 0 else [])
                 + [
                     "-InputProjections",
-                    tiltseries.odd_path,
+                    stack_in,
                     "-OutputFile",
-                    full_rec_odd,
+                    rec_out,
                     "-IMAGEBINNED",
                     str(binned),
                     "-XAXISTILT",
                     str(x_axis_tilt),
                     "-TILTFILE",
-                    f"{list(tiltseries.path.parent.glob('*.tlt'))[0]}",
+                    tilt_file,
                     "-THICKNESS",
                     str(thickness),
                     "-RADIAL",
@@ -223,67 +148,36 @@ class Tomogram:
                     f"0.0,{z_shift}",
                     "-UseGPU",
                     "0",
-                ],
-                stdout=subprocess.DEVNULL,
-            )
+                ]
+                for stack_in, rec_out in stacks
+            ],
+            stdout=subprocess.DEVNULL,
+        )
 
+        print(f"{tiltseries.path}: Finished reconstruction.")
+        if split:
             print(f"{tiltseries.path}: Finished reconstruction of EVN/ODD stacks.")
 
         if trim:
             # Trim: Read in dimensions of full_rec (as YZX)
-            with mrcfile.mmap(full_rec, mode="r") as mrc:
-                full_rec_dim = mrc.data.shape
+            full_rec_dim = mrcheader.read_header(full_rec).dimZYX
 
             final_rec = tiltseries.path.with_name(
                 f"{tiltseries.path.stem}_rec_bin_{binned}.mrc"
             )
+            recs = [(full_rec, final_rec)]
 
-            tr = subprocess.run(
-                [
-                    "trimvol",
-                    "-x",
-                    f"1,{full_rec_dim[2]}",
-                    "-y",
-                    f"1,{full_rec_dim[0]}",
-                    "-z",
-                    f"1,{full_rec_dim[1]}",
-                    "-f",
-                    "-rx",
-                ]
-                + (
-                    [
-                        "-sx",
-                        f"1,{full_rec_dim[2]}",
-                        "-sy",
-                        f"1,{full_rec_dim[0]}",
-                        "-sz",
-                        f"{int(full_rec_dim[1]) / 3:.0f},{int(full_rec_dim[1]) * 2 / 3:.0f}",  # noqa: E501
-                    ]
-                    if convert_to_byte
-                    else []
-                )
-                + [full_rec, final_rec],
-                stdout=subprocess.DEVNULL,
-            )
-
-            if tr.returncode != 0:
-                print(f"{tiltseries.path}: Trimming failed, keeping full_rec file.")
-                if do_EVN_ODD and tiltseries.is_split:
-                    return Tomogram(full_rec).with_split_files(
-                        full_rec_evn, full_rec_odd
-                    )
-                else:
-                    return Tomogram(full_rec)
-
-            if do_EVN_ODD and tiltseries.is_split:
+            if split:
                 final_rec_evn = tiltseries.path.with_name(
                     f"{tiltseries.path.stem}_rec_bin_{binned}_EVN.mrc"
                 )
                 final_rec_odd = tiltseries.path.with_name(
                     f"{tiltseries.path.stem}_rec_bin_{binned}_ODD.mrc"
                 )
+                recs += [(full_rec_evn, final_rec_evn), (full_rec_odd, final_rec_odd)]
 
-                subprocess.run(
+            trims = util.run_concurrently(
+                [
                     [
                         "trimvol",
                         "-x",
@@ -307,49 +201,32 @@ class Tomogram:
                         if convert_to_byte
                         else []
                     )
-                    + [full_rec_evn, final_rec_evn],
-                    stdout=subprocess.DEVNULL,
-                )
+                    + [rec_in, rec_out]
+                    for rec_in, rec_out in recs
+                ],
+                check=False,
+                stdout=subprocess.DEVNULL,
+            )
 
-                subprocess.run(
-                    [
-                        "trimvol",
-                        "-x",
-                        f"1,{full_rec_dim[2]}",
-                        "-y",
-                        f"1,{full_rec_dim[0]}",
-                        "-z",
-                        f"1,{full_rec_dim[1]}",
-                        "-f",
-                        "-rx",
-                    ]
-                    + (
-                        [
-                            "-sx",
-                            f"1,{full_rec_dim[2]}",
-                            "-sy",
-                            f"1,{full_rec_dim[0]}",
-                            "-sz",
-                            f"{int(full_rec_dim[1]) / 3:.0f},{int(full_rec_dim[1]) * 2 / 3:.0f}",  # noqa: E501
-                        ]
-                        if convert_to_byte
-                        else []
+            if any(tr.returncode != 0 for tr in trims):
+                print(f"{tiltseries.path}: Trimming failed, keeping full_rec file.")
+                for _, rec_out in recs:
+                    rec_out.unlink(missing_ok=True)
+                if split:
+                    return Tomogram(full_rec).with_split_files(
+                        full_rec_evn, full_rec_odd
                     )
-                    + [full_rec_odd, final_rec_odd],
-                    stdout=subprocess.DEVNULL,
-                )
-
-                print(f"{tiltseries.path}: Finished trimming.")
+                else:
+                    return Tomogram(full_rec)
 
-                os.remove(full_rec)
-                os.remove(full_rec_evn)
-                os.remove(full_rec_odd)
+            print(f"{tiltseries.path}: Finished trimming.")
+            for rec_in, _ in recs:
+                os.remove(rec_in)
 
+            if split:
                 return Tomogram(final_rec).with_split_files(
                     final_rec_evn, final_rec_odd
                 )
-
-            os.remove(full_rec)
             return Tomogram(final_rec)
 
         return Tomogram(full_rec)
@@ -391,7 +268,7 @@ class Tomogram:
         print(f"Fixed tilt.com file for {tiltseries.path.parent.name}.")
 
         # Set up files
-        subprocess.run(
+        jobs.run(
             ["ctf3dsetup", "-th", str(z_slices_nm), "-pa", "tilt"],
             cwd=tiltseries.path.parent,
         )
@@ -399,7 +276,7 @@ class Tomogram:
         print(f"Reconstructing {tiltseries.path.parent.name} with ctf3d.")
 
         # Perform actual reconstruction
-        subprocess.run(
+        jobs.run(
             ["processchunks", "localhost", "ctf3d"],
             cwd=tiltseries.path.parent,
             stdout=subprocess.DEVNULL,
@@ -411,7 +288,7 @@ class Tomogram:
         tiltseries.delete_files(False)
 
         # Rotate tomogram to default
-        subprocess.run(
+        jobs.run(
             [
                 "clip",
                 "rotx",
@@ -442,18 +319,16 @@ def find_Tomogram_halves(tomo: Tomogram, split_dir: Path | None = None):
         parent_dir = split_dir
 
     # Generate plausible filenames either after MotionCor2 or imod notation:
-    EVN_file = parent_dir / f"{tomo.path.stem}_EVN.mrc"
-    ODD_file = parent_dir / f"{tomo.path.stem}_ODD.mrc"
-
-    even_file = parent_dir / f"{tomo.path.stem[:-3]}even_rec.mrc"
-    odd_file = parent_dir / f"{tomo.path.stem[:-3]}odd_rec.mrc"
-
-    if path.isfile(EVN_file) and path.isfile(ODD_file):
-        return tomo.with_split_files(EVN_file, ODD_file)
-    elif path.isfile(even_file) and path.isfile(odd_file):
-        return tomo.with_split_files(even_file, odd_file)
-    else:
-        return tomo
+    directory = discovery.index(parent_dir)
+    for evn_name, odd_name in [
+        (f"{tomo.path.stem}_EVN.mrc", f"{tomo.path.stem}_ODD.mrc"),
+        (f"{tomo.path.stem[:-3]}even_rec.mrc", f"{tomo.path.stem[:-3]}odd_rec.mrc"),
+    ]:
+        if evn_name in directory and odd_name in directory:
+            return tomo.with_split_files(
+                directory.get(evn_name), directory.get(odd_name)
+            )
+    return tomo
 
 
 def convert_input_to_Tomogram(input_files: list[Path]):
@@ -468,18 +343,9 @@ def convert_input_to_Tomogram(input_files: list[Path]):
         if input_file.is_file():
             input_tomo.append(Tomogram(Path(input_file)))
         elif input_file.is_dir():
-            input_tomo += [
-                Tomogram(file) for file in input_file.glob("*_rec_bin_[0-9]*.mrc")
-            ]
             # Do not include full_rec, even_rec and odd_rec
             input_tomo += [
-                Tomogram(file)
-                for file in list(
-                    set(input_file.glob("*_rec.mrc"))
-                    - set(input_file.glob("*even_rec.mrc"))
-                    - set(input_file.glob("*_odd_rec.mrc"))
-                    - set(input_file.glob("*_full_rec.mrc"))
-                )
+                Tomogram(file) for file in discovery.index(input_file).reconstructions()
             ]
 
     for tomo in input_tomo:
@@ -1,5 +1,7 @@
 import subprocess
 
+from tomotools.utils import gpus, jobs
+
 
 def _list_append_replace(input_list: list, index: int, item):
     if 0 <= index < len(input_list):
@@ -12,15 +14,31 @@ def _list_append_replace(input_list: list, index: int, item):
         raise IndexError("Can only replace items and append one item, not multiple")
 
 
-def num_gpus():
-    """Return number of GPUs in system."""
-    name = subprocess.Popen(
-        ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
-        stdout=subprocess.PIPE,
-    )
-    num = subprocess.check_output(["wc", "-l"], stdin=name.stdout)
-    name.wait()
-    return int(num)
+def cpu_budget() -> int:
+    """Return number of CPUs tomotools may use, see jobs.cpu_budget."""
+    return jobs.cpu_budget()
+
+
+def run_concurrently(
+    commands: list[list], cpus: int | None = None, check: bool = True, **kwargs
+) -> list[subprocess.CompletedProcess]:
+    """Run independent commands at the same time, within a CPU budget.
+
+    At most cpus (default: cpu_budget()) commands run at once, fewer if the
+    workers of the default job runner are busy. The budget is split between
+    them via OMP_NUM_THREADS and IMOD_PROCESSORS.
+    Further kwargs are passed to subprocess.run.
+
+    If check is True, raise CalledProcessError once all commands are finished,
+    if any of them failed. Commands are run, logged and timed by the default
+    job runner, see jobs.JobRunner.run_all.
+    """
+    return jobs.run_all(commands, cpus=cpus, check=check, **kwargs)
+
+
+def num_gpus() -> int:
+    """Return number of GPUs in system, see gpus.inventory."""
+    return len(gpus.inventory())
 
 
 def gpuinfo():